@@ -0,0 +1,370 @@
+#!/usr/bin/python
+import argparse
+import contextlib
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from calibration import Calibration
+from fit_session import FitSession
+from fit_peaks import (
+    peak_model, load_intensity, fit_window, params_row, add_wavelengths,
+    fitted_params_header,
+)
+
+
+def find_windows(I, peak_pix, window_scale=3, max_width=99):
+    """
+    Choose left and right pixel limits for each peak without a person
+    clicking on them.
+
+    Args:
+        I: array, intensity indexed by pixel number
+        peak_pix: array, approximate pixel of each peak from
+            find_spectrum_peaks
+        window_scale: float, half width of the window in units of the peak
+            full width at half maximum
+        max_width: int, widest window allowed, the GUI only fits ranges
+            less than 100 pixels wide
+    Returns:
+        Arrays of left and right limits, used as I[left:right].
+    """
+    from scipy.signal import peak_widths
+    if peak_pix.size == 0:
+        return peak_pix.copy(), peak_pix.copy()
+    # Full width at half maximum of each peak
+    widths = peak_widths(I, peak_pix, rel_height=0.5)[0]
+    # Need a few points either side of the center to fit 4 parameters
+    half = np.clip(np.ceil(window_scale * widths), 3, max_width // 2)
+    left = peak_pix - half.astype(int)
+    right = peak_pix + half.astype(int) + 1
+    # Don't run into neighbouring peaks, stop halfway between them
+    midpoints = (peak_pix[:-1] + peak_pix[1:]) // 2
+    left[1:] = np.maximum(left[1:], midpoints + 1)
+    right[:-1] = np.minimum(right[:-1], midpoints + 1)
+    return np.clip(left, 0, I.size), np.clip(right, 0, I.size)
+
+
+def find_spectrum_peaks(I, height=None, window_scale=3, snr=5, peak_pix=None):
+    """
+    Approximate center and window limits of every peak in a spectrum.
+
+    Args:
+        I: array, intensity indexed by pixel number
+        height: float, fixed minimum height of a peak passed to find_peaks,
+            None to find peaks that stand out from the noise with
+            peak_detect.detect
+        window_scale: float, see find_windows
+        snr: float, see peak_detect.detect
+        peak_pix: array of peaks already found, e.g. by detecting a whole
+            stack of spectra at once, only their windows are found
+    """
+    if peak_pix is None:
+        if height is None:
+            import peak_detect
+            peak_pix = peak_detect.detect(I, snr)
+        else:
+            from scipy.signal import find_peaks
+            peak_pix = find_peaks(I, height)[0]
+    left, right = find_windows(I, peak_pix, window_scale)
+    return peak_pix, left, right
+
+
+def _open_session(spectrum_path, I, session):
+    if session is None:
+        return None
+    # True for the default session file next to the spectrum
+    session_path = None if session is True else session
+    return FitSession.for_spectrum(spectrum_path, I, session_path)
+
+
+def _restore(session, peak_pix, left, right):
+    """Saved fits of unchanged windows, and which peaks need fitting"""
+    if session is None:
+        return (np.full((peak_pix.size, 8), np.nan),
+                np.ones(peak_pix.size, dtype=bool))
+    return session.restore(peak_pix, left, right)
+
+
+def _save(session, peak_pix, left, right, fitted_params, fitted):
+    """Save new fits to the session, leaving failed fits to be retried"""
+    if session is None:
+        return
+    keep = fitted & np.isfinite(fitted_params[:, 0])
+    session.save_fits(
+        peak_pix[keep], left[keep], right[keep], fitted_params[keep]
+    )
+
+
+def fit_spectrum(spectrum_path, height=None, window_scale=3, session=None,
+                 snr=5):
+    """
+    Fit every peak of a spectrum with a separate lmfit fit per peak.
+
+    Args:
+        spectrum_path: str, path to SpectraSuite tab separated value file
+        height, snr: see find_spectrum_peaks
+        window_scale: float, see find_windows
+        session: str path of a fit session, or True for the default one
+            next to the spectrum, peaks whose window is the same as one
+            saved there aren't fitted again, and new fits are saved to it
+    Returns:
+        Array of fitted parameters for each peak, with the same columns as
+        SpectrumFitter saves except the wavelengths, nan for any peak whose
+        fit raised an error.
+    """
+    I = load_intensity(spectrum_path)
+    peak_pix, left, right = find_spectrum_peaks(I, height, window_scale, snr)
+    session = _open_session(spectrum_path, I, session)
+    with session or contextlib.nullcontext():
+        fitted_params, needs_fit = _restore(session, peak_pix, left, right)
+        for i in np.flatnonzero(needs_fit):
+            try:
+                result = fit_window(
+                    peak_model(), I, left[i], right[i], peak_pix[i]
+                )
+            except Exception as e:
+                # One bad window shouldn't lose the rest, it's left as nan
+                print(f'{spectrum_path}: fit of peak {i} failed, {e!r}',
+                      file=sys.stderr)
+                continue
+            fitted_params[i] = params_row(result)
+        _save(session, peak_pix, left, right, fitted_params, needs_fit)
+    return fitted_params
+
+
+def fit_spectra_vectorized(spectrum_paths, height=None, window_scale=3,
+                           session=None, snr=5):
+    """
+    Fit every peak of several spectra together with voigt_lm, which gives
+    the same parameters as fit_spectrum without an lmfit call per peak.
+    """
+    import peak_detect
+    import voigt_lm
+    intensities = [load_intensity(path) for path in spectrum_paths]
+    # Spectra from the same detector are searched for peaks in one go
+    stack_peaks = [None] * len(intensities)
+    if (height is None and intensities
+            and len({I.size for I in intensities}) == 1):
+        stack_peaks = peak_detect.detect(np.stack(intensities), snr)
+    spectra, lefts, rights, centers = [], [], [], []
+    found, sessions, all_fitted_params, all_needs_fit = [], [], [], []
+    # Every session opened is closed, even if a later spectrum fails
+    with contextlib.ExitStack() as open_sessions:
+        for path, I, peak_pix in zip(spectrum_paths, intensities,
+                                     stack_peaks):
+            peak_pix, left, right = find_spectrum_peaks(
+                I, height, window_scale, snr, peak_pix
+            )
+            spectrum_session = _open_session(path, I, session)
+            if spectrum_session is not None:
+                open_sessions.enter_context(spectrum_session)
+            fitted_params, needs_fit = _restore(
+                spectrum_session, peak_pix, left, right
+            )
+            found.append((peak_pix, left, right))
+            sessions.append(spectrum_session)
+            all_fitted_params.append(fitted_params)
+            all_needs_fit.append(needs_fit)
+            # Only fit the windows that weren't restored
+            spectra.append(I)
+            lefts.append(left[needs_fit])
+            rights.append(right[needs_fit])
+            centers.append(peak_pix[needs_fit])
+        new_fits = voigt_lm.fit_windows(spectra, lefts, rights, centers)
+        for i, (peak_pix, left, right) in enumerate(found):
+            all_fitted_params[i][all_needs_fit[i]] = new_fits[i]
+            _save(sessions[i], peak_pix, left, right,
+                  all_fitted_params[i], all_needs_fit[i])
+    return all_fitted_params
+
+
+def _fit_chunk(args):
+    spectrum_paths, height, window_scale, backend, session, snr = args
+    if backend == 'lm' and len(spectrum_paths) > 1:
+        try:
+            return fit_spectra_vectorized(spectrum_paths, height,
+                                          window_scale, session, snr)
+        except Exception:
+            # Fit them one at a time to find the spectra at fault
+            pass
+    all_fitted_params = []
+    for path in spectrum_paths:
+        try:
+            if backend == 'lmfit':
+                fitted_params = fit_spectrum(path, height, window_scale,
+                                             session, snr)
+            else:
+                fitted_params = fit_spectra_vectorized(
+                    [path], height, window_scale, session, snr
+                )[0]
+        except Exception as e:
+            # Kept apart from the peaks that failed, see failed_spectra
+            print(f'{path}: could not be fitted, {e!r}', file=sys.stderr)
+            fitted_params = None
+        all_fitted_params.append(fitted_params)
+    return all_fitted_params
+
+
+def fit_spectra(spectrum_paths, height=None, window_scale=3, workers=None,
+                backend='lm', chunksize=16, session=None, snr=5):
+    """
+    Fit every peak of every spectrum, spread over a pool of processes.
+
+    Args:
+        spectrum_paths: list of str, paths to SpectraSuite files
+        height, window_scale, snr: see fit_spectrum
+        workers: int, number of processes, defaults to the number of cores
+        backend: 'lm' to fit all the peaks of a chunk of spectra at once
+            with voigt_lm, or 'lmfit' for one lmfit fit per peak
+        chunksize: int, number of spectra given to a process at a time
+        session: see fit_spectrum
+    Returns:
+        List of fitted parameter arrays, one per spectrum in order, without
+        the wavelength columns. Peaks that couldn't be fitted are nan, see
+        failed_peaks, and spectra that couldn't be fitted at all are None,
+        see failed_spectra.
+    """
+    if workers is None:
+        workers = os.cpu_count()
+    # Don't leave processes idle when there are only a few files
+    chunksize = max(1, min(chunksize, len(spectrum_paths) // workers))
+    jobs = [
+        (spectrum_paths[i:i + chunksize], height, window_scale, backend,
+         session, snr)
+        for i in range(0, len(spectrum_paths), chunksize)
+    ]
+    if workers == 1:
+        chunks = map(_fit_chunk, jobs)
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            chunks = list(pool.map(_fit_chunk, jobs))
+    return [params for chunk in chunks for params in chunk]
+
+
+def failed_peaks(spectrum_paths, all_fitted_params):
+    """
+    Peaks left as nan by fit_spectra.
+
+    Returns:
+        List of each spectrum with any, and the index of each of them.
+    """
+    return [
+        (path, np.flatnonzero(np.isnan(fitted_params[:, 0])))
+        for path, fitted_params in zip(spectrum_paths, all_fitted_params)
+        if fitted_params is not None and np.isnan(fitted_params[:, 0]).any()
+    ]
+
+
+def failed_spectra(spectrum_paths, all_fitted_params):
+    """Spectra fit_spectra couldn't fit at all, left out of the table"""
+    return [
+        path
+        for path, fitted_params in zip(spectrum_paths, all_fitted_params)
+        if fitted_params is None
+    ]
+
+
+def save_table(fitted_params_path, spectrum_paths, all_fitted_params,
+               calibration=None):
+    """
+    Save the fitted parameters of every spectrum to one table, working out
+    the wavelengths of every peak of every spectrum in one go. Spectra
+    whose fitted parameters are None aren't saved.
+    """
+    fitted = [
+        (path, p) for path, p in zip(spectrum_paths, all_fitted_params)
+        if p is not None
+    ]
+    spectrum_paths = [path for path, _ in fitted]
+    all_fitted_params = [p for _, p in fitted]
+    names = np.repeat(spectrum_paths, [len(p) for p in all_fitted_params])
+    peaks = np.concatenate(
+        [np.arange(len(p)) for p in all_fitted_params] + [np.empty(0, int)]
+    )
+    fitted_params = np.zeros((names.size, 10))
+    if names.size:
+        fitted_params[:, :8] = np.concatenate(all_fitted_params)
+    add_wavelengths(fitted_params, calibration)
+    table = np.empty((names.size, 12), dtype=object)
+    table[:, 0] = names
+    table[:, 1] = peaks
+    table[:, 2:] = fitted_params
+    np.savetxt(
+        fitted_params_path,
+        table,
+        fmt=['%s', '%d'] + ['%.18e'] * 10,
+        header='spectrum peak ' + fitted_params_header,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Fit every peak of many SpectraSuite files without the GUI'
+    )
+    parser.add_argument('fitted_params_path',
+                        help='location to save the combined table to')
+    parser.add_argument('spectrum_paths', nargs='+')
+    parser.add_argument('--height', type=float, default=None,
+                        help='fixed minimum peak height passed to find_peaks, '
+                             'instead of finding peaks by signal to noise')
+    parser.add_argument('--snr', type=float, default=5,
+                        help='smallest height and prominence of a peak above '
+                             'the baseline, in units of the noise')
+    parser.add_argument('--window-scale', type=float, default=3,
+                        help='half width of fit window in FWHMs of the peak')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of processes, defaults to all cores')
+    parser.add_argument('--backend', choices=('lm', 'lmfit'), default='lm',
+                        help='vectorized fitter, or one lmfit fit per peak')
+    parser.add_argument('--calibration', default=None,
+                        help='pixel to wavelength calibration file')
+    parser.add_argument('--session', nargs='?', const=True, default=None,
+                        help='keep fits in a session file, only fitting '
+                             'windows that changed since the last run, '
+                             'defaults to the session next to each spectrum')
+    args = parser.parse_args(argv)
+
+    all_fitted_params = fit_spectra(
+        args.spectrum_paths, args.height, args.window_scale, args.workers,
+        args.backend, session=args.session, snr=args.snr,
+    )
+    if args.calibration is not None:
+        calibration = Calibration.load(args.calibration)
+    else:
+        calibration = None
+    save_table(
+        args.fitted_params_path, args.spectrum_paths, all_fitted_params,
+        calibration,
+    )
+    num_peaks = sum(len(p) for p in all_fitted_params if p is not None)
+    not_fitted = failed_spectra(args.spectrum_paths, all_fitted_params)
+    print(
+        f'Saved {num_peaks} peaks from '
+        f'{len(args.spectrum_paths) - len(not_fitted)} spectra '
+        f'to {args.fitted_params_path}'
+    )
+    failed = failed_peaks(args.spectrum_paths, all_fitted_params)
+    if failed:
+        print(
+            f'{sum(len(peaks) for _, peaks in failed)} peaks in '
+            f'{len(failed)} spectra could not be fitted and are saved as nan:',
+            file=sys.stderr,
+        )
+        for path, peaks in failed:
+            print(f'  {path}: peaks {", ".join(map(str, peaks))}',
+                  file=sys.stderr)
+    if not_fitted:
+        print(
+            f'{len(not_fitted)} spectra could not be fitted at all and are '
+            f'not in the table:',
+            file=sys.stderr,
+        )
+        for path in not_fitted:
+            print(f'  {path}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+#!/usr/bin/python
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# uncertain_array.py is shared by each week, in the folder above
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             os.pardir))
+from uncertain_array import UArray
+from plot_render import FigureSpec, render
+
+
+def load_drop(path):
+    """
+    Height of the drop in each frame, and its error if the two lengths
+    measured are taken as the range it's in.
+
+    Args:
+        path: str, file with columns of Lmin and Lmax for each frame
+    Returns:
+        Arrays of height and half the spread of the lengths.
+    """
+    lengths = np.loadtxt(path, unpack=True, ndmin=2)
+    return (lengths[0] + lengths[1]) / 2, np.abs(lengths[1] - lengths[0]) / 2
+
+
+def drop_name(path):
+    """Name of the drop saved in the output table, and its gas"""
+    name = str(path).removeprefix(r'.\Parabolas\air')
+    parts = os.path.basename(name).split('_')
+    gas = parts[1] if len(parts) > 1 else parts[0]
+    return name, gas
+
+
+def fit_quadratics(ys, sigmas=None):
+    """
+    Fit y = a x^2 + b x + c, x the frame number, to every drop at once by
+    solving the weighted least squares normal equations directly.
+
+    Drops of different lengths are padded with points of zero weight. The
+    covariance is the inverse of the normal matrix scaled by the reduced
+    chi-square, as lmfit does, so with sigmas=None this gives the same
+    parameters and errors as QuadraticModel().fit.
+
+    A drop with any sigma that's zero, which would get an infinite weight
+    and turn its whole fit to nan, is fitted with equal weights instead.
+    A drop that can't be fitted, with fewer than 3 frames or a singular
+    normal matrix, gets nan parameters and covariance rather than
+    stopping the rest.
+
+    Args:
+        ys: list of arrays, heights of each drop
+        sigmas: list of arrays, std dev of each height, or None
+    Returns:
+        Arrays (num_drops, 3) of a, b, c and (num_drops, 3, 3) of their
+        covariance.
+    """
+    num = max((len(y) for y in ys), default=0)
+    y = np.zeros((len(ys), num))
+    weights = np.zeros((len(ys), num))
+    for i, drop in enumerate(ys):
+        y[i, :len(drop)] = drop
+        sigma = None if sigmas is None else np.asarray(sigmas[i], dtype=float)
+        if sigma is None or not np.all(sigma > 0):
+            weights[i, :len(drop)] = 1
+        else:
+            weights[i, :len(drop)] = 1 / sigma**2
+    x = np.arange(num, dtype=float)
+    X = np.column_stack((x**2, x, np.ones(num)))
+    normal = np.einsum('mn,ni,nj->mij', weights, X, X)
+    rhs = np.einsum('mn,ni,mn->mi', weights, X, y)
+    num_points = np.count_nonzero(weights, axis=1)
+    # only solve the drops that can be, one bad one would stop them all
+    good = num_points >= 3
+    good[good] = np.linalg.cond(normal[good]) < 1 / np.finfo(float).eps
+    params = np.full((len(ys), 3), np.nan)
+    covar = np.full((len(ys), 3, 3), np.nan)
+    params[good] = np.linalg.solve(normal[good], rhs[good, :, None])[..., 0]
+    residuals = y[good] - params[good] @ X.T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        redchi = (np.sum(weights[good] * residuals**2, axis=1)
+                  / (num_points[good] - 3))
+    covar[good] = np.linalg.inv(normal[good]) * redchi[:, None, None]
+    return params, covar
+
+
+def max_drop(params, covar):
+    """
+    Turning point of each parabola, with errors from the full covariance
+    of the fitted parameters.
+
+    Returns:
+        UArrays of xmax and ymax.
+    """
+    ua, ub, uc = UArray.correlated(params, covar)
+    xmax = -ub/(2*ua)
+    ymax = ua*(xmax**2)+ub*(xmax)+uc
+    return xmax, ymax
+
+
+def _fit_chunk(args):
+    paths, weighted = args
+    drops = [load_drop(path) for path in paths]
+    ys = [y for y, spread in drops]
+    sigmas = [spread for y, spread in drops] if weighted else None
+    params, covar = fit_quadratics(ys, sigmas)
+    return ys, params, covar
+
+
+def fit_drops(paths, weighted=False, workers=None, chunksize=64):
+    """
+    Load and fit every drop, spread over a pool of processes.
+
+    Args:
+        paths: list of str, drop files
+        weighted: bool, weight each frame by the spread of its two lengths
+        workers: int, number of processes, defaults to the number of cores
+        chunksize: int, number of files given to a process at a time
+    Returns:
+        List of the heights of each drop, and arrays of the fitted
+        parameters and their covariance, see fit_quadratics.
+    """
+    if workers is None:
+        workers = os.cpu_count()
+    # Don't leave processes idle when there are only a few files
+    chunksize = max(1, min(chunksize, len(paths) // workers))
+    jobs = [
+        (paths[i:i + chunksize], weighted)
+        for i in range(0, len(paths), chunksize)
+    ]
+    if workers == 1:
+        chunks = list(map(_fit_chunk, jobs))
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            chunks = list(pool.map(_fit_chunk, jobs))
+    ys = [y for chunk in chunks for y in chunk[0]]
+    params = np.concatenate([c[1] for c in chunks] + [np.empty((0, 3))])
+    covar = np.concatenate([c[2] for c in chunks] + [np.empty((0, 3, 3))])
+    return ys, params, covar
+
+
+def drop_figure(figure_path, gas, drop, y, params, xmax, ymax):
+    """
+    Spec of the figure parabola_fit.py shows for one drop.
+
+    Args:
+        figure_path: str, where to save it
+        gas: str, label of the drop
+        drop: int, number of the drop
+        y: array, height in each frame
+        params: array, fitted a, b, c
+        xmax, ymax: (float, float), turning point and its error
+    """
+    spec = FigureSpec(figure_path, figsize=(3.5,4),
+                      savefig_kw={'bbox_inches': 'tight'})
+    spec.ax.set_xlabel('Frame No.')
+    spec.ax.set_ylabel('Height (cm)')
+    x = np.arange(0,len(y))
+    xspace = np.linspace(0,len(y),100)
+    yspace = np.polyval(params, xspace)
+    points, = spec.ax.plot(x,y,'o',color='C0')
+    line, = spec.ax.plot(xspace, yspace,'-',color='C0')
+    Lmaxhack, = spec.ax.plot(xmax[0], ymax[0], 'x', color='C0')
+    spec.ax.errorbar(xmax[0], ymax[0], xerr=xmax[1], yerr=ymax[1], fmt='x', color='C0')
+    spec.ax.legend([(points,line),Lmaxhack],[f'{gas}: drop {drop}',f'$L$={ymax[0]:.2f} cm $\\pm${ymax[1]:.2f} cm'])
+    return spec
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Fit the parabola of many drops without showing each one'
+    )
+    parser.add_argument('paths', nargs='+', help='drop files of Lmin Lmax')
+    parser.add_argument('--output', default='output.txt',
+                        help='table of the maximum drop of each file')
+    parser.add_argument('--weighted', action='store_true',
+                        help='weight frames by the spread of their lengths')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of processes, defaults to all cores')
+    parser.add_argument('--plots', default=None,
+                        help='folder to save a figure of each drop to, after '
+                             'the table is saved, only changed ones are redrawn')
+    parser.add_argument('--plot-format', default='png',
+                        help='e.g. png, or pgf for LaTeX')
+    args = parser.parse_args(argv)
+
+    ys, params, covar = fit_drops(args.paths, args.weighted, args.workers)
+    xmax, ymax = max_drop(params, covar)
+    names = [drop_name(path) for path in args.paths]
+    # same format as parabola_fit.py, path then L as value+/-error
+    output = np.column_stack((
+        [name for name, gas in names],
+        [str(L) for L in ymax.to_ufloats()],
+    ))
+    np.savetxt(args.output, output, fmt='%s')
+    print(f'Saved the maximum drop of {len(args.paths)} files to {args.output}')
+
+    if args.plots is None:
+        return
+    os.makedirs(args.plots, exist_ok=True)
+    specs = [
+        drop_figure(
+            os.path.join(args.plots, f'{gas}{i + 1}parabola.{args.plot_format}'),
+            gas, i + 1, ys[i], params[i],
+            (xmax.value[i], xmax.std[i]), (ymax.value[i], ymax.std[i]),
+        )
+        for i, (name, gas) in enumerate(names)
+    ]
+    # figures already saved from the same data aren't drawn again
+    saved = render(specs, args.workers)
+    print(f'Saved {len(saved)} figures to {args.plots}, '
+          f'{len(specs) - len(saved)} were up to date')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/python
+import argparse
+import json
+
+import numpy as np
+
+# Written into calibration files, bump if the format changes
+calibration_format = 'pixel-wavelength-calibration'
+calibration_version = 1
+
+
+def _polynomial_coefs(result):
+    """
+    Coefficients (lowest order first) and covariance of a fitted lmfit
+    PolynomialModel, QuadraticModel or LinearModel.
+    """
+    names = {
+        'slope': 1, 'intercept': 0,  # LinearModel
+        'a': 2, 'b': 1, 'c': 0,  # QuadraticModel
+    }
+    names.update({f'c{i}': i for i in range(8)})  # PolynomialModel
+    order = [names[name] for name in result.var_names]
+    coefs = np.zeros(max(order) + 1)
+    covar = np.zeros((coefs.size, coefs.size))
+    for i, name in zip(order, result.var_names):
+        coefs[i] = result.params[name].value
+    if result.covar is not None:
+        covar[np.ix_(order, order)] = result.covar
+    else:
+        covar[:] = np.nan
+    return coefs, covar
+
+
+class Calibration:
+    """
+    Polynomial pixel to wavelength calibration with its covariance.
+
+    Wavelengths, their derivative and the variance from the fit parameters
+    are tabulated every lut_step pixels when it's created, so converting
+    pixel numbers is a linear interpolation however many there are.
+    """
+
+    def __init__(self, coefs, covar, pix_range, lut_step=0.125):
+        """
+        Args:
+            coefs: array, polynomial coefficients, lowest order first
+            covar: array, covariance matrix of coefs
+            pix_range: (float, float), pixel range the calibration is for
+            lut_step: float, spacing of the lookup table in pixels
+        """
+        self.coefs = np.asarray(coefs, dtype=float)
+        self.covar = np.asarray(covar, dtype=float)
+        self.pix_range = (float(pix_range[0]), float(pix_range[1]))
+        self.lut_step = lut_step
+        poly = np.polynomial.Polynomial(self.coefs)
+        num = int(np.ceil((self.pix_range[1] - self.pix_range[0]) / lut_step))
+        self.lut_pix = self.pix_range[0] + lut_step * np.arange(num + 1)
+        self.lut_wavelength = poly(self.lut_pix)
+        self.lut_slope = poly.deriv()(self.lut_pix)
+        # Variance from the fit parameters is v^T C v, v = (1, x, x^2...)
+        v = np.vander(self.lut_pix, self.coefs.size, increasing=True)
+        self.lut_variance = np.einsum('ni,ij,nj->n', v, self.covar, v)
+        # Worst case error of linear interpolation, h^2/8 max|f''|
+        self.lut_error = lut_step**2 / 8 * np.max(
+            np.abs(poly.deriv(2)(self.lut_pix)), initial=0
+        )
+
+    @classmethod
+    def from_result(cls, result, pix_range, **kwargs):
+        """Calibration from a fitted lmfit polynomial ModelResult"""
+        coefs, covar = _polynomial_coefs(result)
+        return cls(coefs, covar, pix_range, **kwargs)
+
+    @classmethod
+    def fit(cls, pix, wavelength, degree=2, pix_range=None, **kwargs):
+        """
+        Fit a polynomial of wavelength against pixel number.
+
+        Args:
+            pix: array, fitted pixel centers of reference lines
+            wavelength: array, known wavelengths of those lines in nm
+            degree: int, degree of the polynomial
+            pix_range: (float, float), defaults to the range of pix
+        """
+        from lmfit.models import PolynomialModel
+        model = PolynomialModel(degree)
+        params = model.guess(wavelength, x=pix)
+        result = model.fit(wavelength, params, x=pix)
+        if pix_range is None:
+            pix_range = (np.min(pix), np.max(pix))
+        return cls.from_result(result, pix_range, **kwargs), result
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({
+                'format': calibration_format,
+                'version': calibration_version,
+                'model': 'polynomial',
+                'coefs': self.coefs.tolist(),
+                'covar': self.covar.tolist(),
+                'pix_range': self.pix_range,
+            }, f, indent=1)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        with open(path) as f:
+            saved = json.load(f)
+        if saved.get('format') != calibration_format:
+            raise ValueError(f'{path} is not a wavelength calibration')
+        if saved.get('version') != calibration_version:
+            raise ValueError(
+                f'{path} is calibration version {saved.get("version")}, '
+                f'expected {calibration_version}'
+            )
+        return cls(saved['coefs'], saved['covar'], saved['pix_range'],
+                   **kwargs)
+
+    def wavelength(self, pix, pix_err=None):
+        """
+        Convert pixel numbers to wavelengths.
+
+        Args:
+            pix: array, pixel numbers
+            pix_err: array, standard error of pix
+        Returns:
+            Arrays of wavelength and its standard error in nm, including
+            the uncertainty of the calibration itself.
+        """
+        shape = np.shape(pix)
+        pix = np.asarray(pix, dtype=float).reshape(-1)
+        # The table is evenly spaced, so find the interval directly rather
+        # than searching for it like np.interp
+        pos = (pix - self.lut_pix[0]) / self.lut_step
+        # nan pixels (failed fits) stay nan through frac
+        i = np.clip(np.nan_to_num(np.floor(pos)), 0, self.lut_pix.size - 2)
+        frac = pos - i
+        i = i.astype(np.intp)
+
+        def interp(table):
+            return table[i] + frac * (table[i + 1] - table[i])
+
+        wavelength = interp(self.lut_wavelength)
+        variance = interp(self.lut_variance)
+        slope = interp(self.lut_slope)
+        # The table doesn't extrapolate, work those out exactly
+        outside = (pix < self.lut_pix[0]) | (pix > self.lut_pix[-1])
+        if np.any(outside):
+            poly = np.polynomial.Polynomial(self.coefs)
+            v = np.vander(pix[outside], self.coefs.size, increasing=True)
+            wavelength[outside] = poly(pix[outside])
+            slope[outside] = poly.deriv()(pix[outside])
+            variance[outside] = np.einsum('ni,ij,nj->n', v, self.covar, v)
+        if pix_err is not None:
+            pix_err = np.broadcast_to(pix_err, shape).reshape(-1)
+            variance += (slope * pix_err)**2
+        return wavelength.reshape(shape), np.sqrt(variance).reshape(shape)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Fit a pixel to wavelength calibration to reference lines'
+    )
+    parser.add_argument('fitted_params_path',
+                        help='table saved by fit_peaks.py of the lines')
+    parser.add_argument('wavelengths_path',
+                        help='known wavelength (nm) of each line, in order')
+    parser.add_argument('calibration_path', help='where to save calibration')
+    parser.add_argument('--degree', type=int, default=2)
+    parser.add_argument('--num-pixels', type=int, default=3648,
+                        help='number of pixels on the detector')
+    args = parser.parse_args(argv)
+
+    # First column is the fitted center
+    pix = np.loadtxt(args.fitted_params_path, usecols=0, ndmin=1)
+    wavelength = np.loadtxt(args.wavelengths_path, ndmin=1)
+    calibration, result = Calibration.fit(
+        pix, wavelength, args.degree, pix_range=(0, args.num_pixels - 1)
+    )
+    print(result.fit_report(), '\n\n')
+    calibration.save(args.calibration_path)
+    print(f'Saved calibration to {args.calibration_path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,123 @@
 #!/usr/bin/python
-import sys
+import argparse
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from matplotlib import pyplot as plt
-from matplotlib.lines import Line2D
-from matplotlib.widgets import Button
-from matplotlib.backend_bases import MouseButton
-from lmfit.models import ConstantModel, VoigtModel
-from scipy.signal import find_peaks
 
-import calibration_model
+from calibration import Calibration
+from fit_session import FitSession
+from spectrum_io import load_spectrum
+
+
+# Header of the fitted parameters table
+fitted_params_header = (
+    'center center_stderr amplitude amplitude_stderr '
+    'sigma sigma_stderr c c_stderr wavelength_nm wavelength_nm_stderr'
+)
+
+
+def load_intensity(spectrum_path):
+    """
+    Args:
+        spectrum_path: str, path to SpectraSuite tab separated value file
+    Returns:
+        Intensity column of the spectrum, indexed by pixel number.
+    """
+    # Intensity is column 1 (0 indexed)
+    return load_spectrum(spectrum_path)[:, 1]
+
+
+@functools.lru_cache(maxsize=None)
+def peak_model():
+    """Model fitted to each peak, a Voigt peak on a constant background"""
+    # lmfit takes seconds to import, so only when there's a peak to fit
+    from lmfit.models import ConstantModel, VoigtModel
+    return ConstantModel() + VoigtModel()
+
+
+def fit_window(model, I, left, right, approx_center):
+    """
+    Fit model to the intensities between pixels left and right.
+
+    Args:
+        model: lmfit model with c, amplitude, center and sigma parameters
+        I: array, intensity indexed by pixel number
+        left, right: int, pixel limits of the peak
+        approx_center: int, approximate pixel of the peak from peak_detect
+    Returns:
+        lmfit ModelResult of the fit.
+    """
+    # Intensities of selected region
+    I_subset = I[left:right]
+    return model.fit(
+        I_subset,
+        x=np.arange(left, right),
+        c=np.amin(I_subset),
+        amplitude=I[approx_center],
+        center=approx_center,
+        sigma=1,
+    )
+
+
+def params_row(result):
+    """Fitted parameters of a fit result, without the wavelength columns"""
+    row = []
+    for name in ('center', 'amplitude', 'sigma', 'c'):
+        param = result.params[name]
+        # stderr is None if the covariance could not be estimated
+        stderr = np.nan if param.stderr is None else param.stderr
+        row += [param.value, stderr]
+    return row
+
+
+def add_wavelengths(fitted_params, calibration):
+    """
+    Fill in the wavelength columns of a fitted parameters table from the
+    center columns, converting every peak in one go.
+
+    Args:
+        fitted_params: array (num_peaks, 10), columns as fitted_params_header
+        calibration: Calibration, or None to leave the wavelengths nan
+    """
+    if calibration is None:
+        fitted_params[:, 8:] = np.nan
+    else:
+        fitted_params[:, 8], fitted_params[:, 9] = calibration.wavelength(
+            fitted_params[:, 0], fitted_params[:, 1]
+        )
+
+
+def decimate(y, lo, hi, num_bins):
+    """
+    Pick which points of y to draw when pixels lo to hi are visible.
+
+    If there are more points than the axes is pixels wide, only the
+    minimum and maximum of each of num_bins bins are kept, which looks the
+    same on screen, peaks included.
+
+    Args:
+        y: array, indexed by pixel number
+        lo, hi: float, visible range of pixel numbers
+        num_bins: int, number of bins, e.g. the width of the axes in pixels
+    Returns:
+        Sorted array of the pixel numbers to draw.
+    """
+    # One point past each edge, so the line runs off the axes
+    start = min(max(int(np.floor(lo)) - 1, 0), y.size)
+    stop = max(min(int(np.ceil(hi)) + 2, y.size), start)
+    num = stop - start
+    if num <= 2 * num_bins:
+        return np.arange(start, stop)
+    per_bin = -(-num // num_bins)
+    whole = num // per_bin * per_bin
+    bins = y[start:start + whole].reshape(-1, per_bin)
+    offsets = start + per_bin * np.arange(bins.shape[0])
+    return np.unique(np.concatenate((
+        offsets + np.argmin(bins, axis=1),
+        offsets + np.argmax(bins, axis=1),
+        # Points left over that don't fill a bin
+        np.arange(start + whole, stop),
+    )))
 
 
 class SpectrumFitter:
@@ -17,40 +126,54 @@ class SpectrumFitter:
     peak_right = 0
     # Peak being displayed, start at -1, so first 'Next' goes to 0.
     current_peak = -1
-    # Model to use for fitting peaks
-    model = ConstantModel() + VoigtModel()
 
-    def __init__(self, spectrum_path, fitted_params_path):
+    def __init__(self, spectrum_path, fitted_params_path, calibration_path=None,
+                 session_path=None, height=None, snr=5):
         """
         Args:
             spectrum_path: str, path to SpectraSuite tab separated value file
             fitted_params_path: str, location that fitted parameters should
                 be saved to on exit.
+            calibration_path: str, pixel to wavelength calibration saved by
+                calibration.py, wavelengths are nan without one.
+            session_path: str, file each fit is saved to as soon as it's
+                done, defaults to the session next to the spectrum.
+            height: float, fixed minimum height of a peak, None to find
+                the peaks that stand out from the noise
+            snr: float, see peak_detect.detect
         """
-        # Get intensity column from SpectraSuite file
-        # Number of header lines in the file
-        num_header_lines = 17
-        # Number of lines in the file
-        num_lines = 3666
-        self.I = np.loadtxt(
-            spectrum_path,
-            skiprows=num_header_lines,
-            # Intensity is column 1 (0 indexed)
-            usecols=1,
-            # Don't use last line, which is a footer
-            max_rows=num_lines - num_header_lines - 1,
-        )
+        # The GUI and fitting libraries are only imported to open the window
+        from matplotlib import pyplot as plt
+        from matplotlib.widgets import Button
+        # Model to use for fitting peaks
+        self.model = peak_model()
+        self.I = load_intensity(spectrum_path)
         # Pixel numbers is the indices of the intensity array
         self.pix = np.arange(self.I.size)
         # Get approximate pixel of peak
-        # TODO: make min height selectable
-        self.peak_pix, peak_properties = find_peaks(self.I, 1090)
+        if height is None:
+            import peak_detect
+            self.peak_pix = peak_detect.detect(self.I, snr)
+        else:
+            from scipy.signal import find_peaks
+            self.peak_pix, peak_properties = find_peaks(self.I, height)
         # Array of fitted parameters for each peak
-        fitted_params_header = (
-            'center center_stderr amplitude amplitude_stderr '
-            'sigma sigma_stderr c c_stderr wavelength_nm'
+        self.fitted_params = np.zeros((self.peak_pix.size, 10))
+        # Window fitted for each peak
+        self.windows = {}
+        # Restore fits from last time this spectrum was opened
+        self.session = FitSession.for_spectrum(
+            spectrum_path, self.I, session_path
         )
-        self.fitted_params = np.zeros((self.peak_pix.size, 9))
+        saved = self.session.load()
+        for i, center in enumerate(self.peak_pix):
+            if int(center) in saved:
+                left, right, row = saved[int(center)]
+                self.windows[i] = (left, right)
+                self.fitted_params[i, :8] = row
+        if self.windows:
+            print(f'Restored {len(self.windows)} fitted peaks from '
+                  f'{self.session.session_path}')
 
         # Plot data around peak, and let self.peak_left and self.peak_right limits of peak be
         # selected graphically.
@@ -59,7 +182,8 @@ class SpectrumFitter:
         self.fig.subplots_adjust(bottom=0.2)
         self.ax.set_xlabel('Pixel')
         self.ax.set_ylabel('Intensity')
-        self.ax.plot(
+        # Only the points that can be seen are drawn, see decimate
+        self.data_line, = self.ax.plot(
             self.pix,
             self.I,
             'x-',
@@ -68,6 +192,26 @@ class SpectrumFitter:
         )
         # Mark found peaks
         self.ax.plot(self.pix[self.peak_pix], self.I[self.peak_pix], 'o')
+        # The limit lines and fitted line are animated, they're drawn on top
+        # of a saved copy of the rest of the figure (blitting) rather than
+        # redrawing everything whenever they move
+        self.left_artist = self.ax.axvline(
+            0, color='green', animated=True, visible=False
+        )
+        self.right_artist = self.ax.axvline(
+            0, color='red', animated=True, visible=False
+        )
+        self.fit_artist, = self.ax.plot([], [], color='orange', animated=True)
+        self.background = None
+        self.fig.canvas.mpl_connect('draw_event', self.on_draw)
+        self.ax.callbacks.connect('xlim_changed', self.update_decimation)
+        self.update_decimation(self.ax)
+        # Fits run on another thread so the window keeps responding, and a
+        # timer checks for the result
+        self.fit_executor = ThreadPoolExecutor(max_workers=1)
+        self.fit_future = None
+        self.fit_timer = self.fig.canvas.new_timer(interval=50)
+        self.fit_timer.add_callback(self.poll_fit)
         
         # Buttons to move between peaks, adapted from matplotlib docs
         axprev = self.fig.add_axes([0.7, 0.05, 0.1, 0.075])
@@ -79,19 +223,47 @@ class SpectrumFitter:
         # When a point is picked set that as a limit of the peak
         self.fig.canvas.mpl_connect('pick_event', self.onpick)
         plt.show()
+        # Keep a fit that was still running when the window was closed
+        self.fit_executor.shutdown(wait=True)
+        self.poll_fit(draw=False)
 
-        # Save fitted parameters to file
-        np.savetxt(
-            fitted_params_path,
-            # Get rid of zero rows (unfitted peaks)
-            self.fitted_params[np.all(self.fitted_params != 0, axis=1)],
-            header=fitted_params_header,
-        )
+        if calibration_path is not None:
+            calibration = Calibration.load(calibration_path)
+        else:
+            calibration = None
+        # Every fit is already in the session, save the table from there
+        self.session.export(fitted_params_path, calibration)
+        self.session.close()
         print(f'Saved fitted parameters to {fitted_params_path}')
 
     def refresh(self):
-        self.fig.canvas.draw()
-        self.fig.canvas.flush_events()
+        # Full redraw, on_draw then saves the new background
+        self.fig.canvas.draw_idle()
+
+    def on_draw(self, event):
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self.draw_animated()
+
+    def draw_animated(self):
+        for artist in (self.left_artist, self.right_artist, self.fit_artist):
+            self.ax.draw_artist(artist)
+
+    def blit(self):
+        """Redraw only the animated artists"""
+        canvas = self.fig.canvas
+        if self.background is None or not canvas.supports_blit:
+            self.refresh()
+            return
+        canvas.restore_region(self.background)
+        self.draw_animated()
+        canvas.blit(self.fig.bbox)
+        canvas.flush_events()
+
+    def update_decimation(self, ax):
+        lo, hi = sorted(ax.get_xlim())
+        num_bins = max(int(ax.bbox.width), 1)
+        shown = decimate(self.I, lo, hi, num_bins)
+        self.data_line.set_data(self.pix[shown], self.I[shown])
 
     def change_peak(self, change):
         self.current_peak += change
@@ -113,80 +285,110 @@ class SpectrumFitter:
         self.ax.set_title(
             f'Peak {self.current_peak + 1} of {self.peak_pix.size}'
         )
+        # Show the window and fit restored or fitted earlier
+        if self.current_peak in self.windows:
+            self.peak_left, self.peak_right = self.windows[self.current_peak]
+            for artist, pix in ((self.left_artist, self.peak_left),
+                                (self.right_artist, self.peak_right)):
+                artist.set_xdata([pix, pix])
+                artist.set_visible(True)
+            self.show_fit(
+                self.peak_left, self.peak_right,
+                self.fitted_params[self.current_peak, :8],
+            )
         self.refresh()
 
     def onpick(self, event):
-        if isinstance(event.artist, Line2D):
-            # Pixel number the picked point is the index of the point
-            pix = event.ind[0]
+        from matplotlib.backend_bases import MouseButton
+        if event.artist is self.data_line:
+            # Only some points are drawn, so look up the pixel number of the
+            # picked point rather than using its index
+            pix = int(round(self.data_line.get_xdata()[event.ind[0]]))
             if event.mouseevent.button is MouseButton.LEFT:
-                # Remove old line
-                try:
-                    self.left_artist.remove()
-                except AttributeError:
-                    pass
-                # Draw vertical line at picked pixel number
-                self.left_artist = self.ax.axvline(pix, color='green')
+                # Move vertical line to picked pixel number
+                artist = self.left_artist
                 self.peak_left = pix
             elif event.mouseevent.button is MouseButton.RIGHT:
-                try:
-                    self.right_artist.remove()
-                except AttributeError:
-                    pass
-                self.right_artist = self.ax.axvline(pix, color='red')
+                artist = self.right_artist
                 self.peak_right = pix
             else:
                 return
-            self.refresh()
+            artist.set_xdata([pix, pix])
+            artist.set_visible(True)
+            self.blit()
         # If a valid range less than 100 pixels wide is selected, fit a peak
         if 0 < self.peak_right - self.peak_left < 100:
             self.fit_peak()
 
+    def show_fit(self, left, right, row):
+        """Smooth fitted line of a row of fitted parameters"""
+        params = self.model.make_params(
+            center=row[0], amplitude=row[2], sigma=row[4], c=row[6]
+        )
+        lots_pix = np.linspace(left, right, 1000)
+        self.fit_artist.set_data(lots_pix, self.model.eval(params, x=lots_pix))
+
     def fit_peak(self):
-        # Approximate center of peak from find_peaks
+        # Same window as the saved fit, nothing to do
+        if self.windows.get(self.current_peak) == (self.peak_left,
+                                                    self.peak_right):
+            return
+        # Approximate center of peak from peak_detect
         approx_center = self.peak_pix[self.current_peak]
-        # Intensities of selected region
-        I_subset = self.I[self.peak_left:self.peak_right]
-        result = self.model.fit(
-            I_subset,
-            x=self.pix[self.peak_left:self.peak_right],
-            c=np.amin(I_subset),
-            amplitude=self.I[approx_center],
-            center=approx_center,
-            sigma=1,
+        # Only the newest selection matters, drop one still waiting to start
+        if self.fit_future is not None:
+            self.fit_future.cancel()
+        self.fit_future = self.fit_executor.submit(
+            fit_window,
+            self.model, self.I, self.peak_left, self.peak_right, approx_center
         )
+        self.fit_job = (self.current_peak, self.peak_left, self.peak_right)
+        self.fit_timer.start()
+
+    def poll_fit(self, draw=True):
+        """Use the result of the background fit, if it's finished"""
+        if self.fit_future is None or not self.fit_future.done():
+            return
+        future = self.fit_future
+        peak, left, right = self.fit_job
+        self.fit_future = None
+        self.fit_timer.stop()
+        result = future.result()
         print(result.fit_report(), '\n\n')
-        # Save fitted parameters
-        self.fitted_params[self.current_peak] = (
-            result.params['center'].value,
-            result.params['center'].stderr,
-            result.params['amplitude'].value,
-            result.params['amplitude'].stderr,
-            result.params['sigma'].value,
-            result.params['sigma'].stderr,
-            result.params['c'].value,
-            result.params['c'].stderr,
-            calibration_model.model.eval(
-                x=result.params['center'].value,
-                params=calibration_model.params,
-            ),
-        )
+        # Save fitted parameters, to disk straight away
+        row = params_row(result)
+        self.fitted_params[peak, :8] = row
+        self.windows[peak] = (left, right)
+        self.session.save_fit(self.peak_pix[peak], left, right, row)
+        self.show_fit(left, right, row)
+        if draw:
+            self.blit()
 
-        # Remove old fitted line
-        try:
-            self.fit_artist.pop(0).remove()
-        except AttributeError:
-            pass
-        # Plot smooth fitted line
-        lots_pix = np.linspace(self.peak_left, self.peak_right, 1000)
-        self.fit_artist = self.ax.plot(
-            lots_pix,
-            result.eval(x=lots_pix),
-            color='orange',
-        )
-        self.refresh()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Fit the peaks of a SpectraSuite file, choosing the '
+                    'window of each by clicking on it'
+    )
+    parser.add_argument('spectrum_path')
+    parser.add_argument('fitted_params_path',
+                        help='location to save the fitted parameters to')
+    parser.add_argument('calibration_path', nargs='?', default=None,
+                        help='pixel to wavelength calibration file')
+    parser.add_argument('--session', default=None,
+                        help='fit session file, defaults to the one next to '
+                             'the spectrum')
+    parser.add_argument('--height', type=float, default=None,
+                        help='fixed minimum peak height passed to find_peaks, '
+                             'instead of finding peaks by signal to noise')
+    parser.add_argument('--snr', type=float, default=5,
+                        help='smallest height and prominence of a peak above '
+                             'the baseline, in units of the noise')
+    args = parser.parse_args(argv)
+
+    SpectrumFitter(args.spectrum_path, args.fitted_params_path,
+                   args.calibration_path, args.session, args.height, args.snr)
 
 
-spectrum_path = sys.argv[1]
-fitted_params_path = sys.argv[2]
-fitter = SpectrumFitter(spectrum_path, fitted_params_path)
+if __name__ == '__main__':
+    main()
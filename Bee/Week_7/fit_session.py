@@ -0,0 +1,210 @@
+#!/usr/bin/python
+import argparse
+import hashlib
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+# Sessions are saved in this file next to the spectra by default
+session_file_name = '.fit_session.sqlite'
+# Bump if the tables change, older sessions are then started again
+session_version = 1
+
+param_columns = (
+    'center', 'center_stderr', 'amplitude', 'amplitude_stderr',
+    'sigma', 'sigma_stderr', 'c', 'c_stderr',
+)
+
+
+def spectrum_hash(I):
+    """Hash of the intensities, so a spectrum is found however it's named"""
+    data = np.ascontiguousarray(I, dtype=float)
+    return hashlib.blake2b(data.tobytes(), digest_size=16).hexdigest()
+
+
+def default_session_path(spectrum_path):
+    directory = os.path.dirname(os.path.abspath(spectrum_path))
+    return os.path.join(directory, session_file_name)
+
+
+class FitSession:
+    """
+    Window and fitted parameters of every peak of a spectrum, saved to an
+    SQLite database as soon as each peak is fitted, so closing the window
+    or a crash doesn't lose any fits and re-opening a spectrum restores
+    them.
+
+    Peaks are identified by the approximate pixel from find_peaks, and
+    spectra by the hash of their intensities.
+    """
+
+    def __init__(self, session_path, spectrum, spectrum_path=''):
+        """
+        Args:
+            session_path: str, SQLite file, made if it doesn't exist
+            spectrum: str, spectrum_hash of the spectrum
+            spectrum_path: str, saved alongside the fits for reference
+        """
+        self.session_path = session_path
+        self.spectrum = spectrum
+        self.spectrum_path = spectrum_path
+        # Several processes of a batch fit may write at once
+        self.db = sqlite3.connect(session_path, timeout=60)
+        # Write ahead log, each commit is safe on disk without rewriting
+        # the database
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        version = self.db.execute('PRAGMA user_version').fetchone()[0]
+        if version != session_version:
+            with self.db:
+                self.db.execute('DROP TABLE IF EXISTS fits')
+                self.db.execute(f'PRAGMA user_version = {session_version}')
+        columns = ', '.join(f'{name} REAL' for name in param_columns)
+        with self.db:
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS fits ('
+                'spectrum TEXT, approx_center INTEGER, '
+                'left INTEGER, right INTEGER, '
+                f'{columns}, spectrum_path TEXT, updated REAL, '
+                'PRIMARY KEY (spectrum, approx_center))'
+            )
+
+    @classmethod
+    def for_spectrum(cls, spectrum_path, I, session_path=None):
+        """Session of a loaded spectrum, next to it unless session_path is given"""
+        if session_path is None:
+            session_path = default_session_path(spectrum_path)
+        return cls(session_path, spectrum_hash(I), spectrum_path)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def save_fit(self, approx_center, left, right, row):
+        """
+        Save one peak's fit straight away, replacing any earlier fit.
+
+        Args:
+            approx_center: int, pixel of the peak from find_peaks
+            left, right: int, pixel limits of the window fitted
+            row: 8 fitted values, see param_columns
+        """
+        self.save_fits([approx_center], [left], [right], [row])
+
+    def save_fits(self, approx_centers, lefts, rights, rows):
+        """Save the fits of several peaks in one transaction"""
+        now = time.time()
+        records = [
+            (self.spectrum, int(center), int(left), int(right),
+             *(float(v) for v in row), self.spectrum_path, now)
+            for center, left, right, row in zip(approx_centers, lefts, rights,
+                                                 rows)
+        ]
+        placeholders = ', '.join('?' * (len(param_columns) + 6))
+        with self.db:
+            self.db.executemany(
+                f'INSERT OR REPLACE INTO fits VALUES ({placeholders})', records
+            )
+
+    def load(self):
+        """
+        Returns:
+            Dict of approx_center: (left, right, array of 8 fitted values).
+        """
+        cursor = self.db.execute(
+            'SELECT approx_center, left, right, '
+            f'{", ".join(param_columns)} FROM fits WHERE spectrum = ? '
+            'ORDER BY approx_center',
+            (self.spectrum,),
+        )
+        return {
+            center: (left, right, np.array(row, dtype=float))
+            for center, left, right, *row in cursor
+        }
+
+    def restore(self, peak_pix, lefts, rights):
+        """
+        Fits saved for windows that are the same as lefts and rights.
+
+        Args:
+            peak_pix: array, approximate pixel of each peak
+            lefts, rights: arrays, window of each peak
+        Returns:
+            Array (num_peaks, 8) of saved fits, nan where there isn't one,
+            and a bool array of which peaks need fitting.
+        """
+        saved = self.load()
+        rows = np.full((len(peak_pix), len(param_columns)), np.nan)
+        needs_fit = np.ones(len(peak_pix), dtype=bool)
+        for i, center in enumerate(peak_pix):
+            fit = saved.get(int(center))
+            if fit is not None and fit[:2] == (lefts[i], rights[i]):
+                rows[i] = fit[2]
+                needs_fit[i] = False
+        return rows, needs_fit
+
+    def fitted_params(self):
+        """
+        Returns:
+            Array of approx_center of each fitted peak, and array
+            (num_peaks, 8) of their fits, in order of pixel.
+        """
+        saved = self.load()
+        centers = np.array(list(saved), dtype=int)
+        rows = np.array([fit[2] for fit in saved.values()], dtype=float)
+        return centers, rows.reshape(len(centers), len(param_columns))
+
+    def export(self, fitted_params_path, calibration=None):
+        """
+        Save the table fit_peaks.py saves from the fits in the session.
+
+        Args:
+            fitted_params_path: str, where to save it
+            calibration: Calibration, or None to leave wavelengths nan
+        Returns:
+            Number of peaks saved.
+        """
+        from fit_peaks import add_wavelengths, fitted_params_header
+        centers, rows = self.fitted_params()
+        fitted = np.zeros((len(rows), 10))
+        fitted[:, :8] = rows
+        add_wavelengths(fitted, calibration)
+        np.savetxt(fitted_params_path, fitted, header=fitted_params_header)
+        return len(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Save the fitted parameters table of a spectrum from the '
+                    'fits saved in its session'
+    )
+    parser.add_argument('spectrum_path')
+    parser.add_argument('fitted_params_path')
+    parser.add_argument('--session', default=None,
+                        help=f'session file, defaults to {session_file_name} '
+                             'next to the spectrum')
+    parser.add_argument('--calibration', default=None,
+                        help='pixel to wavelength calibration file')
+    args = parser.parse_args(argv)
+
+    from calibration import Calibration
+    from fit_peaks import load_intensity
+    I = load_intensity(args.spectrum_path)
+    if args.calibration is not None:
+        calibration = Calibration.load(args.calibration)
+    else:
+        calibration = None
+    with FitSession.for_spectrum(args.spectrum_path, I, args.session) as session:
+        num = session.export(args.fitted_params_path, calibration)
+    print(f'Saved {num} fitted peaks to {args.fitted_params_path}')
+
+
+if __name__ == '__main__':
+    main()
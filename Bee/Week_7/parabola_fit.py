@@ -1,89 +1,118 @@
+#!/usr/bin/python
+import argparse
+import copy
 import numpy as np
-import matplotlib.pyplot as plt
+import os
 import sys
-from lmfit.models import QuadraticModel
-from uncertainties import ufloat
-from matplotlib import use
-# Save for latex
-#use("pgf")
-#plt.rcParams.update({
-#    "pgf.texsystem" : "pdflatex",
-#    "pgf.preamble" : "\n".join([
-#        r"\usepackage[utf8x]{inputenc}"
-#        ]),
-#    'font.family' : 'serif',
-#    'text.usetex' : True,
-#    'pgf.rcfonts' : False,
-#    })
+# uncertain_array.py is shared by each week, in the folder above
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from uncertain_array import UArray
 
-#create lists for output and input
-list_of_max_L = []
-path_list = []
-list_of_lengths = sys.argv[1:]
 
-drop = 0
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fit a parabola to each drop and find how far it fell')
+    parser.add_argument('paths', nargs='+', help='drop files of Lmin Lmax')
+    parser.add_argument('--no-show', action='store_true', help="don't show each drop, e.g. when run without a display")
+    parser.add_argument('--plots', default=None, help='folder to save a figure of each drop to, only changed ones are redrawn')
+    parser.add_argument('--plot-format', default='pgf', help='e.g. pgf for LaTeX, or png')
+    parser.add_argument('--workers', type=int, default=None, help='processes saving the figures, 0 to save them in this one')
+    args = parser.parse_args(argv)
+    # lmfit is slow to import, so not until it's needed
+    from lmfit.models import QuadraticModel
+    # figures are described with plot_render.py, the same as batch_parabola_fit.py's
+    from batch_parabola_fit import drop_figure
+    from plot_render import Renderer
+    # Save for latex
+    latex_rc = {
+        "pgf.texsystem" : "pdflatex",
+        "pgf.preamble" : "\n".join([
+            r"\usepackage[utf8x]{inputenc}"
+            ]),
+        'font.family' : 'serif',
+        'text.usetex' : True,
+        'pgf.rcfonts' : False,
+        }
+    if args.plots is not None:
+        os.makedirs(args.plots, exist_ok=True)
+        # saves each figure in another process while the next drop is fitted
+        renderer = Renderer(args.workers)
 
-#parse each list of lengths to find maximum distance fallen 
-for i in list_of_lengths:
-    drop += 1
-    # set up graphs
-    plt.figure(figsize=(3.5,4))
-    plt.xlabel('Frame No.')
-    plt.ylabel('Height (cm)')
+    #create lists for output and input
+    list_of_max_L = []
+    path_list = []
+    list_of_lengths = args.paths
 
-    lengths = np.loadtxt(i,unpack = True)
+    drop = 0
+
+    #parse each list of lengths to find maximum distance fallen 
+    for i in list_of_lengths:
+        drop += 1
+        lengths = np.loadtxt(i,unpack = True)
     
-    #list of y and x vals for each drop
-    y = (lengths[0] + lengths[1])/2
-    x = np.arange(0,len(y))
+        #list of y and x vals for each drop
+        y = (lengths[0] + lengths[1])/2
+        x = np.arange(0,len(y))
     
-    #parse filename
-    path = str(i).removeprefix(r'.\Parabolas\air')
-    path.removeprefix(r'\\')
-    gas = path.split('_')[1]
+        #parse filename
+        path = str(i).removeprefix(r'.\Parabolas\air')
+        path.removeprefix(r'\\')
+        gas = path.split('_')[1]
+
+        #fit curve to x and y vals
+        model = QuadraticModel()
+        params = model.guess(y, x=x)
+        fit = model.fit(y,params,x=x)
+        print('Eval\n',fit.eval())
+        print(fit.values, fit.fit_report())
+        print('-------------------')
+        print(fit.params['a'].value, fit.params['a'].stderr)
 
-    #fit curve to x and y vals
-    model = QuadraticModel()
-    params = model.guess(y, x=x)
-    fit = model.fit(y,params,x=x)
-    print('Eval\n',fit.eval())
-    print(fit.values, fit.fit_report())
-    print('-------------------')
-    print(fit.params['a'].value, fit.params['a'].stderr)
+        #make uncertain values from fit params
+        a, b, c = fit.params['a'].value, fit.params['b'].value, fit.params['c'].value
+        aerr, berr, cerr = fit.params['a'].stderr, fit.params['b'].stderr, fit.params['c'].stderr
+        if fit.covar is not None:
+            # the parameters are correlated, keep that in the errors
+            ua, ub, uc = UArray.correlated([a, b, c], fit.covar)
+        else:
+            ua = UArray(a, aerr)
+            ub = UArray(b, berr)
+            uc = UArray(c,cerr)
 
-    xspace = np.linspace(0,len(y),100)
-    yspace = fit.eval(x=xspace)
-    points, = plt.plot(x,y,'o')
-    line, = plt.plot(xspace, yspace,'-',color = points.get_color())
-    #make ufloats from fit params
-    a, b, c = fit.params['a'].value, fit.params['b'].value, fit.params['c'].value
-    aerr, berr, cerr = fit.params['a'].stderr, fit.params['b'].stderr, fit.params['c'].stderr
-    ua = ufloat(a, aerr)
-    ub = ufloat(b, berr)
-    uc = ufloat(c,cerr)
+        #calculate max fall distance
+        xmax = -ub/(2*ua)
+        ymax = ua*(xmax**2)+ub*(xmax)+uc
+        list_of_max_L.append(ymax.to_ufloats().item())
+        path_list.append(path)
 
-    #calculate max fall distance
-    xmax = -ub/(2*ua)
-    ymax = ua*(xmax**2)+ub*(xmax)+uc
-    list_of_max_L.append(ymax)
-    path_list.append(path)
+        spec = drop_figure(
+            os.path.join(args.plots or '', f'{gas}{drop}parabola.{args.plot_format}'),
+            gas, drop, y, [a, b, c], (xmax.value, xmax.std), (ymax.value, ymax.std))
+        if args.plots is not None:
+            saved_spec = copy.copy(spec)
+            if args.plot_format == 'pgf':
+                # only the saved figure, so it still shows without latex
+                saved_spec.rc = {**spec.rc, **latex_rc}
+            renderer.submit(saved_spec)
+        if not args.no_show:
+            import matplotlib.pyplot as plt
+            spec.show()
+            plt.show()
 
-    Lmaxhack, = plt.plot(xmax.nominal_value, ymax.nominal_value, 'x', color = points.get_color())
-    Lmax = plt.errorbar(xmax.nominal_value, ymax.nominal_value, xerr=xmax.std_dev, yerr=ymax.std_dev, fmt='x', color = points.get_color())
-    #plt.text(xmax.nominal_value,ymax.nominal_value,f'({xmax},{ymax})')
-    plt.legend([(points,line),Lmaxhack],[f'{gas}: drop {drop}',f'$L$={ymax.nominal_value:.2f} cm $\pm${ymax.std_dev:.2f} cm'])
-  #  plt.savefig(f'{gas}{drop}parabola.pgf',bbox_inches='tight')
-    plt.show()
 
-    #plot label = f'$L$={xmax.nominal_value:.2f} cm $\pm${xmax.std_dev:.2f} cm', label=f'{gas}: drop {drop}',
+    L_arr = np.array(list_of_max_L)
+    path_arr = np.array(path_list)
 
+    output = np.column_stack((path_list,list_of_max_L))
+    print(output)
+    np.savetxt(f'output.txt',output,fmt='%s')
+    if args.plots is not None:
+        saved = renderer.wait()
+        print(f'Saved {len(saved)} figures to {args.plots}, {len(renderer.skipped)} were up to date')
 
-L_arr = np.array(list_of_max_L)
-path_arr = np.array(path_list)
 
-output = np.column_stack((path_list,list_of_max_L))
-print(output)
-np.savetxt(f'output.txt',output,fmt='%s')
+if __name__ == '__main__':
+    main()
 
 # run python3 parabola_fit.py 20221128T1221_air_36_c.txt
-# if u uncomment lines 9-17 and 75, that should save a pgf
\ No newline at end of file
+# add --plots . to save each one as a pgf for latex, or --plot-format png
+# for lots of files, python3 batch_parabola_fit.py *.txt fits them all without showing each one
\ No newline at end of file
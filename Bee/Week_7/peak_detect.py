@@ -0,0 +1,173 @@
+import numpy as np
+from scipy.ndimage import maximum_filter1d, minimum_filter1d, uniform_filter1d
+from scipy.signal import find_peaks, savgol_filter
+
+
+def rolling_baseline(I, window=101):
+    """
+    Slowly varying background under the peaks of spectra, through the
+    middle of the noise.
+
+    The rolling minimum then rolling maximum over window pixels (a
+    morphological opening) cuts off anything narrower than the window, but
+    follows the bottom of the noise, a couple of std devs below its mean.
+    It's smoothed over the same window and raised by the median of what's
+    left above it, which the few pixels in peaks barely move.
+
+    Args:
+        I: array (..., num_pixels), spectra along the last axis
+        window: int, pixels, wider than the widest peak
+    """
+    I = np.asarray(I, dtype=float)
+    opened = maximum_filter1d(minimum_filter1d(I, window, axis=-1), window,
+                              axis=-1)
+    baseline = uniform_filter1d(opened, window, axis=-1)
+    baseline += np.median(I - baseline, axis=-1, keepdims=True)
+    return baseline
+
+
+def noise_level(I):
+    """
+    Std dev of the noise of each spectrum, from the median absolute
+    difference of neighbouring pixels, which peaks and a sloping background
+    barely change.
+
+    Args:
+        I: array (..., num_pixels)
+    Returns:
+        Array (...).
+    """
+    steps = np.abs(np.diff(np.asarray(I, dtype=float), axis=-1))
+    # 1.4826 MAD is the std dev of normal noise, the difference of two
+    # pixels has sqrt(2) times the noise of one
+    return 1.4826 * np.median(steps, axis=-1) / np.sqrt(2)
+
+
+def smooth(I, window=7, order=2):
+    """Savitzky-Golay smoothing of spectra along the last axis"""
+    return savgol_filter(np.asarray(I, dtype=float), window, order, axis=-1)
+
+
+def detect(I, snr=5, baseline_window=101, smooth_window=None, order=2,
+           baseline=None, noise=None):
+    """
+    Find the peaks of one spectrum or a stack of them, those that stand out
+    from the baseline and from their neighbours by snr times the noise.
+
+    A stack is searched in one go, its rows joined end to end with a gap
+    above every spectrum between them. Nothing next to the gap is a local
+    maximum and the bases of a peak's prominence stop at it, so each row
+    gives the same peaks as searching it on its own.
+
+    Args:
+        I: array (num_pixels,) or (num_spectra, num_pixels)
+        snr: float, smallest height above the baseline and prominence of a
+            peak, in units of the noise
+        baseline_window: int, see rolling_baseline
+        smooth_window: int, odd number of pixels to smooth over with
+            Savitzky-Golay before searching, None not to smooth. Each peak
+            is then moved to the highest raw pixel within half the window.
+        order: int, order of the Savitzky-Golay polynomials
+        baseline, noise: arrays of I's shape and (num_spectra,) to use
+            rather than estimating them, see StreamingDetector
+    Returns:
+        Array of the pixel of each peak, or for a stack a list of them, one
+        per spectrum, ready for batch_fit_peaks.find_windows.
+    """
+    I = np.asarray(I, dtype=float)
+    stack = np.atleast_2d(I)
+    num_spectra, num_pixels = stack.shape
+    searched = stack if smooth_window is None else smooth(
+        stack, smooth_window, order
+    )
+    if baseline is None:
+        baseline = rolling_baseline(searched, baseline_window)
+    if noise is None:
+        noise = noise_level(stack)
+    threshold = snr * np.broadcast_to(noise, (num_spectra,))[:, None]
+    # a column above everything between rows, never a peak itself
+    gap = np.max(searched) + 1
+    joined = np.full((num_spectra, num_pixels + 1), gap)
+    joined[:, :-1] = searched
+    height = np.full(joined.shape, np.inf)
+    height[:, :-1] = np.atleast_2d(baseline) + threshold
+    prominence = np.broadcast_to(threshold, joined.shape).ravel()
+    peaks = find_peaks(joined.ravel(), height.ravel(),
+                       prominence=prominence)[0]
+    rows, pix = np.divmod(peaks, num_pixels + 1)
+    if smooth_window is not None and len(pix):
+        pix = _refine(stack, rows, pix, smooth_window // 2)
+    split = np.split(pix, np.searchsorted(rows, np.arange(1, num_spectra)))
+    return split[0] if I.ndim == 1 else split
+
+
+def _refine(stack, rows, pix, half):
+    """Move each peak to the highest pixel of its spectrum within half"""
+    offsets = np.arange(-half, half + 1)
+    candidates = np.clip(pix[:, None] + offsets, 0, stack.shape[1] - 1)
+    best = np.argmax(stack[rows[:, None], candidates], axis=1)
+    return candidates[np.arange(len(pix)), best]
+
+
+class StreamingDetector:
+    """
+    Peak detection for spectra arriving one at a time from the
+    spectrometer.
+
+    The baseline and noise are averaged over recent spectra with weights
+    that fall off by memory each spectrum, so the threshold is steadier
+    than one spectrum's estimate but still follows a drifting background.
+    Each spectrum takes the same fixed work and nothing is kept but the
+    averages, so the time to find its peaks doesn't grow however long the
+    stream runs.
+
+        detector = StreamingDetector()
+        for I in spectra:
+            peak_pix = detector.push(I)
+    """
+
+    def __init__(self, snr=5, baseline_window=101, smooth_window=None,
+                 order=2, memory=0.8):
+        """
+        Args:
+            snr, baseline_window, smooth_window, order: see detect
+            memory: float from 0 to 1, weight left on the averages of the
+                earlier spectra each time one arrives, 0 to treat every
+                spectrum on its own
+        """
+        self.snr = snr
+        self.baseline_window = baseline_window
+        self.smooth_window = smooth_window
+        self.order = order
+        self.memory = memory
+        self.baseline = None
+        self.noise = None
+
+    def push(self, I):
+        """
+        Find the peaks of the next spectrum.
+
+        Args:
+            I: array (num_pixels,)
+        Returns:
+            Array of the pixel of each peak.
+        """
+        I = np.asarray(I, dtype=float)
+        searched = I if self.smooth_window is None else smooth(
+            I, self.smooth_window, self.order
+        )
+        baseline = rolling_baseline(searched, self.baseline_window)
+        noise = noise_level(I)
+        if self.baseline is None or self.baseline.shape != I.shape:
+            self.baseline, self.noise = baseline, noise
+        else:
+            self.baseline *= self.memory
+            self.baseline += (1 - self.memory) * baseline
+            self.noise = self.memory * self.noise + (1 - self.memory) * noise
+        return detect(I, self.snr, self.baseline_window, self.smooth_window,
+                      self.order, self.baseline, self.noise)
+
+    def stream(self, spectra):
+        """Peaks of each of an iterable of spectra, as they arrive"""
+        for I in spectra:
+            yield self.push(I)
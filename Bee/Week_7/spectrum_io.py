@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# Cached arrays are saved in this directory next to the spectra
+cache_dir_name = '.spectrum_cache'
+# Bump when the parser changes so old caches are ignored
+cache_version = 1
+
+
+def _is_numeric(line):
+    fields = line.split()
+    if not fields:
+        return False
+    try:
+        for field in fields:
+            float(field)
+    except ValueError:
+        return False
+    return True
+
+
+def find_data_block(raw):
+    """
+    Find the numeric block of a SpectraSuite file.
+
+    Uses the '>>>>>Begin ... Spectral Data<<<<<' and
+    '>>>>>End ... Spectral Data<<<<<' markers if they are there, otherwise
+    skips non numeric lines at the top (header) and bottom (footer).
+
+    Args:
+        raw: bytes, contents of the file
+    Returns:
+        Byte offsets of the start and end of the data block.
+    """
+    start, end = 0, len(raw)
+    begin_marker = raw.find(b'>>>>>Begin')
+    if begin_marker >= 0:
+        start = raw.find(b'\n', begin_marker) + 1 or end
+    end_marker = raw.find(b'>>>>>End', start)
+    if end_marker >= 0:
+        end = end_marker
+    # Skip header lines
+    while start < end:
+        line_end = raw.find(b'\n', start, end)
+        if line_end < 0:
+            line_end = end
+        if _is_numeric(raw[start:line_end]):
+            break
+        start = line_end + 1
+    # Skip footer lines
+    while end > start:
+        line_start = raw.rfind(b'\n', start, end - 1) + 1 or start
+        if _is_numeric(raw[line_start:end]):
+            break
+        end = line_start
+    if start >= end:
+        raise ValueError('no numeric data found')
+    return start, end
+
+
+def parse_spectrum(raw):
+    """
+    Args:
+        raw: bytes, contents of a SpectraSuite file
+    Returns:
+        Array (num_pixels, num_columns), for SpectraSuite the columns are
+        wavelength and intensity.
+    """
+    start, end = find_data_block(raw)
+    block = raw[start:end]
+    num_cols = len(block.split(b'\n', 1)[0].split())
+    # Parse the whole block at once rather than line by line
+    data = np.array(block.split(), dtype=float)
+    if data.size % num_cols:
+        raise ValueError('rows of the data block have different lengths')
+    return data.reshape(-1, num_cols)
+
+
+def _cache_paths(spectrum_path):
+    directory, name = os.path.split(os.path.abspath(spectrum_path))
+    cache_dir = os.path.join(directory, cache_dir_name)
+    return (
+        cache_dir,
+        os.path.join(cache_dir, name + '.npy'),
+        os.path.join(cache_dir, name + '.json'),
+    )
+
+
+def _replace(path, write):
+    # Write to a temporary file then rename, so an interrupted write never
+    # leaves a cache that looks valid
+    tmp = path + f'.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+def _write_meta(meta_path, meta):
+    _replace(meta_path, lambda f: f.write(json.dumps(meta).encode()))
+
+
+def load_spectrum(spectrum_path, cache=True):
+    """
+    Load a SpectraSuite file, using a memory mapped binary cache.
+
+    The first read parses the text and saves the array to
+    .spectrum_cache/<name>.npy next to the file. Later reads memory map that
+    array if the file's modification time and size are unchanged, or if
+    they changed but the contents hash is the same.
+
+    Args:
+        spectrum_path: str, path to SpectraSuite tab separated value file
+        cache: bool, whether to read and write the cache
+    Returns:
+        Array (num_pixels, num_columns) of wavelength and intensity,
+        read only.
+    """
+    if not cache:
+        with open(spectrum_path, 'rb') as f:
+            return parse_spectrum(f.read())
+
+    cache_dir, npy_path, meta_path = _cache_paths(spectrum_path)
+    stat = os.stat(spectrum_path)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        meta = {}
+    valid = (
+        meta.get('version') == cache_version
+        and os.path.exists(npy_path)
+    )
+    if (
+        valid
+        and meta.get('mtime_ns') == stat.st_mtime_ns
+        and meta.get('size') == stat.st_size
+    ):
+        return np.load(npy_path, mmap_mode='r')
+
+    with open(spectrum_path, 'rb') as f:
+        raw = f.read()
+    digest = hashlib.blake2b(raw, digest_size=16).hexdigest()
+    new_meta = {
+        'version': cache_version,
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'blake2b': digest,
+    }
+    if valid and meta.get('blake2b') == digest:
+        # Touched or copied but not changed, just update the times
+        try:
+            _write_meta(meta_path, new_meta)
+        except OSError:
+            pass
+        return np.load(npy_path, mmap_mode='r')
+
+    data = parse_spectrum(raw)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        _replace(npy_path, lambda f: np.save(f, data))
+        _write_meta(meta_path, new_meta)
+    except OSError:
+        # Read only directory, carry on without a cache
+        return data
+    return np.load(npy_path, mmap_mode='r')
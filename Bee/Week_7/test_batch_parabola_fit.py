@@ -0,0 +1,37 @@
+import numpy as np
+
+from batch_parabola_fit import fit_quadratics, max_drop
+
+
+def drop(num_frames=20, seed=0):
+    """Heights of a drop falling to 70 cm at frame 10, with a little noise"""
+    x = np.arange(num_frames)
+    rng = np.random.default_rng(seed)
+    return 70 - 0.5 * (x - 10)**2 + rng.normal(0, 0.1, num_frames)
+
+
+def test_matches_separate_fits():
+    ys = [drop(20, 0), drop(15, 1)]
+    params, covar = fit_quadratics(ys)
+    for y, p in zip(ys, params):
+        np.testing.assert_allclose(p, np.polyfit(np.arange(len(y)), y, 2))
+    assert np.all(np.isfinite(covar))
+
+
+def test_short_drop_is_nan():
+    y = drop()
+    params, covar = fit_quadratics([y, y[:2], y])
+    assert np.all(np.isnan(params[1])) and np.all(np.isnan(covar[1]))
+    # the others are fitted as if it weren't there
+    np.testing.assert_allclose(params[[0, 2]], fit_quadratics([y, y])[0])
+    xmax, ymax = max_drop(params, covar)
+    assert np.isnan(ymax.value[1])
+    np.testing.assert_allclose(ymax.value[[0, 2]], 70, atol=0.2)
+
+
+def test_zero_spread_drop_unweighted():
+    y = drop()
+    sigma = np.full(len(y), 0.1)
+    sigma[3] = 0
+    params, covar = fit_quadratics([y], [sigma])
+    np.testing.assert_allclose(params, fit_quadratics([y])[0])
@@ -0,0 +1,64 @@
+import numpy as np
+from scipy.special import voigt_profile
+
+import peak_detect
+
+
+def spectra(num_spectra, num_pixels=1340, num_peaks=0, seed=0):
+    """Voigt peaks on a sloping background with N(0, 3) noise"""
+    rng = np.random.default_rng(seed)
+    pix = np.arange(num_pixels)
+    I = (1000 + np.linspace(0, 50, num_pixels)
+         + rng.normal(0, 3, (num_spectra, num_pixels)))
+    for row in I:
+        for center in rng.uniform(0, num_pixels, num_peaks):
+            row += rng.uniform(200, 5000) * voigt_profile(pix - center, 1.5,
+                                                          1.5)
+    return I
+
+
+def test_noise_has_no_peaks():
+    I = spectra(20)
+    assert sum(len(p) for p in peak_detect.detect(I)) == 0
+    assert sum(len(p) for p in peak_detect.detect(I, smooth_window=7)) == 0
+    assert len(peak_detect.detect(I[0])) == 0
+
+
+def test_baseline_through_noise():
+    I = spectra(20)
+    offset = np.mean(I - peak_detect.rolling_baseline(I))
+    assert abs(offset) < 0.5
+
+
+def test_finds_peaks():
+    pix = np.arange(1340)
+    I = spectra(1)[0]
+    centers = np.array([100.3, 400.8, 700, 1200.5])
+    for center in centers:
+        I += 1000 * voigt_profile(pix - center, 1.5, 1.5)
+    np.testing.assert_allclose(peak_detect.detect(I), centers, atol=1)
+
+
+def test_stack_matches_rows():
+    # peaks at the ends of rows and a falling ramp, where a row's first and
+    # last pixels are higher than the gap below them
+    ramp = np.linspace(100, 0, 40) + np.zeros((4, 1))
+    ramp[1, 20] += 50
+    ramp[2, [1, 38]] += 40
+    ramp[3, ::7] += 30
+    for stack in (ramp, spectra(8, num_peaks=30),
+                  spectra(8, num_peaks=200, seed=1)):
+        for smooth_window in (None, 7):
+            found = peak_detect.detect(stack, smooth_window=smooth_window)
+            for row, peak_pix in zip(stack, found):
+                np.testing.assert_array_equal(
+                    peak_pix,
+                    peak_detect.detect(row, smooth_window=smooth_window),
+                )
+
+
+def test_streaming_matches_detect_without_memory():
+    I = spectra(5, num_peaks=20)
+    detector = peak_detect.StreamingDetector(memory=0)
+    for row, peak_pix in zip(I, detector.stream(I)):
+        np.testing.assert_array_equal(peak_pix, peak_detect.detect(row))
@@ -0,0 +1,214 @@
+import numpy as np
+from scipy.special import wofz
+
+# Order of the parameters in the arrays used below
+param_names = ('c', 'amplitude', 'center', 'sigma')
+
+s2 = np.sqrt(2)
+s2pi = np.sqrt(2 * np.pi)
+spi = np.sqrt(np.pi)
+
+
+def voigt(x, p):
+    """
+    ConstantModel() + VoigtModel() with gamma tied to sigma, as lmfit
+    defines it.
+
+    Args:
+        x: array (n, L), pixel numbers
+        p: array (n, 4), parameters in the order of param_names
+    Returns:
+        Array (n, L) of model values.
+    """
+    c, amplitude, center, sigma = (p[:, i, None] for i in range(4))
+    z = (x - center + 1j * sigma) / (sigma * s2)
+    return c + amplitude * wofz(z).real / (sigma * s2pi)
+
+
+def voigt_jacobian(x, p):
+    """
+    Model values and analytic derivatives with respect to each parameter.
+
+    Returns:
+        Arrays (n, L) of model values and (n, L, 4) of derivatives.
+    """
+    c, amplitude, center, sigma = (p[:, i, None] for i in range(4))
+    # With gamma = sigma the imaginary part of z doesn't depend on sigma
+    u = (x - center) / (sigma * s2)
+    z = u + 1j / s2
+    w = wofz(z)
+    # Derivative of the Faddeeva function
+    dw = -2 * z * w + 2j / spi
+    norm = 1 / (sigma * s2pi)
+    f = c + amplitude * w.real * norm
+    J = np.empty(x.shape + (4,))
+    J[..., 0] = 1
+    J[..., 1] = w.real * norm
+    J[..., 2] = -amplitude * norm * dw.real / (sigma * s2)
+    J[..., 3] = -amplitude * norm * (dw.real * u + w.real) / sigma
+    return f, J
+
+
+def _inv(A):
+    """Inverse of a stack of matrices, nan for any that are singular"""
+    try:
+        return np.linalg.inv(A)
+    except np.linalg.LinAlgError:
+        out = np.full_like(A, np.nan)
+        for i, a in enumerate(A):
+            try:
+                out[i] = np.linalg.inv(a)
+            except np.linalg.LinAlgError:
+                pass
+        return out
+
+
+def levenberg_marquardt(x, y, mask, p0, max_iter=1000, ftol=1.5e-8,
+                        xtol=1.5e-8):
+    """
+    Fit many windows at once with one vectorized Levenberg-Marquardt.
+
+    Every window takes its own damping factor and stops independently, the
+    arrays are just padded to the same length.
+
+    Args:
+        x, y: arrays (n, L) of pixel numbers and intensities
+        mask: bool array (n, L), False for padding
+        p0: array (n, 4), initial parameters in the order of param_names
+        max_iter: int, maximum number of iterations
+        ftol, xtol: float, relative change in the sum of squares and the
+            parameters below which a window has converged (lmfit defaults)
+    Returns:
+        Arrays of best fit parameters (n, 4), their standard errors (n, 4)
+        and a bool array (n,) of which windows converged.
+    """
+    p = np.array(p0, dtype=float)
+    n = p.shape[0]
+    f, J = voigt_jacobian(x, p)
+    r = np.where(mask, f - y, 0)
+    J[~mask] = 0
+    cost = np.sum(r**2, axis=1)
+    lam = np.full(n, 1e-3)
+    active = np.ones(n, dtype=bool)
+    converged = np.zeros(n, dtype=bool)
+    for _ in range(max_iter):
+        if not active.any():
+            break
+        idx = np.flatnonzero(active)
+        Ja, ra = J[idx], r[idx]
+        JTJ = np.einsum('nli,nlj->nij', Ja, Ja)
+        g = np.einsum('nli,nl->ni', Ja, ra)
+        diag = np.maximum(np.einsum('nii->ni', JTJ), 1e-30)
+        A = JTJ + (lam[idx, None] * diag)[:, :, None] * np.eye(4)
+        step = np.linalg.solve(A, -g[..., None])[..., 0]
+        p_new = p[idx] + step
+        f_new, J_new = voigt_jacobian(x[idx], p_new)
+        m = mask[idx]
+        r_new = np.where(m, f_new - y[idx], 0)
+        cost_new = np.sum(r_new**2, axis=1)
+        # sigma is bounded below by 0 in VoigtModel
+        better = (cost_new < cost[idx]) & (p_new[:, 3] > 0)
+        good = idx[better]
+        # Converged once a step barely changes anything, rejected steps
+        # only get tiny once the damping is large near the minimum
+        small_step = np.all(
+            np.abs(step) <= xtol * (np.abs(p[idx]) + xtol), axis=1
+        )
+        small_cost = np.zeros(idx.size, dtype=bool)
+        small_cost[better] = (
+            cost[good] - cost_new[better] <= ftol * cost[good]
+        )
+        J_new[~m] = 0
+        p[good] = p_new[better]
+        r[good] = r_new[better]
+        J[good] = J_new[better]
+        cost[good] = cost_new[better]
+        lam[good] /= 10
+        lam[idx[~better]] *= 10
+        converged[idx[small_step | small_cost]] = True
+        # Give up on windows whose damping has run away
+        active = ~converged & (lam < 1e16)
+
+    # Covariance scaled by the reduced chi square, as lmfit does
+    npts = mask.sum(axis=1)
+    JTJ = np.einsum('nli,nlj->nij', J, J)
+    covar = _inv(JTJ) * (cost / np.maximum(npts - 4, 1))[:, None, None]
+    with np.errstate(invalid='ignore'):
+        stderr = np.sqrt(np.einsum('nii->ni', covar))
+    return p, stderr, converged
+
+
+def stack_windows(I, left, right):
+    """
+    Pad the peak windows of a spectrum into rectangular arrays.
+
+    Args:
+        I: array, intensity indexed by pixel number
+        left, right: int arrays, pixel limits of each peak, used as
+            I[left:right]
+    Returns:
+        Arrays (n, L) of pixel numbers, intensities and the padding mask.
+    """
+    width = np.max(right - left) if len(left) else 0
+    x = left[:, None] + np.arange(width)
+    mask = x < right[:, None]
+    x = np.where(mask, x, right[:, None] - 1)
+    return x.astype(float), I[x], mask
+
+
+def initial_params(I, x, mask, approx_center):
+    """Same starting values as fit_peaks.fit_window"""
+    p0 = np.empty((len(approx_center), 4))
+    # initial, so a spectrum without any windows works
+    p0[:, 0] = np.min(
+        np.where(mask, I[x.astype(int)], np.inf), axis=1, initial=np.inf
+    )
+    p0[:, 1] = I[approx_center]
+    p0[:, 2] = approx_center
+    p0[:, 3] = 1
+    return p0
+
+
+def fit_windows(spectra, lefts, rights, approx_centers):
+    """
+    Fit every peak window of a stack of spectra in one go.
+
+    Args:
+        spectra: list of intensity arrays
+        lefts, rights, approx_centers: lists of int arrays, one per
+            spectrum, see stack_windows
+    Returns:
+        List of arrays (num_peaks, 8), one per spectrum, with the columns
+        center center_stderr amplitude amplitude_stderr sigma sigma_stderr
+        c c_stderr, the same as SpectrumFitter.fitted_params without the
+        wavelength. Windows that didn't converge are nan.
+    """
+    xs, ys, masks, p0s = [], [], [], []
+    for I, left, right, approx_center in zip(
+        spectra, lefts, rights, approx_centers
+    ):
+        x, y, mask = stack_windows(I, left, right)
+        xs.append(x)
+        ys.append(y)
+        masks.append(mask)
+        p0s.append(initial_params(I, x, mask, approx_center))
+    counts = [len(p) for p in p0s]
+    if sum(counts) == 0:
+        return [np.empty((0, 8)) for _ in counts]
+    # Pad every spectrum's windows to the widest window of all of them
+    width = max(x.shape[1] for x in xs)
+    pad = lambda a, v: np.pad(a, ((0, 0), (0, width - a.shape[1])),
+                              constant_values=v)
+    x = np.concatenate([pad(a, 0) for a in xs])
+    y = np.concatenate([pad(a, 0) for a in ys])
+    mask = np.concatenate([pad(a, False) for a in masks])
+    # Padding pixels are masked out, but keep them finite
+    x[~mask] = np.repeat(x[:, :1], width, axis=1)[~mask]
+    p, stderr, converged = levenberg_marquardt(x, y, mask, np.concatenate(p0s))
+    # Same column order as fitted_params
+    order = [2, 1, 3, 0]
+    table = np.empty((len(p), 8))
+    table[:, 0::2] = p[:, order]
+    table[:, 1::2] = stderr[:, order]
+    table[~converged] = np.nan
+    return np.split(table, np.cumsum(counts)[:-1])
@@ -0,0 +1,223 @@
+#!/usr/bin/python
+import argparse
+import os
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+def diffusion_frames(x, y, times, A=0.01, alpha=1, dtype=float):
+    """
+    Spread of a point of heat, A/(4 pi alpha t) exp(-(x^2+y^2)/(4 alpha t)),
+    at every time in one go.
+
+    The exponential splits into exp(-x^2/4 alpha t) exp(-y^2/4 alpha t), so
+    only (num_times, len(x)) and (num_times, len(y)) exponentials are
+    worked out and the grid of each frame is their outer product.
+
+    Args:
+        x, y: 1D arrays, coordinates of the grid
+        times: 1D array, time of each frame, all > 0
+        A: float, heat put in at t=0
+        alpha: float, diffusivity
+        dtype: e.g. np.float32 to halve the memory of big grids
+    Returns:
+        Array (num_times, len(y), len(x)), frames[i] is the same as
+        A/4/np.pi/alpha/t*np.exp(-(X**2+Y**2)/4/alpha/t) with X, Y from
+        np.meshgrid(x, y).
+    """
+    t = np.asarray(times, dtype=dtype)[:, None]
+    x = np.asarray(x, dtype=dtype)
+    y = np.asarray(y, dtype=dtype)
+    gx = np.exp(-x**2/4/alpha/t)
+    # the prefactor goes on the shorter side
+    gy = np.exp(-y**2/4/alpha/t) * (A/4/np.pi/alpha/t)
+    return gy[:, :, None] * gx[:, None, :]
+
+
+def _render_chunk(args):
+    x, y, times, A, alpha, cvals, figsize, dpi = args
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.colors import Normalize
+    from matplotlib.figure import Figure
+    frames = diffusion_frames(x, y, times, A, alpha)
+    fig = Figure(figsize=figsize, dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    # same colours in every frame, whatever its range
+    norm = Normalize(cvals[0], cvals[-1])
+    cont = ax.contourf(x, y, frames[0], cvals, norm=norm)
+    fig.colorbar(cont, ax=ax)
+    images = []
+    for t, Z in zip(times, frames):
+        cont.remove()
+        cont = ax.contourf(x, y, Z, cvals, norm=norm)
+        ax.set_title(f'T={t:g} s')
+        canvas.draw()
+        images.append(np.asarray(canvas.buffer_rgba())[..., :3].copy())
+    return np.stack(images)
+
+
+def render_frames(x, y, times, A=0.01, alpha=1, cvals=None, figsize=None,
+                  dpi=100, workers=None, chunksize=8):
+    """
+    Draw the contour plot of each frame, spread over a pool of processes.
+
+    Each process works out the frames of its chunk of times with
+    diffusion_frames, so the grids are never sent between processes.
+
+    Args:
+        x, y, times, A, alpha: see diffusion_frames
+        cvals: array, contour levels, the same in every frame, defaults to
+            20 levels up to the peak of the first frame
+        figsize: (float, float), size in inches
+        dpi: int, pixels per inch
+        workers: int, number of processes, defaults to the number of cores
+        chunksize: int, number of frames drawn by a process at a time
+    Returns:
+        Generator of RGB arrays (height, width, 3) of uint8, in order of
+        time, each given as soon as its chunk is drawn.
+    """
+    times = np.asarray(times, dtype=float)
+    if cvals is None:
+        cvals = np.linspace(0, A/4/np.pi/alpha/times.min(), 20)
+    if workers is None:
+        workers = os.cpu_count()
+    # Don't leave processes idle when there are only a few frames
+    chunksize = max(1, min(chunksize, len(times) // workers))
+    jobs = [
+        (x, y, times[i:i + chunksize], A, alpha, cvals, figsize, dpi)
+        for i in range(0, len(times), chunksize)
+    ]
+    if workers == 1:
+        for images in map(_render_chunk, jobs):
+            yield from images
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            for images in pool.map(_render_chunk, jobs):
+                yield from images
+
+
+class VideoWriter:
+    """
+    Writes RGB frames to a video one at a time, rather than keeping the
+    whole animation in memory.
+
+    .gif files are saved with Pillow, each frame is reduced to 256 colours
+    as it's written, and anything else (e.g. .mp4) is piped to ffmpeg.
+
+        with VideoWriter('diffusion.mp4', fps=10) as writer:
+            for image in render_frames(x, y, times):
+                writer.write(image)
+    """
+
+    def __init__(self, path, fps=10):
+        self.path = path
+        self.fps = fps
+        self.process = None
+        self.gif_frames = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _start_ffmpeg(self, height, width):
+        import matplotlib
+        command = [
+            matplotlib.rcParams['animation.ffmpeg_path'], '-y',
+            '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+            '-s', f'{width}x{height}', '-r', str(self.fps), '-i', '-',
+            # most players need an even size in yuv420p
+            '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+            '-pix_fmt', 'yuv420p', self.path,
+        ]
+        try:
+            self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        except FileNotFoundError:
+            raise RuntimeError(
+                'ffmpeg not found, install it, set animation.ffmpeg_path or '
+                'save a .gif instead'
+            ) from None
+
+    def write(self, image):
+        """Add a frame, an RGB array (height, width, 3) of uint8"""
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        if self.path.lower().endswith('.gif'):
+            from PIL import Image
+            self.gif_frames.append(Image.fromarray(image).quantize())
+            return
+        if self.process is None:
+            self._start_ffmpeg(*image.shape[:2])
+        self.process.stdin.write(image.tobytes())
+
+    def close(self):
+        if self.gif_frames:
+            first, *rest = self.gif_frames
+            first.save(self.path, save_all=True, append_images=rest,
+                       duration=1000/self.fps, loop=0)
+            self.gif_frames = []
+        if self.process is not None:
+            self.process.stdin.close()
+            if self.process.wait():
+                raise RuntimeError(f'ffmpeg failed to save {self.path}')
+            self.process = None
+
+
+def save_animation(path, x, y, times, fps=10, **kwargs):
+    """
+    Draw every frame in parallel and write them to a video as they come.
+
+    Args:
+        path: str, .mp4, .gif or anything else ffmpeg can save
+        x, y, times: see diffusion_frames
+        fps: float, frames per second
+        kwargs: passed to render_frames
+    Returns:
+        Number of frames saved.
+    """
+    num = 0
+    with VideoWriter(path, fps) as writer:
+        for image in render_frames(x, y, times, **kwargs):
+            writer.write(image)
+            num += 1
+    return num
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Save an animation of heat spreading out from a point'
+    )
+    parser.add_argument('path', help='e.g. diffusion.mp4 or diffusion.gif')
+    parser.add_argument('--points', type=int, default=100,
+                        help='grid points along each side')
+    parser.add_argument('--extent', type=float, default=3,
+                        help='grid goes from -extent to extent')
+    parser.add_argument('--times', type=float, nargs=3, default=(1, 5, 41),
+                        metavar=('START', 'STOP', 'NUM'),
+                        help='time of the first and last frame, and number '
+                             'of frames')
+    parser.add_argument('--A', type=float, default=0.01)
+    parser.add_argument('--alpha', type=float, default=1)
+    parser.add_argument('--fps', type=float, default=10)
+    parser.add_argument('--dpi', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of processes, defaults to all cores')
+    args = parser.parse_args(argv)
+
+    x = np.linspace(-args.extent, args.extent, args.points)
+    start, stop, num = args.times
+    times = np.linspace(start, stop, int(num))
+    # same levels as contour.py when A and alpha are the defaults
+    cvals = np.linspace(0, 0.08*args.A/args.alpha, 20)
+    num = save_animation(args.path, x, x, times, args.fps, A=args.A,
+                         alpha=args.alpha, cvals=cvals, dpi=args.dpi,
+                         workers=args.workers)
+    print(f'Saved {num} frames to {args.path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+import numpy as np
+
+
+def group_sums(keys, values):
+    """
+    Sum the rows of values that have the same key.
+
+    Each key column is reduced to integer codes with np.unique, and the
+    rows are summed per code with np.bincount, or by sorting and
+    np.add.reduceat if there are too many possible combinations of keys.
+    Either way there's no loop over the rows in Python.
+
+    Args:
+        keys: array (n,) or (n, num_keys), e.g. columns of voltage and
+            position, the first column is the primary sort key
+        values: array (n,) or (n, m) of floats
+    Returns:
+        Sorted unique keys, and the sum of values for each of them.
+    """
+    keys = np.asarray(keys)
+    values = np.asarray(values, dtype=float)
+    if len(keys) == 0:
+        return keys, values
+    key_cols = keys.reshape(len(keys), -1)
+    uniques, codes = zip(*(
+        np.unique(col, return_inverse=True) for col in key_cols.T
+    ))
+    sizes = tuple(len(u) for u in uniques)
+    if np.prod(sizes, dtype=float) <= 4 * len(keys) + 1024:
+        # Few enough combinations to count every one of them
+        code = np.ravel_multi_index([c.reshape(-1) for c in codes], sizes)
+        flat = values.reshape(len(values), -1)
+        sums = np.column_stack([
+            np.bincount(code, weights=col, minlength=np.prod(sizes))
+            for col in flat.T
+        ])
+        present = np.flatnonzero(np.bincount(code, minlength=np.prod(sizes)))
+        index = np.unravel_index(present, sizes)
+        unique_keys = np.column_stack(
+            [u[i] for u, i in zip(uniques, index)]
+        ).astype(keys.dtype).reshape((-1,) + keys.shape[1:])
+        return unique_keys, sums[present].reshape((-1,) + values.shape[1:])
+    # lexsort sorts by the last key first
+    order = np.lexsort(key_cols.T[::-1])
+    sorted_cols = key_cols[order]
+    # A new group starts wherever any key changes
+    changes = np.any(sorted_cols[1:] != sorted_cols[:-1], axis=1)
+    starts = np.concatenate(([0], np.flatnonzero(changes) + 1))
+    return keys[order][starts], np.add.reduceat(values[order], starts, axis=0)
+
+
+def _as_columns(values):
+    values = np.asarray(values, dtype=float)
+    # not -1, which numpy can't work out for zero rows
+    return values.reshape(len(values), int(np.prod(values.shape[1:])))
+
+
+class GroupedMean:
+    """
+    Mean of each column for each distinct key, which can be built up a
+    chunk of rows at a time.
+
+    Only the sums needed for the mean and its error are kept for each group,
+    so memory depends on the number of groups rather than the number of
+    rows.
+    """
+
+    def __init__(self):
+        self.keys = None
+        self.sums = None
+        self.num_cols = None
+
+    def update(self, keys, values, errors=None):
+        """
+        Args:
+            keys: array (n,) or (n, num_keys)
+            values: array (n,) or (n, m)
+            errors: array of std devs of values, same shape
+        """
+        values = _as_columns(values)
+        self.num_cols = values.shape[1]
+        if len(values) == 0:
+            return
+        if errors is None:
+            errors = np.full_like(values, np.nan)
+        errors = _as_columns(errors)
+        with np.errstate(divide='ignore'):
+            weights = 1 / errors**2
+        # Everything needed for weighted and unweighted means and errors
+        sums = np.column_stack((
+            np.ones(len(values)),
+            values,
+            values**2,
+            errors**2,
+            weights,
+            weights * values,
+        ))
+        keys = np.asarray(keys)
+        if self.keys is not None:
+            # Previous sums are just more rows to add up
+            keys = np.concatenate((self.keys, keys))
+            sums = np.concatenate((self.sums, sums))
+        self.keys, self.sums = group_sums(keys, sums)
+
+    def result(self, weighted=False):
+        """
+        Args:
+            weighted: bool, if True weight each value by 1/std^2, giving a
+                mean with error (sum of 1/std^2)^-0.5. Otherwise take the
+                plain mean, with the std devs propagated as
+                (sum of std^2)^0.5 / count, or the standard error of the
+                mean if no errors were given.
+        Returns:
+            Arrays of the sorted unique keys, the mean of each column, its
+            error and the number of rows in each group, empty if no rows
+            have been added.
+        Raises:
+            ValueError: if weighted and any value has a std dev of zero or
+                none at all, which would give it infinite or nan weight
+        """
+        m = self.num_cols or 0
+        if self.keys is None:
+            return (np.empty(0), np.empty((0, m)), np.empty((0, m)),
+                    np.empty(0, dtype=np.int64))
+        count = self.sums[:, 0]
+        total, total_sq, var_total, w_total, wx_total = (
+            self.sums[:, 1 + i * m:1 + (i + 1) * m] for i in range(5)
+        )
+        n = count[:, None]
+        if weighted and not np.all(np.isfinite(w_total)):
+            bad = np.unique(self.keys[~np.all(np.isfinite(w_total), axis=1)],
+                            axis=0)
+            raise ValueError(f'can only weight by 1/std^2 if every value '
+                             f'has a std dev above zero, not for keys '
+                             f'{bad.tolist()}')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if weighted:
+                mean = wx_total / w_total
+                error = 1 / np.sqrt(w_total)
+            else:
+                mean = total / n
+                error = np.sqrt(var_total) / n
+                # No std devs given, use the scatter of the values
+                scatter = np.sqrt(
+                    np.maximum(total_sq - n * mean**2, 0) / (n - 1) / n
+                )
+                error = np.where(np.isnan(var_total), scatter, error)
+        return self.keys, mean, error, count.astype(np.int64)
+
+
+def _combine_moments(keys, count, mean, m2):
+    """
+    Merge partial counts, means and sums of squared deviations that share
+    a key, by Chan et al.'s parallel form of Welford's algorithm.
+    """
+    key_cols = keys.reshape(len(keys), -1)
+    if key_cols.shape[1] == 1:
+        # Much faster than sorting the rows with axis=0
+        unique_keys, code = np.unique(key_cols[:, 0], return_inverse=True)
+    else:
+        unique_keys, code = np.unique(key_cols, axis=0, return_inverse=True)
+    code = code.reshape(-1)
+    total = np.bincount(code, weights=count)
+    total_mean = np.column_stack([
+        np.bincount(code, weights=count * col) for col in mean.T
+    ]) / total[:, None]
+    # Each part adds its own spread and that of its mean about the total
+    deviation = mean - total_mean[code]
+    parts = m2 + count[:, None] * deviation**2
+    total_m2 = np.column_stack([
+        np.bincount(code, weights=col) for col in parts.T
+    ])
+    unique_keys = unique_keys.astype(keys.dtype).reshape(
+        (-1,) + keys.shape[1:]
+    )
+    return unique_keys, total, total_mean, total_m2
+
+
+class GroupedMoments:
+    """
+    Count, mean and variance of each column for each distinct key, which
+    can be built up a chunk of rows at a time.
+
+    Unlike GroupedMean, which keeps sums of squares, the spread is kept as
+    the sum of squared deviations from each group's mean, so the variance
+    stays accurate over millions of readings with a small spread.
+    """
+
+    def __init__(self):
+        self.keys = None
+        self.count = None
+        self.mean = None
+        self.m2 = None
+
+    def update(self, keys, values):
+        """
+        Args:
+            keys: array (n,) or (n, num_keys)
+            values: array (n,) or (n, m)
+        """
+        values = _as_columns(values)
+        keys = np.asarray(keys)
+        if len(keys) == 0:
+            return
+        # Each row is a group of one with no spread
+        count = np.ones(len(values))
+        m2 = np.zeros_like(values)
+        if self.keys is not None:
+            keys = np.concatenate((self.keys, keys))
+            count = np.concatenate((self.count, count))
+            values = np.concatenate((self.mean, values))
+            m2 = np.concatenate((self.m2, m2))
+        self.keys, self.count, self.mean, self.m2 = _combine_moments(
+            keys, count, values, m2
+        )
+
+    def merge(self, other):
+        """Add in the groups of another GroupedMoments, e.g. of another file"""
+        if other.keys is None:
+            return
+        if self.keys is None:
+            self.keys, self.count, self.mean, self.m2 = (
+                other.keys, other.count, other.mean, other.m2
+            )
+            return
+        self.keys, self.count, self.mean, self.m2 = _combine_moments(
+            np.concatenate((self.keys, other.keys)),
+            np.concatenate((self.count, other.count)),
+            np.concatenate((self.mean, other.mean)),
+            np.concatenate((self.m2, other.m2)),
+        )
+
+    def result(self):
+        """
+        Returns:
+            Arrays of the sorted unique keys, the mean of each column, the
+            sample std dev (nan for groups of one), the standard error of
+            the mean and the number of rows in each group.
+        """
+        n = self.count[:, None]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            std = np.sqrt(self.m2 / (n - 1))
+        return (self.keys, self.mean, std, std / np.sqrt(n),
+                self.count.astype(np.int64))
+
+
+def group_mean(keys, values, errors=None, weighted=False):
+    """
+    Mean of values for each distinct key, see GroupedMean.result.
+
+    Args:
+        keys: array (n,) or (n, num_keys)
+        values: array (n,) or (n, m)
+        errors: array of std devs of values, same shape
+        weighted: bool, whether to weight by 1/std^2
+    """
+    grouped = GroupedMean()
+    grouped.update(keys, values, errors)
+    return grouped.result(weighted)
@@ -0,0 +1,285 @@
+#!/usr/bin/python
+import argparse
+import os
+import time
+
+import numpy as np
+from scipy import fft
+
+
+def point_source(axes, t, A=0.01, alpha=1):
+    """
+    Heat spreading from a point put in at t=0 with nothing else around,
+    A/(4 pi alpha t)^(d/2) exp(-r^2/(4 alpha t)) in d dimensions.
+
+    Args:
+        axes: tuple of 1D arrays, coordinates along each axis of the grid
+        t: float, time > 0
+        A: float, heat put in at t=0
+        alpha: float, diffusivity
+    Returns:
+        Array of shape (len(axes[0]), len(axes[1]), ...), indexed as
+        np.meshgrid(*axes, indexing='ij'). In 2D that's the transpose of
+        contour.py's Z, the same for its square grid.
+    """
+    u = np.array(A/(4*np.pi*alpha*t)**(len(axes)/2))
+    # exp(-r^2) is the product of exp(-x^2) along each axis
+    for i, x in enumerate(axes):
+        shape = [1]*len(axes)
+        shape[i] = len(x)
+        u = u * np.exp(-np.asarray(x)**2/4/alpha/t).reshape(shape)
+    return u
+
+
+class HeatSolver:
+    """
+    Solves du/dt = alpha laplacian(u) + f on a periodic 2D or 3D grid.
+
+    The field is kept as its Fourier transform, where each mode decays as
+    exp(-alpha k^2 t), and stepped with the exponential integrator
+
+        u_k(t+dt) = exp(-alpha k^2 dt) u_k(t) + (1-exp(-alpha k^2 dt))/(alpha k^2) f_k
+
+    which is exact for any dt when f doesn't change with time. A step is
+    then two in-place operations on the stored transform with nothing
+    allocated, and FFTs are only done to set the field or source and to
+    get the field back. A source that changes with time can be given in
+    Fourier space too, so its steps don't allocate either.
+
+    The grid is periodic, so to match heat spreading out into nothing the
+    domain should be big enough that the field is ~0 at its edges.
+
+        solver = HeatSolver((x, y), alpha=1)
+        solver.set_field(point_source((x, y), 1), t=1)
+        solver.step(0.1, 40)
+        u = solver.field()
+    """
+
+    def __init__(self, axes, alpha=1, source=None, workers=None):
+        """
+        Args:
+            axes: tuple of equally spaced 1D arrays, coordinates along each
+                axis of the grid
+            alpha: float, diffusivity
+            source: see set_source
+            workers: int, threads used by each FFT, defaults to the number
+                of cores
+        """
+        self.axes = tuple(np.asarray(x, dtype=float) for x in axes)
+        self.shape = tuple(len(x) for x in self.axes)
+        self.alpha = alpha
+        self.workers = os.cpu_count() if workers is None else workers
+        self.t = 0.0
+        # squared wavenumber of each mode of rfftn, the last axis is halved
+        k2 = np.zeros(self.shape[:-1] + (self.shape[-1]//2 + 1,))
+        for i, x in enumerate(self.axes):
+            dx = x[1] - x[0]
+            if i == len(self.axes) - 1:
+                k = 2*np.pi*fft.rfftfreq(len(x), dx)
+            else:
+                k = 2*np.pi*fft.fftfreq(len(x), dx)
+            shape = [1]*len(self.axes)
+            shape[i] = len(k)
+            k2 += (k**2).reshape(shape)
+        self.k2 = k2
+        self.u_hat = np.zeros(k2.shape, dtype=complex)
+        # buffers for the current step size, made again when dt changes
+        self._dt = None
+        self._decay = np.empty(k2.shape)
+        self._gain = np.empty(k2.shape)
+        self._forcing = np.zeros(k2.shape, dtype=complex)
+        self._f_hat = None
+        self._source = None
+        self._source_buffer = None
+        self.set_source(source)
+
+    def transform(self, u):
+        """
+        Fourier transform of an array of the grid's shape, laid out as the
+        stored field and self.k2, e.g. to build a source in Fourier space.
+        """
+        return fft.rfftn(u, s=self.shape, workers=self.workers)
+
+    def set_field(self, u, t=0.0):
+        """Set the field at time t, an array of the grid's shape"""
+        self.u_hat[...] = self.transform(u)
+        self.t = float(t)
+
+    def field(self, out=None):
+        """
+        The field at the current time.
+
+        Args:
+            out: array of the grid's shape to put it in, or None for a new
+                one
+        """
+        u = fft.irfftn(self.u_hat, s=self.shape, workers=self.workers)
+        if out is None:
+            return u
+        out[...] = u
+        return out
+
+    def set_source(self, source, fourier=False):
+        """
+        Args:
+            source: None, an array of the grid's shape that's the same at
+                every time, or a function source(t, out) that puts the
+                source at time t in the array out. A function is called at
+                the start of each step, so it's first order in dt.
+            fourier: bool, the function puts the source's transform in
+                out, a complex array of self.k2's shape, rather than the
+                source itself. Then no FFT is done each step and nothing is
+                allocated, e.g. for a pattern that's switched on and off
+
+                    pattern_hat = solver.transform(pattern)
+                    solver.set_source(
+                        lambda t, out: np.multiply(pattern_hat, g(t), out=out),
+                        fourier=True,
+                    )
+
+                A function in real space costs an FFT, and the array it
+                returns, every step.
+        """
+        self._source = None
+        self._f_hat = None
+        self._fourier = fourier
+        if callable(source):
+            self._source = source
+            if fourier:
+                self._source_buffer = np.zeros(self.k2.shape, dtype=complex)
+            else:
+                self._source_buffer = np.zeros(self.shape)
+        elif source is not None:
+            self._f_hat = self.transform(source)
+        # the forcing term of the step has to be worked out again
+        self._dt = None
+
+    def _set_dt(self, dt):
+        np.multiply(self.k2, -self.alpha*dt, out=self._decay)
+        # (1-exp(-alpha k^2 dt))/(alpha k^2), which is dt for k=0
+        np.expm1(self._decay, out=self._gain)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            np.divide(self._gain, self._decay, out=self._gain)
+        self._gain[self.k2 == 0] = 1
+        self._gain *= dt
+        np.exp(self._decay, out=self._decay)
+        if self._f_hat is not None:
+            np.multiply(self._gain, self._f_hat, out=self._forcing)
+        self._dt = dt
+
+    def step(self, dt, num=1):
+        """
+        Step the field forward num steps of dt.
+
+        Returns:
+            The time after the steps.
+        """
+        if dt != self._dt:
+            self._set_dt(dt)
+        for _ in range(num):
+            if self._source is not None:
+                self._source(self.t, self._source_buffer)
+                if self._fourier:
+                    f_hat = self._source_buffer
+                else:
+                    f_hat = fft.rfftn(self._source_buffer,
+                                      workers=self.workers)
+                np.multiply(self._gain, f_hat, out=self._forcing)
+            np.multiply(self.u_hat, self._decay, out=self.u_hat)
+            if self._source is not None or self._f_hat is not None:
+                np.add(self.u_hat, self._forcing, out=self.u_hat)
+            self.t += dt
+        return self.t
+
+    def frames(self, times, max_dt=None):
+        """
+        The field at each time, e.g. for diffusion.render_frames.
+
+        Args:
+            times: increasing times, none before the current time
+            max_dt: float, longest step, only needed for a source that
+                changes with time
+        Returns:
+            Array (num_times, *grid shape).
+        """
+        out = np.empty((len(times),) + self.shape)
+        for i, t in enumerate(times):
+            gap = t - self.t
+            num = 1 if max_dt is None else max(1, int(np.ceil(gap/max_dt)))
+            if gap > 0:
+                self.step(gap/num, num)
+            self.field(out[i])
+        return out
+
+
+def check(extent=30, points=256, A=0.01, alpha=1, times=(1, 5)):
+    """
+    Compare the solver with point_source, starting from it at times[0] on
+    a periodic domain big enough that it's ~0 at the edges.
+
+    Returns:
+        Largest error at times[1], relative to the peak.
+    """
+    x = np.linspace(-extent, extent, points, endpoint=False)
+    solver = HeatSolver((x, x), alpha)
+    solver.set_field(point_source((x, x), times[0], A, alpha), times[0])
+    solver.step((times[1] - times[0])/40, 40)
+    exact = point_source((x, x), times[1], A, alpha)
+    return np.abs(solver.field() - exact).max() / exact.max()
+
+
+def benchmark(points, dims=2, steps=100, workers=None):
+    """
+    Time steps of a grid with points along each side, with a source that
+    doesn't change.
+
+    Returns:
+        Steps per second, and steps per second when the field is also
+        transformed back after each step.
+    """
+    x = np.linspace(-3, 3, points, endpoint=False)
+    axes = (x,)*dims
+    solver = HeatSolver(axes, source=point_source(axes, 0.1),
+                        workers=workers)
+    solver.set_field(point_source(axes, 1))
+    out = np.empty(solver.shape)
+    solver.step(1e-3)
+    start = time.perf_counter()
+    solver.step(1e-3, steps)
+    step_rate = steps / (time.perf_counter() - start)
+    num = max(1, steps//10)
+    start = time.perf_counter()
+    for _ in range(num):
+        solver.step(1e-3)
+        solver.field(out)
+    field_rate = num / (time.perf_counter() - start)
+    return step_rate, field_rate
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Check the heat solver against the point source '
+                    'solution, and time its steps'
+    )
+    parser.add_argument('--benchmark', type=int, nargs='*', default=None,
+                        metavar='POINTS',
+                        help='time grids of these sizes, 512 and 2048 if '
+                             'none are given')
+    parser.add_argument('--dims', type=int, default=2)
+    parser.add_argument('--steps', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=None,
+                        help='threads used by each FFT, defaults to all cores')
+    args = parser.parse_args(argv)
+
+    print(f'largest error against the point source: {check():.2e} of the peak')
+    if args.benchmark is None:
+        return
+    for points in args.benchmark or (512, 2048):
+        step_rate, field_rate = benchmark(points, args.dims, args.steps,
+                                          args.workers)
+        print(f'{points}^{args.dims}: {step_rate:.1f} steps/s, '
+              f'{field_rate:.1f} steps/s with the field each step')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,49 +1,59 @@
+#!/usr/bin/python
+import argparse
 import numpy as np
-import sys
-from lmfit.models import LinearModel
-from matplotlib import pyplot as plt
-
-# import data
-path = sys.argv[1]
-data = np.loadtxt(
-        path)
-
-# average data values
-num_rows = int(len(data[:,1])/5)
-mW_data = data[:,1].reshape(num_rows,5).mean(1)
-pc_data = data[:,0].reshape(num_rows,5).mean(1)
-data_avg = np.column_stack((pc_data.reshape(num_rows,1),mW_data.reshape(num_rows,1)))
-
-# plot data points
-fig, ax = plt.subplots()
-ax.plot(data_avg[:,0],data_avg[:,1],'x',label='data')
-
-# fit data to linear model
-model = LinearModel()
-result = model.fit(data_avg[:,1],x=data_avg[:,0])
-print(result.fit_report(),'\n\n')
-
-# save parameters to variables
-m = result.params['slope'].value
-c = result.params['intercept'].value
-m_err = result.params['slope'].stderr
-c_err = result.params['intercept'].stderr
-
-# create new data set to plot a smoother line
-xspace = np.linspace(0,100,21)
-smooth_result = result.eval(x=xspace)
-ax.plot(xspace, smooth_result, label = f'linear fit,\n$m$={m:.3f}+/-{m_err:.3f},\n$c$={c:.3f}+/-{c_err:.3f}')
-
-# set up graph appearance
-ax.set_xlabel('Power (%)')
-ax.set_ylabel('Power (mW)')
-ax.set_title('Power Calibration (100x/0.75NA lens)')
-ax.legend()
-
-plt.show()
-
-# save output data
-output_data = np.column_stack((xspace,smooth_result))
-output_header = (' # Power(%) Power(mW)')
-np.savetxt(r'power_calibration.txt',output_data,header=output_header)
-print('Saved fitted parameters to power_calibration.txt')
+from power_calibration import PowerCalibration
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fit the laser power calibration to power meter logs')
+    parser.add_argument('paths', nargs='+', help='power meter logs of percent and mW')
+    parser.add_argument('--no-show', action='store_true', help="save the calibration without showing the graph")
+    args = parser.parse_args(argv)
+    # matplotlib is slow to import, so not until it's needed
+    from matplotlib import pyplot as plt
+
+    # import data, any number of power meter logs of percent and mW
+    paths = args.paths
+
+    # average the readings at each setpoint, wherever they are in the files,
+    # and fit a straight line to the averages
+    calibration = PowerCalibration.fit(paths)
+    print(f'{calibration.count.sum()} readings at {len(calibration.setpoints)} setpoints')
+
+    # plot data points
+    fig, ax = plt.subplots()
+    ax.plot(calibration.setpoints,calibration.mean,'x',label='data')
+
+    # save parameters to variables
+    c, m = calibration.coefs
+    c_err, m_err = np.sqrt(np.diag(calibration.covar))
+    print(f'slope = {m:.5f} +/- {m_err:.5f}\nintercept = {c:.5f} +/- {c_err:.5f}\n\n')
+
+    # create new data set to plot a smoother line
+    xspace = np.linspace(0,100,21)
+    smooth_result, smooth_err = calibration.power(xspace)
+    ax.plot(xspace, smooth_result, label = f'linear fit,\n$m$={m:.3f}+/-{m_err:.3f},\n$c$={c:.3f}+/-{c_err:.3f}')
+
+    # set up graph appearance
+    ax.set_xlabel('Power (%)')
+    ax.set_ylabel('Power (mW)')
+    ax.set_title('Power Calibration (100x/0.75NA lens)')
+    ax.legend()
+
+    if args.no_show:
+        plt.close(fig)
+    else:
+        plt.show()
+
+    # save output data
+    output_data = np.column_stack((xspace,smooth_result))
+    output_header = (' # Power(%) Power(mW)')
+    np.savetxt(r'power_calibration.txt',output_data,header=output_header)
+    print('Saved fitted parameters to power_calibration.txt')
+    # other scripts can load this and convert between % and mW
+    calibration.save(r'power_calibration.json')
+    print('Saved calibration to power_calibration.json')
+
+
+if __name__ == '__main__':
+    main()
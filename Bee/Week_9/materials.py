@@ -0,0 +1,165 @@
+import json
+import os
+import sys
+
+import numpy as np
+from scipy import constants
+
+import temperature_inversion
+# uncertain_array.py is shared by each week, in the folder above
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             os.pardir))
+from uncertain_array import UArray
+
+# Constants of each material, from fits, live here rather than in scripts
+default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'materials.json')
+# Temperature the room temperature shift correction was measured at
+room_temp = 273.15 + 25
+
+
+class Material:
+    """
+    Fitted constants of one material, and its cui, Bose_Einstein and width
+    functions with those constants filled in, vectorized over numpy arrays.
+    """
+
+    def __init__(self, name, id, values):
+        """
+        Args:
+            name: str, e.g. 'SiC'
+            id: int, number used for this material in a material column
+            values: dict of name: (value, std dev), e.g. w0, Ap, Bp, w1,
+                Aw, Bw, G0, room_temp_shift_correction
+        """
+        self.name = name
+        self.id = id
+        self.values = {k: (float(v[0]), float(v[1])) for k, v in values.items()}
+        self.nominal = {k: v[0] for k, v in self.values.items()}
+        self._width_to_temp = None
+
+    def __repr__(self):
+        return f'Material({self.name!r}, id={self.id})'
+
+    def ufloat(self, name):
+        """Constant as an uncertainties ufloat"""
+        import uncertainties
+        return uncertainties.ufloat(*self.values[name])
+
+    def uarray(self, name):
+        """Constant as a UArray, independent of any other UArray"""
+        return UArray(*self.values[name])
+
+    def cui(self, T):
+        """Raman shift at temperature T"""
+        n = self.nominal
+        return temperature_inversion.cui(T, n['w0'], n['Ap'], n['Bp'])
+
+    def bose_einstein(self, T, omega):
+        """Bose-Einstein occupation of a mode of wavenumber omega (cm-1)"""
+        x = constants.h*constants.c*100*omega/(T*constants.k)
+        return 1/np.expm1(x)
+
+    def width(self, T):
+        """Peak width at temperature T"""
+        n = self.nominal
+        return temperature_inversion.width_func(
+            T, n['G0'], n['Aw'], n['Bw'], n['w1'])
+
+    def width_to_temp(self, width, width_err=None):
+        """
+        Temperature from peak width, using a cached table of width against
+        temperature over 100-400 K.
+        """
+        if self._width_to_temp is None:
+            n = self.nominal
+            self._width_to_temp = temperature_inversion.width_inverse(
+                n['G0'], n['Aw'], n['Bw'], n['w1'], domain=(100, 400))
+        return self._width_to_temp(width, width_err)
+
+    def shift_to_temp(self, shift, shift_err):
+        """
+        Temperature from raman shift, correcting using the room temperature
+        offset, with the uncertainty of the constants included.
+
+        Args:
+            shift, shift_err: arrays of raman shift and its std dev
+        Returns:
+            Arrays of temperature and its std dev.
+        """
+        w0, A, B = self.uarray('w0'), self.uarray('Ap'), self.uarray('Bp')
+        x = B*constants.h*constants.c*w0/constants.k
+        room_temp_shift_cui = w0 - A/((x/room_temp).exp()-1)
+        w = room_temp_shift_cui - (
+            self.uarray('room_temp_shift_correction')
+            - UArray(shift, shift_err))
+        T = x/((w-w0-A)/(w-w0)).log()
+        return T.value, T.std
+
+
+class MaterialRegistry:
+    """Materials loaded from a config file, looked up by name or id"""
+
+    def __init__(self, materials):
+        self.materials = list(materials)
+        self._by_name = {m.name: m for m in self.materials}
+        self._by_id = {m.id: m for m in self.materials}
+
+    @classmethod
+    def load(cls, path=default_path):
+        """
+        Args:
+            path: str, JSON file of {name: {"id": int, constant: [value,
+                std dev], ...}}, keys starting with _ are ignored
+        """
+        with open(path) as f:
+            config = json.load(f)
+        materials = []
+        for name, values in config.items():
+            if name.startswith('_'):
+                continue
+            values = dict(values)
+            materials.append(Material(name, values.pop('id'), values))
+        return cls(materials)
+
+    def __getitem__(self, name):
+        return self._by_name[name]
+
+    def __iter__(self):
+        return iter(self.materials)
+
+    def by_id(self, id):
+        return self._by_id[int(id)]
+
+    def dispatch(self, ids, method, *arrays):
+        """
+        Call a Material method on rows of a mixed dataset, each row with
+        the material given by ids.
+
+        Each material's method is called once on all of its rows, so it
+        stays vectorized.
+
+        Args:
+            ids: array of material ids, one per row
+            method: str, name of the Material method, e.g. 'width_to_temp'
+            arrays: arrays passed to the method, one value per row
+        Returns:
+            Array, or tuple of arrays, of the method's results in the order
+            of the rows.
+        """
+        ids = np.asarray(ids)
+        out = None
+        for id in np.unique(ids):
+            rows = ids == id
+            result = getattr(self.by_id(id), method)(
+                *(np.asarray(a)[rows] for a in arrays))
+            single = not isinstance(result, tuple)
+            if single:
+                result = (result,)
+            if out is None:
+                out = tuple(np.full(ids.shape, np.nan) for _ in result)
+            for o, r in zip(out, result):
+                o[rows] = r
+        if out is None:
+            return np.empty(ids.shape)
+        return out[0] if single else out
@@ -0,0 +1,125 @@
+import functools
+
+import numpy as np
+
+
+class PositionIndex:
+    """
+    Positions of the numbered reference points of a sample, measured
+    relative to the TLM, looked up for whole columns of reference numbers
+    at once.
+
+    The reference numbers are kept sorted, so a column of them is turned
+    into rows of the table with one np.searchsorted rather than a dict
+    lookup per row, and the distance of each point from the TLM is worked
+    out once when the table is loaded.
+
+        index = PositionIndex.load('SiC_distance_measurements.csv')
+        distance = index.distance(nominal[:, ref_col])
+    """
+
+    def __init__(self, refs, xy, origin=(0, 0)):
+        """
+        Args:
+            refs: array of reference numbers, each only once
+            xy: array (len(refs), 2), x and y position of each in um
+            origin: x and y of the TLM, distances are measured from it
+        """
+        refs = np.asarray(refs, dtype=float)
+        xy = np.asarray(xy, dtype=float).reshape(len(refs), 2)
+        order = np.argsort(refs, kind='stable')
+        self.refs = refs[order]
+        self.xy = xy[order]
+        if np.any(np.diff(self.refs) == 0):
+            duplicated = np.unique(self.refs[1:][np.diff(self.refs) == 0])
+            raise ValueError(f'reference numbers {duplicated} appear more '
+                             f'than once')
+        self.origin = np.asarray(origin, dtype=float)
+        self.distances = np.hypot(*(self.xy - self.origin).T)
+
+    @classmethod
+    def load(cls, path, origin=(0, 0)):
+        """
+        Args:
+            path: str, csv of reference number, two unused columns, then x
+                and y in um, like SiC_distance_measurements.csv
+            origin: see __init__
+        """
+        table = np.loadtxt(path, delimiter=',', usecols=(0, 3, 4), ndmin=2)
+        return cls(table[:, 0], table[:, 1:], origin)
+
+    def __len__(self):
+        return len(self.refs)
+
+    def rows(self, refs):
+        """
+        Row of the table of each reference number.
+
+        Args:
+            refs: array of reference numbers, any shape
+        Raises:
+            KeyError: if any of them aren't in the table
+        """
+        refs = np.asarray(refs, dtype=float)
+        rows = np.searchsorted(self.refs, refs)
+        np.minimum(rows, len(self.refs) - 1, out=rows)
+        missing = self.refs[rows] != refs
+        if np.any(missing):
+            raise KeyError(f'no position for reference numbers '
+                           f'{np.unique(refs[missing])}')
+        return rows
+
+    def position(self, refs):
+        """x and y of each reference number, array (..., 2)"""
+        return self.xy[self.rows(refs)]
+
+    def distance(self, refs):
+        """Distance from the TLM of each reference number"""
+        return self.distances[self.rows(refs)]
+
+    @functools.cached_property
+    def tree(self):
+        """scipy cKDTree of the positions, made the first time it's used"""
+        from scipy.spatial import cKDTree
+        return cKDTree(self.xy)
+
+    def nearest(self, xy, k=1, max_distance=np.inf):
+        """
+        Reference points nearest to each of a set of positions, e.g. every
+        pixel of a Raman map.
+
+        Args:
+            xy: array (..., 2) of positions in um
+            k: int, number of neighbours of each
+            max_distance: float, neighbours further than this are left out
+        Returns:
+            Arrays of the reference numbers and how far away they are, of
+            shape (...) for k=1 or (..., k). Where there aren't enough
+            neighbours within max_distance the number is nan and the
+            distance inf.
+        """
+        distance, rows = self.tree.query(xy, k,
+                                         distance_upper_bound=max_distance)
+        found = rows < len(self.refs)
+        refs = np.full(np.shape(rows), np.nan)
+        refs[found] = self.refs[rows[found]]
+        return refs, distance
+
+    def within(self, xy, r):
+        """
+        Reference numbers of the points within r of each position.
+
+        Args:
+            xy: array (2,) or (n, 2) of positions in um
+            r: float or array (n,), radius in um
+        Returns:
+            Array of reference numbers for a single position, otherwise an
+            object array of them for each.
+        """
+        xy = np.asarray(xy, dtype=float)
+        rows = self.tree.query_ball_point(xy, r, return_sorted=True)
+        if xy.ndim == 1:
+            return self.refs[rows]
+        found = np.empty(len(rows), dtype=object)
+        found[:] = [self.refs[row] for row in rows]
+        return found
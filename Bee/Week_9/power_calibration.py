@@ -0,0 +1,184 @@
+import json
+
+import numpy as np
+
+import raman_stream
+from grouped_stats import GroupedMoments
+
+# Written into calibration files, bump if the format changes
+calibration_format = 'laser-power-calibration'
+calibration_version = 1
+
+
+def accumulate(paths, chunk_bytes=1 << 24):
+    """
+    Count, mean and spread of the power read at each setpoint, over any
+    number of power meter logs of columns of percent and mW.
+
+    Readings are grouped by the value of the setpoint wherever they are in
+    the files, and each file is read a chunk at a time, so memory depends
+    on the number of setpoints rather than the number of readings.
+
+    Args:
+        paths: list of str, power meter logs
+        chunk_bytes: int, roughly how much of a file to read at once
+    Returns:
+        GroupedMoments of power for each setpoint.
+    """
+    moments = GroupedMoments()
+    for path in paths:
+        for nominal, std in raman_stream.iter_chunks(path, 2, chunk_bytes):
+            moments.update(nominal[:, 0], nominal[:, 1])
+    return moments
+
+
+def fit_line(x, y, sigma=None):
+    """
+    Least squares straight line, worked out in closed form from weighted
+    sums.
+
+    The covariance is scaled by the reduced chi-square, as lmfit does, so
+    this gives the same parameters and errors as LinearModel().fit with
+    weights 1/sigma.
+
+    Args:
+        x, y: arrays of points
+        sigma: array, std dev of each y, or None to weight them equally
+    Returns:
+        Array of intercept and slope, and their covariance matrix.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if sigma is None:
+        w = np.ones_like(y)
+    else:
+        w = 1 / np.asarray(sigma, dtype=float)**2
+    S, Sx, Sy = w.sum(), (w * x).sum(), (w * y).sum()
+    Sxx, Sxy = (w * x * x).sum(), (w * x * y).sum()
+    delta = S * Sxx - Sx**2
+    coefs = np.array([Sxx * Sy - Sx * Sxy, S * Sxy - Sx * Sy]) / delta
+    covar = np.array([[Sxx, -Sx], [-Sx, S]]) / delta
+    with np.errstate(divide='ignore', invalid='ignore'):
+        redchi = np.sum(w * (y - coefs[0] - coefs[1] * x)**2) / (len(x) - 2)
+    return coefs, covar * redchi
+
+
+class PowerCalibration:
+    """
+    Laser power at each setpoint (%), measured and from a straight line
+    fitted to the measurements, with their errors.
+
+    Every function takes and returns arrays, the measured table is
+    linearly interpolated between setpoints.
+    """
+
+    def __init__(self, setpoints, mean, std, count, coefs, covar):
+        """
+        Args:
+            setpoints: array, sorted setpoints in %
+            mean, std: arrays, mean and sample std dev of the power in mW
+                read at each setpoint
+            count: array, number of readings at each setpoint
+            coefs: array, intercept and slope of the fitted line
+            covar: array, covariance matrix of coefs
+        """
+        self.setpoints = np.asarray(setpoints, dtype=float)
+        self.mean = np.asarray(mean, dtype=float)
+        self.std = np.asarray(std, dtype=float)
+        self.count = np.asarray(count, dtype=np.int64)
+        self.coefs = np.asarray(coefs, dtype=float)
+        self.covar = np.asarray(covar, dtype=float)
+
+    @property
+    def sem(self):
+        """Standard error of the mean power at each setpoint"""
+        return self.std / np.sqrt(self.count)
+
+    @classmethod
+    def from_moments(cls, moments, weighted=None):
+        """
+        Fit the line to the mean power at each setpoint.
+
+        Args:
+            moments: GroupedMoments, see accumulate
+            weighted: bool, weight each mean by 1/sem^2. None does if every
+                setpoint has a spread, readings rounded to the meter's
+                resolution often don't.
+        """
+        setpoints, mean, std, sem, count = moments.result()
+        mean, std, sem = mean[:, 0], std[:, 0], sem[:, 0]
+        if weighted is None:
+            weighted = bool(np.all(sem > 0))
+        coefs, covar = fit_line(setpoints, mean, sem if weighted else None)
+        return cls(setpoints, mean, std, count, coefs, covar)
+
+    @classmethod
+    def fit(cls, paths, weighted=None, chunk_bytes=1 << 24):
+        """Calibration from power meter logs, see accumulate and from_moments"""
+        return cls.from_moments(accumulate(paths, chunk_bytes), weighted)
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({
+                'format': calibration_format,
+                'version': calibration_version,
+                'setpoints': self.setpoints.tolist(),
+                'mean': self.mean.tolist(),
+                # nan isn't valid JSON
+                'std': np.nan_to_num(self.std).tolist(),
+                'count': self.count.tolist(),
+                'coefs': self.coefs.tolist(),
+                'covar': self.covar.tolist(),
+            }, f, indent=1)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            saved = json.load(f)
+        if saved.get('format') != calibration_format:
+            raise ValueError(f'{path} is not a laser power calibration')
+        if saved.get('version') != calibration_version:
+            raise ValueError(
+                f'{path} is calibration version {saved.get("version")}, '
+                f'expected {calibration_version}'
+            )
+        return cls(saved['setpoints'], saved['mean'], saved['std'],
+                   saved['count'], saved['coefs'], saved['covar'])
+
+    def power(self, percent, measured=False):
+        """
+        Power in mW at setpoints.
+
+        Args:
+            percent: array, setpoints in %
+            measured: bool, interpolate the measured means rather than use
+                the fitted line, the ends are held outside the table
+        Returns:
+            Arrays of power and its std dev, the error of the line or the
+            interpolated standard error of the mean.
+        """
+        percent = np.asarray(percent, dtype=float)
+        if measured:
+            return (np.interp(percent, self.setpoints, self.mean),
+                    np.interp(percent, self.setpoints,
+                              np.nan_to_num(self.sem)))
+        c, m = self.coefs
+        # v^T C v with v = (1, x)
+        variance = (self.covar[0, 0] + 2 * percent * self.covar[0, 1]
+                    + percent**2 * self.covar[1, 1])
+        return c + m * percent, np.sqrt(variance)
+
+    def setpoint(self, power, measured=False):
+        """
+        Setpoints in % that give power in mW, the inverse of power.
+
+        Args:
+            power: array, power in mW
+            measured: bool, interpolate the measured means, which must
+                increase with the setpoint
+        """
+        power = np.asarray(power, dtype=float)
+        if measured:
+            return np.interp(power, self.mean, self.setpoints)
+        c, m = self.coefs
+        return (power - c) / m
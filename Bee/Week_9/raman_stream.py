@@ -0,0 +1,169 @@
+import io
+
+import numpy as np
+
+from grouped_stats import GroupedMean
+
+
+def _parse_field(field):
+    """Nominal value and std dev of one field saved in uncertainties format"""
+    text = field.decode('latin1')
+    try:
+        if '+/-' in text and '(' not in text:
+            nominal, std = text.split('+/-')
+            return float(nominal), float(std)
+        # No uncertainty saved
+        return float(text), 0.0
+    except ValueError:
+        # Anything unusual, e.g. (1.0+/-0.1)e+02 or 1.00(5)
+        import uncertainties
+        value = uncertainties.ufloat_fromstr(text)
+        return value.nominal_value, value.std_dev
+
+
+def _loadtxt(text, usecols=None):
+    """Whole chunk of plain numbers, empty if any field isn't one"""
+    try:
+        return np.loadtxt(io.BytesIO(text), ndmin=2, usecols=usecols)
+    except ValueError:
+        return np.empty((0, 0))
+
+
+def _plain_columns(text):
+    """Columns of the first row with no +/- in them"""
+    for line in io.BytesIO(text):
+        fields = line.split(b'#', 1)[0].split()
+        if fields:
+            return [i for i, field in enumerate(fields) if b'+/-' not in field]
+    return []
+
+
+def parse_chunk(text, num_cols):
+    """
+    Parse rows of values saved in uncertainties format (e.g. 1.23+/-0.04)
+    into two float arrays rather than an object array of ufloats.
+
+    Args:
+        text: bytes, whole lines of the file
+        num_cols: int, number of columns
+    Returns:
+        Arrays (num_rows, num_cols) of nominal values and std devs.
+    """
+    # Usual case, every field is nominal+/-std, so split them into two
+    # columns and let numpy's C parser do the whole chunk at once
+    values = _loadtxt(text.replace(b'+/-', b' '))
+    if values.shape[1:] == (2 * num_cols,):
+        return values[:, 0::2], values[:, 1::2]
+    if values.shape[1:] == (num_cols,) and b'+/-' not in text:
+        # Plain numbers with no uncertainties, e.g. a power meter log
+        return values, np.zeros_like(values)
+    plain = np.zeros(num_cols, dtype=bool)
+    plain[[i for i in _plain_columns(text) if i < num_cols]] = True
+    if (plain.any() and values.shape[1:] == (2 * num_cols - plain.sum(),)
+            and _loadtxt(text, np.flatnonzero(plain)).size):
+        # Some columns are plain numbers in every row, e.g. the material, so
+        # only the others were split in two
+        width = np.where(plain, 1, 2)
+        start = np.cumsum(width) - width
+        nominal = values[:, start]
+        std = np.zeros_like(nominal)
+        std[:, ~plain] = values[:, start[~plain] + 1]
+        return nominal, std
+    # Drop comments, as np.loadtxt does
+    lines = [line.split(b'#', 1)[0] for line in text.splitlines()]
+    fields = b' '.join(lines).split()
+    if len(fields) % num_cols:
+        raise ValueError(f'rows do not all have {num_cols} columns')
+    parsed = np.array([_parse_field(f) for f in fields]).reshape(-1, 2)
+    return (
+        parsed[:, 0].reshape(-1, num_cols),
+        parsed[:, 1].reshape(-1, num_cols),
+    )
+
+
+def iter_chunks(path, num_cols, chunk_bytes=1 << 24):
+    """
+    Read a file of values in uncertainties format a chunk at a time.
+
+    Args:
+        path: str, path to the data file
+        num_cols: int, number of columns
+        chunk_bytes: int, roughly how much of the file to read at once
+    Yields:
+        Arrays (rows, num_cols) of nominal values and std devs.
+    """
+    leftover = b''
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(chunk_bytes)
+            if not block:
+                break
+            block = leftover + block
+            # Only parse whole lines, keep the rest for the next chunk
+            cut = block.rfind(b'\n') + 1
+            leftover = block[cut:]
+            if cut:
+                yield parse_chunk(block[:cut], num_cols)
+    if leftover.strip():
+        yield parse_chunk(leftover, num_cols)
+
+
+class Reservoir:
+    """Fixed size random sample of the rows of a stream, for plotting"""
+
+    def __init__(self, size, seed=None):
+        self.size = size
+        self.rng = np.random.default_rng(seed)
+        self.rows = None
+        self.priority = np.empty(0)
+
+    def update(self, rows):
+        """
+        Args:
+            rows: array (n, m), rows to consider for the sample
+        """
+        priority = self.rng.random(len(rows))
+        if self.rows is not None:
+            rows = np.concatenate((self.rows, rows))
+            priority = np.concatenate((self.priority, priority))
+        if len(rows) > self.size:
+            # Keeping the rows with the smallest random numbers is a uniform
+            # sample of everything seen so far
+            keep = np.argpartition(priority, self.size)[:self.size]
+            keep.sort()
+            rows, priority = rows[keep], priority[keep]
+        self.rows, self.priority = rows, priority
+
+
+def stream_group_means(path, num_cols, key_func, value_cols,
+                       chunk_bytes=1 << 24, sample_size=100_000, seed=0):
+    """
+    Average columns of a large file for each key, reading it in chunks.
+
+    Args:
+        path: str, path to the data file in uncertainties format
+        num_cols: int, number of columns in the file
+        key_func: function taking the nominal values of a chunk and
+            returning an array (rows, num_keys) of keys to group by
+        value_cols: list of int, columns to average
+        chunk_bytes: int, see iter_chunks
+        sample_size: int, number of rows to keep for plotting
+        seed: int, of the sample, fixed so the same file gives the same
+            sample, and so the same figures, every run
+    Yields:
+        After each chunk, the GroupedMean so far and a Reservoir sample of
+        rows of keys, then nominal values and std devs of value_cols. An
+        empty file still yields them once, with nothing in them.
+    """
+    means = GroupedMean()
+    sample = Reservoir(sample_size, seed)
+    empty = True
+    for nominal, std in iter_chunks(path, num_cols, chunk_bytes):
+        keys = key_func(nominal)
+        values, errors = nominal[:, value_cols], std[:, value_cols]
+        means.update(keys, values, errors)
+        sample.update(np.column_stack((keys, values, errors)))
+        empty = False
+        yield means, sample
+    if empty:
+        yield means, sample
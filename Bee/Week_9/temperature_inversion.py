@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+from scipy import constants
+from scipy.interpolate import PchipInterpolator
+
+# Tables are saved here, keyed by the function and its constants
+cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         '.temperature_cache')
+# Bump if the way tables are built changes so old ones are ignored
+cache_version = 1
+
+
+# empirical fit of raman shift against temperature
+def cui(T, w0, A, B):
+    return w0 - A/(np.exp(B*constants.h*constants.c*w0/constants.k/T)-1)
+
+
+# peak width against temperature
+def width_func(T, G0, Aw, Bw, w1):
+    x2 = constants.h*constants.c*100*w1/T/constants.k
+    x3 = constants.h*constants.c*200*w1/3/T/constants.k
+    n2 = 1/(np.exp(x2)-1)
+    n3 = 1/(np.exp(x3)-1)
+    return G0 + Aw*(1+2*n2) + Bw*(1+3*n3+3*n3**2)
+
+
+class InverseTable:
+    """
+    Inverse of a monotonic function of temperature, from a dense table of
+    the function and monotone (PCHIP) interpolation.
+
+    The table is doubled in size until inverting the function at the
+    midpoints between table points gives back the temperature to within
+    tol, and that worst error found is kept as max_error.
+    """
+
+    def __init__(self, T, f, max_error):
+        """
+        Args:
+            T: array, temperatures of the table
+            f: array, function at those temperatures
+            max_error: float, worst error of the inverse in K
+        """
+        self.T = T
+        self.f = f
+        self.max_error = max_error
+        # PCHIP needs increasing x
+        order = np.argsort(f)
+        self.inverse = PchipInterpolator(f[order], T[order], extrapolate=False)
+        self.slope = self.inverse.derivative()
+
+    @classmethod
+    def build(cls, func, domain, tol=1e-6, num=256, max_num=1 << 22):
+        """
+        Tabulate func over domain, making the table denser until the
+        inverse is accurate to tol.
+
+        Args:
+            func: function of temperature, vectorized
+            domain: (float, float), temperature range in K
+            tol: float, largest error in the temperature allowed in K
+            num: int, number of points to start with
+            max_num: int, give up making the table denser after this
+        """
+        while True:
+            T = np.linspace(domain[0], domain[1], num)
+            f = func(T)
+            steps = np.diff(f)
+            if not (np.all(steps > 0) or np.all(steps < 0)):
+                raise ValueError('function is not monotonic over the domain')
+            table = cls(T, f, 0)
+            T_mid = (T[1:] + T[:-1]) / 2
+            max_error = np.max(np.abs(table.inverse(func(T_mid)) - T_mid))
+            table.max_error = max_error
+            if max_error <= tol or num >= max_num:
+                return table
+            num *= 2
+
+    @classmethod
+    def cached(cls, name, func, params, domain, tol=1e-6):
+        """
+        Load the table for func with these constants from the cache, or
+        build and save it.
+
+        Args:
+            name: str, name of the function, part of the cache key
+            func: function of temperature and the params
+            params: dict of float, constants passed to func
+            domain, tol: see build
+        """
+        key = json.dumps({
+            'version': cache_version, 'name': name, 'params': params,
+            'domain': list(domain), 'tol': tol,
+        }, sort_keys=True)
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        path = os.path.join(cache_dir, f'{name}_{digest}.npz')
+        try:
+            with np.load(path) as saved:
+                return cls(saved['T'], saved['f'], float(saved['max_error']))
+        except (OSError, KeyError, ValueError):
+            pass
+        table = cls.build(lambda T: func(T, **params), domain, tol)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = path + f'.{os.getpid()}.tmp.npz'
+            np.savez(tmp, T=table.T, f=table.f, max_error=table.max_error)
+            os.replace(tmp, path)
+        except OSError:
+            # Can't write the cache, it just gets rebuilt next time
+            pass
+        return table
+
+    def __call__(self, f, f_err=None):
+        """
+        Temperature for values of the function.
+
+        Args:
+            f: array, e.g. measured widths or shifts
+            f_err: array, their std devs
+        Returns:
+            Array of temperatures, nan outside the table's domain, and if
+            f_err is given their std devs from dT/df * f_err.
+        """
+        T = self.inverse(f)
+        if f_err is None:
+            return T
+        return T, np.abs(self.slope(f)) * f_err
+
+
+def width_inverse(G0, Aw, Bw, w1, domain=(100, 400), tol=1e-6):
+    """Temperature from peak width, see width_func"""
+    params = {'G0': G0, 'Aw': Aw, 'Bw': Bw, 'w1': w1}
+    return InverseTable.cached('width', width_func, params, domain, tol)
+
+
+def shift_inverse(w0, A, B, domain=(100, 1500), tol=1e-6):
+    """Temperature from raman shift, see cui"""
+    params = {'w0': w0, 'A': A, 'B': B}
+    return InverseTable.cached('cui', cui, params, domain, tol)
@@ -0,0 +1,235 @@
+#!/usr/bin/python
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import shlex
+import subprocess
+import sys
+import time
+import traceback
+
+bee_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Each command's folder, module with a main(argv) and what it does. Nothing
+# is imported until a command is run, so only its own libraries are loaded
+commands = {
+    'fit-peaks': ('Week_7', 'fit_peaks',
+                  'fit the peaks of a spectrum by clicking on them'),
+    'batch-fit-peaks': ('Week_7', 'batch_fit_peaks',
+                        'fit every peak of many spectra without the GUI'),
+    'calibration': ('Week_7', 'calibration',
+                    'fit a pixel to wavelength calibration'),
+    'fit-session': ('Week_7', 'fit_session',
+                    "save a spectrum's fitted parameters from its session"),
+    'parabola': ('Week_7', 'parabola_fit',
+                 'fit a parabola to each drop, showing each one'),
+    'batch-parabola': ('Week_7', 'batch_parabola_fit',
+                       'fit the parabola of many drops'),
+    'position-temp': ('Week_9', 'r_position_vs_temp',
+                      'temperature against distance from the TLM'),
+    'laser-power': ('Week_9', 'laser_power_empirical',
+                    'fit the laser power calibration'),
+    'diffusion': ('Week_9', 'diffusion',
+                  'save an animation of heat spreading from a point'),
+    'heat-solver': ('Week_9', 'heat_solver',
+                    'check and time the heat equation solver'),
+    'benchmark': ('.', 'benchmark',
+                  'time each analysis on synthetic data'),
+}
+
+
+def load(command):
+    """Module of a command, imported the first time it's run"""
+    folder, module, _ = commands[command]
+    path = os.path.normpath(os.path.join(bee_dir, folder))
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    return importlib.import_module(module)
+
+
+def run(command, argv):
+    """
+    Run a command in this process.
+
+    Returns:
+        Exit status, 0 if it finished.
+    """
+    if command not in commands:
+        print(f'unknown command {command}, see --help', file=sys.stderr)
+        return 2
+    saved_argv = sys.argv
+    # so the command's usage reads e.g. bee.py laser-power
+    sys.argv = [f'{os.path.basename(saved_argv[0])} {command}', *argv]
+    try:
+        load(command).main(argv)
+    except SystemExit as e:
+        # argparse exits for --help and bad arguments
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    finally:
+        sys.argv = saved_argv
+    return 0
+
+
+def parse_job(line):
+    """
+    Command, arguments and folder of a job, either a command line like
+
+        laser-power --no-show log.txt
+
+    or JSON like {"command": "laser-power", "args": [...], "cwd": "..."}
+    """
+    line = line.strip()
+    if line.startswith('{'):
+        job = json.loads(line)
+        return job['command'], list(job.get('args', [])), job.get('cwd')
+    command, *argv = shlex.split(line)
+    return command, argv, None
+
+
+def run_job(command, argv, cwd=None):
+    """
+    Run a command as a job of a worker, keeping its output.
+
+    Returns:
+        Dict of the exit status, time taken, stdout and stderr.
+    """
+    stdout, stderr = io.StringIO(), io.StringIO()
+    start = time.perf_counter()
+    previous = os.getcwd()
+    try:
+        if cwd is not None:
+            os.chdir(cwd)
+        with contextlib.redirect_stdout(stdout), \
+                contextlib.redirect_stderr(stderr):
+            status = run(command, argv)
+    except Exception:
+        stderr.write(traceback.format_exc())
+        status = 1
+    finally:
+        os.chdir(previous)
+        # figures left open would pile up over thousands of jobs
+        if 'matplotlib.pyplot' in sys.modules:
+            sys.modules['matplotlib.pyplot'].close('all')
+    return {
+        'command': command,
+        'status': status,
+        'seconds': time.perf_counter() - start,
+        'stdout': stdout.getvalue(),
+        'stderr': stderr.getvalue(),
+    }
+
+
+def worker(jobs, results, preload=()):
+    """
+    Run jobs one after another in this process, so each one after the
+    first for a command skips starting Python and importing its libraries.
+
+    Args:
+        jobs: iterable of lines, see parse_job, blank lines are skipped
+        results: file a line of JSON is written to as each job finishes,
+            see run_job, with the number of the job as 'job'
+        preload: commands to import before the first job
+    """
+    # there's no one to look at a window
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    for command in preload:
+        load(command)
+    for number, line in enumerate(line for line in jobs if line.strip()):
+        try:
+            result = run_job(*parse_job(line))
+        except (ValueError, KeyError) as e:
+            result = {'command': None, 'status': 2, 'seconds': 0,
+                      'stdout': '', 'stderr': f'bad job {line!r}: {e}\n'}
+        result['job'] = number
+        results.write(json.dumps(result) + '\n')
+        results.flush()
+
+
+class Worker:
+    """
+    A worker process kept running to send many jobs to from Python.
+
+        with Worker(preload=['laser-power']) as bee:
+            for path in paths:
+                result = bee.run('laser-power', '--no-show', path)
+    """
+
+    def __init__(self, preload=(), python=sys.executable):
+        args = [python, os.path.abspath(__file__), 'worker']
+        if preload:
+            args += ['--preload', *preload]
+        self.process = subprocess.Popen(
+            args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+            bufsize=1,
+        )
+
+    def run(self, command, *args, cwd=None):
+        """Run a job and wait for its result, see run_job"""
+        job = {'command': command, 'args': [str(a) for a in args],
+               'cwd': cwd}
+        self.process.stdin.write(json.dumps(job) + '\n')
+        self.process.stdin.flush()
+        line = self.process.stdout.readline()
+        if not line:
+            raise RuntimeError('the worker process has stopped')
+        return json.loads(line)
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    parser = argparse.ArgumentParser(
+        description='Run any of the Bee analyses, pass --help after a '
+                    'command for its own arguments',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='commands:\n' + '\n'.join(
+            f'  {name:<16}{help}' for name, (_, _, help) in commands.items()
+        ) + '\n  worker          run jobs read from stdin, one per line, '
+            'see worker --help',
+    )
+    parser.add_argument('command', choices=[*commands, 'worker'],
+                        metavar='command')
+    parser.add_argument('args', nargs=argparse.REMAINDER)
+    # only the command is parsed here, the rest is for the command itself
+    args = parser.parse_args(argv[:1])
+    if args.command != 'worker':
+        return run(args.command, argv[1:])
+
+    worker_parser = argparse.ArgumentParser(
+        prog=f'{parser.prog} worker',
+        description='Stay running and take jobs from stdin, one per line, '
+                    'either a command line or JSON of command, args and cwd, '
+                    'writing a line of JSON with the status, time and output '
+                    'of each to stdout as it finishes',
+    )
+    worker_parser.add_argument('--preload', nargs='*', default=[],
+                               choices=list(commands), metavar='COMMAND',
+                               help='import these commands before any job')
+    worker_parser.add_argument('--jobs', default=None,
+                               help='file of jobs to run instead of stdin')
+    worker_args = worker_parser.parse_args(argv[1:])
+    if worker_args.jobs is None:
+        worker(sys.stdin, sys.stdout, worker_args.preload)
+    else:
+        with open(worker_args.jobs) as jobs:
+            worker(jobs, sys.stdout, worker_args.preload)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,364 @@
+#!/usr/bin/python
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+import synthetic_data
+
+bee_dir = os.path.dirname(os.path.abspath(__file__))
+# Each run is added to this, so slowdowns show up against earlier runs
+default_history_path = os.path.join(bee_dir, 'benchmark_history.json')
+# A stage this much slower than last time is flagged, unless it's too
+# quick for the difference to be more than noise
+regression_ratio = 1.2
+regression_min_seconds = 0.05
+
+# Base size of each benchmark's inputs, multiplied by --scale
+base_sizes = {
+    'fit_peaks': {'spectra': 8, 'peaks': 40},
+    'parabola_fit': {'drops': 200, 'frames': 25},
+    'r_position_vs_temp': {'rows': 100_000},
+    'laser_power_empirical': {'readings': 1_000_000},
+}
+
+
+def _use_weeks():
+    # the scripts import their neighbours by name
+    for week in ('Week_7', 'Week_9'):
+        path = os.path.join(bee_dir, week)
+        if path not in sys.path:
+            sys.path.append(path)
+
+
+class Stages:
+    """Time of each stage of a benchmark, in the order they ran"""
+
+    def __init__(self):
+        self.times = {}
+
+    @contextmanager
+    def time(self, name):
+        start = time.perf_counter()
+        yield
+        self.times[name] = self.times.get(name, 0) + time.perf_counter() - start
+
+
+def _render(specs, workers):
+    from plot_render import render
+    return render(specs, workers, skip_unchanged=False)
+
+
+def bench_fit_peaks(folder, sizes, workers):
+    """
+    Stages of fitting every peak of SpectraSuite spectra as
+    batch_fit_peaks.py does with voigt_lm.
+    """
+    from batch_fit_peaks import find_spectrum_peaks, save_table
+    from plot_render import FigureSpec
+    from spectrum_io import load_spectrum
+    import peak_detect
+    import voigt_lm
+    paths = []
+    for i in range(sizes['spectra']):
+        path = os.path.join(folder, f'spectrum_{i}.txt')
+        synthetic_data.spectrasuite_spectrum(path, sizes['peaks'], seed=i)
+        paths.append(path)
+    stages = Stages()
+    with stages.time('load'):
+        # parsing the file, not the cached array
+        spectra = [load_spectrum(path, cache=False)[:, 1] for path in paths]
+    with stages.time('find_peaks'):
+        # the whole stack in one call, as fit_spectra_vectorized does
+        stack_peaks = peak_detect.detect(np.stack(spectra))
+        found = [find_spectrum_peaks(I, peak_pix=peak_pix)
+                 for I, peak_pix in zip(spectra, stack_peaks)]
+    with stages.time('fit'):
+        fits = voigt_lm.fit_windows(
+            spectra, [f[1] for f in found], [f[2] for f in found],
+            [f[0] for f in found],
+        )
+    with stages.time('aggregate'):
+        save_table(os.path.join(folder, 'fitted_params.txt'), paths, fits)
+    with stages.time('render'):
+        specs = []
+        for i, (I, fit) in enumerate(zip(spectra, fits)):
+            spec = FigureSpec(os.path.join(folder, f'spectrum_{i}.png'))
+            spec.ax.plot(I, lw=0.5)
+            spec.ax.plot(fit[:, 0], fit[:, 2] + fit[:, 6], 'x')
+            specs.append(spec)
+        _render(specs, workers)
+    return stages.times
+
+
+def bench_parabola_fit(folder, sizes, workers):
+    """Stages of fitting drop trajectories as batch_parabola_fit.py does"""
+    from batch_parabola_fit import (drop_figure, drop_name, fit_quadratics,
+                                    load_drop, max_drop)
+    paths = []
+    for i in range(sizes['drops']):
+        path = os.path.join(folder, f'2022_air_{i}.txt')
+        synthetic_data.drop_trajectory(path, sizes['frames'], seed=i)
+        paths.append(path)
+    stages = Stages()
+    with stages.time('load'):
+        drops = [load_drop(path) for path in paths]
+    with stages.time('fit'):
+        ys = [y for y, spread in drops]
+        params, covar = fit_quadratics(ys)
+    with stages.time('aggregate'):
+        xmax, ymax = max_drop(params, covar)
+        output = np.column_stack((
+            [drop_name(path)[0] for path in paths],
+            [str(L) for L in ymax.to_ufloats()],
+        ))
+        np.savetxt(os.path.join(folder, 'output.txt'), output, fmt='%s')
+    with stages.time('render'):
+        # a figure per drop is the slow part at scale, 50 is plenty to time
+        specs = [
+            drop_figure(
+                os.path.join(folder, f'air{i + 1}parabola.png'), 'air', i + 1,
+                ys[i], params[i], (xmax.value[i], xmax.std[i]),
+                (ymax.value[i], ymax.std[i]),
+            )
+            for i in range(min(50, len(ys)))
+        ]
+        _render(specs, workers)
+    return stages.times
+
+
+def bench_r_position_vs_temp(folder, sizes, workers):
+    """
+    Stages of averaging a Raman temperature map as r_position_vs_temp.py
+    does, the file is read in full before it's averaged so the two can be
+    timed apart.
+    """
+    from grouped_stats import GroupedMean
+    from materials import MaterialRegistry
+    from plot_render import FigureSpec
+    from position_index import PositionIndex
+    import raman_stream
+    path = os.path.join(folder, 'raman_map.txt')
+    csv_path = os.path.join(folder, 'SiC_distance_measurements.csv')
+    synthetic_data.raman_map(path, sizes['rows'], seed=0)
+    synthetic_data.distance_table(csv_path, seed=0)
+    materials = MaterialRegistry.load()
+    stages = Stages()
+    with stages.time('load'):
+        chunks = list(raman_stream.iter_chunks(path, 16))
+        positions = PositionIndex.load(csv_path)
+    with stages.time('aggregate'):
+        means = GroupedMean()
+        for nominal, std in chunks:
+            distance = positions.distance(nominal[:, 0])
+            keys = np.column_stack((nominal[:, 1], distance))
+            means.update(keys, nominal[:, [6, 13]], std[:, [6, 13]])
+        keys, avg, avg_err, runs = means.result()
+    with stages.time('fit'):
+        material = materials['SiC']
+        T_shift, T_shift_err = material.shift_to_temp(avg[:, 0], avg_err[:, 0])
+        T_width, T_width_err = material.width_to_temp(avg[:, 1], avg_err[:, 1])
+    with stages.time('render'):
+        specs = []
+        for name, column in (('shift', 0), ('width', 1)):
+            spec = FigureSpec(os.path.join(folder, f'avg_{name}.png'))
+            spec.ax.errorbar(keys[:, 1], avg[:, column],
+                             yerr=avg_err[:, column], fmt='x')
+            specs.append(spec)
+        spec = FigureSpec(os.path.join(folder, 'temp_v_pos.png'))
+        spec.ax.errorbar(keys[:, 1], T_shift, fmt='o')
+        spec.ax.errorbar(keys[:, 1], T_width, fmt='^')
+        specs.append(spec)
+        _render(specs, workers)
+    return stages.times
+
+
+def bench_laser_power_empirical(folder, sizes, workers):
+    """
+    Stages of a laser power calibration as laser_power_empirical.py does,
+    the file is read in full before it's averaged so the two can be timed
+    apart.
+    """
+    from grouped_stats import GroupedMoments
+    from plot_render import FigureSpec
+    from power_calibration import PowerCalibration
+    import raman_stream
+    path = os.path.join(folder, 'power_log.txt')
+    synthetic_data.power_log(path, sizes['readings'], seed=0)
+    stages = Stages()
+    with stages.time('load'):
+        chunks = list(raman_stream.iter_chunks(path, 2))
+    with stages.time('aggregate'):
+        moments = GroupedMoments()
+        for nominal, std in chunks:
+            moments.update(nominal[:, 0], nominal[:, 1])
+    with stages.time('fit'):
+        calibration = PowerCalibration.from_moments(moments)
+        calibration.save(os.path.join(folder, 'power_calibration.json'))
+    with stages.time('render'):
+        spec = FigureSpec(os.path.join(folder, 'power_calibration.png'))
+        spec.ax.plot(calibration.setpoints, calibration.mean, 'x')
+        xspace = np.linspace(0, 100, 21)
+        spec.ax.plot(xspace, calibration.power(xspace)[0])
+        _render([spec], workers)
+    return stages.times
+
+
+benchmarks = {
+    'fit_peaks': bench_fit_peaks,
+    'parabola_fit': bench_parabola_fit,
+    'r_position_vs_temp': bench_r_position_vs_temp,
+    'laser_power_empirical': bench_laser_power_empirical,
+}
+
+
+def scaled_sizes(name, scale):
+    """Sizes of a benchmark's inputs, counts of files and rows scaled"""
+    sizes = dict(base_sizes[name])
+    # peaks per spectrum and frames per drop stay realistic
+    for key in sizes:
+        if key not in ('peaks', 'frames'):
+            sizes[key] = max(1, int(sizes[key] * scale))
+    return sizes
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=bee_dir,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def previous_run(history, name, sizes):
+    """Latest run in history of the same benchmark at the same sizes"""
+    for record in reversed(history):
+        if record['benchmark'] == name and record['sizes'] == sizes:
+            return record
+    return None
+
+
+def run(names, scale=1, workers=None, history_path=default_history_path,
+        repeat=1):
+    """
+    Run benchmarks on synthetic inputs and add them to the history.
+
+    Args:
+        names: list of str, keys of benchmarks
+        scale: float, multiplies the size of every input
+        workers: int, processes used to render, 0 for this one
+        history_path: str, JSON list of every run, or None to not save
+        repeat: int, run each this many times and keep the fastest of
+            each stage
+    Returns:
+        List of the new records.
+    """
+    _use_weeks()
+    history = load_history(history_path) if history_path else []
+    records = []
+    for name in names:
+        sizes = scaled_sizes(name, scale)
+        best = {}
+        for _ in range(repeat):
+            with tempfile.TemporaryDirectory() as folder:
+                times = benchmarks[name](folder, sizes, workers)
+            for stage, seconds in times.items():
+                best[stage] = min(seconds, best.get(stage, np.inf))
+        record = {
+            'benchmark': name,
+            'sizes': sizes,
+            'stages': best,
+            'total': sum(best.values()),
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'workers': workers,
+        }
+        print_record(record, previous_run(history, name, sizes))
+        history.append(record)
+        records.append(record)
+    if history_path:
+        with open(history_path, 'w') as f:
+            json.dump(history, f, indent=1)
+    return records
+
+
+def print_record(record, previous=None):
+    """Print each stage's time, and how it compares with the previous run"""
+    sizes = ', '.join(f'{k}={v}' for k, v in record['sizes'].items())
+    print(f'{record["benchmark"]} ({sizes})')
+    for stage, seconds in list(record['stages'].items()) + [
+            ('total', record['total'])]:
+        line = f'  {stage:<12}{seconds:10.4f} s'
+        if previous is not None:
+            before = (previous['total'] if stage == 'total'
+                      else previous['stages'].get(stage))
+            if before:
+                ratio = seconds / before
+                line += f'  {ratio:5.2f}x of {previous["commit"] or "last run"}'
+                if (ratio > regression_ratio
+                        and seconds - before > regression_min_seconds):
+                    line += '  slower'
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Time the stages of each analysis script on synthetic '
+                    'data, adding the results to a history'
+    )
+    parser.add_argument('benchmarks', nargs='*', default=list(benchmarks),
+                        help=f'any of {", ".join(benchmarks)}, all by default')
+    parser.add_argument('--scale', type=float, default=1,
+                        help='multiplies the number of files and rows')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='keep the fastest of this many runs of each stage')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='processes drawing figures, 0 to draw them in '
+                             'this one')
+    parser.add_argument('--history', default=default_history_path,
+                        help='JSON file the results are added to')
+    parser.add_argument('--no-history', action='store_true',
+                        help="don't save the results")
+    parser.add_argument('--make-data', default=None, metavar='FOLDER',
+                        help='just save a set of synthetic inputs to FOLDER')
+    args = parser.parse_args(argv)
+
+    import matplotlib
+    matplotlib.use('Agg')
+    if args.make_data is not None:
+        _use_weeks()
+        paths = synthetic_data.make_all(args.make_data, args.scale)
+        for kind, kind_paths in paths.items():
+            print(f'{kind}: {len(kind_paths)} files')
+        return
+    unknown = set(args.benchmarks) - set(benchmarks)
+    if unknown:
+        parser.error(f'unknown benchmarks {", ".join(sorted(unknown))}')
+    run(args.benchmarks, args.scale, args.workers,
+        None if args.no_history else args.history, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+import hashlib
+import json
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+# Bump if the way specs are drawn changes, so old figures are redrawn
+render_version = 1
+# Hashes of the figures already saved, one file in each output folder
+index_name = '.plot_render.json'
+
+# Artists that can be made in a spec, e.g. for legend handles and patches
+artist_classes = {
+    'Line2D': ('matplotlib.lines', 'Line2D'),
+    'Circle': ('matplotlib.patches', 'Circle'),
+    'Rectangle': ('matplotlib.patches', 'Rectangle'),
+    'Patch': ('matplotlib.patches', 'Patch'),
+}
+
+
+class Ref:
+    """
+    Stands in for what a recorded call returns, e.g. the Line2D from
+    ax.plot, until the figure is drawn.
+    """
+
+    def __init__(self, call, index=()):
+        self.call = call
+        self.index = index
+
+    def __getitem__(self, i):
+        return Ref(self.call, self.index + (i,))
+
+    def __iter__(self):
+        # So points, = ax.plot(...) works as with matplotlib
+        yield self[0]
+
+
+class Artist:
+    """An artist to be made when the figure is drawn, e.g. Artist('Line2D', [0], [0])"""
+
+    def __init__(self, name, *args, **kwargs):
+        if name not in artist_classes:
+            raise ValueError(f'unknown artist {name}')
+        self.name = name
+        self.args = args
+        self.kwargs = kwargs
+
+
+class _Recorder:
+    """Records method calls on a figure or axes to replay later"""
+
+    def __init__(self, spec, target):
+        self._spec = spec
+        self._target = target
+
+    def __getattr__(self, method):
+        if method.startswith('__'):
+            raise AttributeError(method)
+
+        def record(*args, **kwargs):
+            return self._spec._record(self._target, method, args, kwargs)
+        return record
+
+
+class FigureSpec:
+    """
+    Description of a figure with one axes, built up with the same calls as
+    a matplotlib figure (spec.ax.errorbar(...), spec.ax.set_xlabel(...))
+    but only drawn when it's rendered, usually in another process.
+    """
+
+    def __init__(self, path, figsize=None, rc=None, savefig_kw=None):
+        """
+        Args:
+            path: str, where to save the figure, the extension picks the
+                format, .pgf is saved with the PGF backend and anything
+                else with Agg
+            figsize: (float, float), size in inches
+            rc: dict, rcParams to draw the figure with
+            savefig_kw: dict, keyword arguments for savefig
+        """
+        self.path = path
+        self.figsize = figsize
+        self.rc = dict(rc or {})
+        self.savefig_kw = dict(savefig_kw or {})
+        self.calls = []
+        self.fig = _Recorder(self, 'fig')
+        self.ax = _Recorder(self, 'ax')
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['fig'], state['ax']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.fig = _Recorder(self, 'fig')
+        self.ax = _Recorder(self, 'ax')
+
+    def _record(self, target, method, args, kwargs):
+        self.calls.append((target, method, args, kwargs))
+        return Ref(len(self.calls) - 1)
+
+    def content_hash(self):
+        """Hash of everything that affects the saved figure"""
+        import matplotlib
+        state = (
+            render_version, matplotlib.__version__, os.path.basename(self.path),
+            self.figsize, sorted(self.rc.items()),
+            sorted(self.savefig_kw.items()), self.calls,
+        )
+        return hashlib.sha256(pickle.dumps(state, protocol=4)).hexdigest()
+
+    def draw(self, fig=None):
+        """
+        Replay the recorded calls onto a figure.
+
+        Args:
+            fig: matplotlib Figure, a new one (not managed by pyplot) if None
+        Returns:
+            The figure.
+        """
+        import importlib
+        from matplotlib.figure import Figure
+        if fig is None:
+            fig = Figure(figsize=self.figsize)
+        ax = fig.add_subplot()
+        targets = {'fig': fig, 'ax': ax}
+        results = []
+
+        def resolve(value):
+            if isinstance(value, Ref):
+                result = results[value.call]
+                for i in value.index:
+                    result = result[i]
+                return result
+            if isinstance(value, Artist):
+                module, name = artist_classes[value.name]
+                cls = getattr(importlib.import_module(module), name)
+                return cls(*resolve(value.args), **resolve(value.kwargs))
+            if isinstance(value, (list, tuple)):
+                return type(value)(resolve(v) for v in value)
+            if isinstance(value, dict):
+                return {k: resolve(v) for k, v in value.items()}
+            return value
+
+        for target, method, args, kwargs in self.calls:
+            results.append(
+                getattr(targets[target], method)(*resolve(args), **resolve(kwargs))
+            )
+        return fig
+
+    def save(self):
+        """Draw the figure and save it to path"""
+        import matplotlib
+        with matplotlib.rc_context(self.rc):
+            fig = self.draw()
+            kwargs = dict(self.savefig_kw)
+            if self.path.endswith('.pgf'):
+                kwargs['backend'] = 'pgf'
+            else:
+                from matplotlib.backends.backend_agg import FigureCanvasAgg
+                FigureCanvasAgg(fig)
+            fig.savefig(self.path, **kwargs)
+        return self.path
+
+    def show(self):
+        """Draw the figure with pyplot, for plt.show()"""
+        import matplotlib
+        import matplotlib.pyplot as plt
+        with matplotlib.rc_context(self.rc):
+            return self.draw(plt.figure(figsize=self.figsize))
+
+
+def _render(spec):
+    return spec.save()
+
+
+def _read_index(folder):
+    try:
+        with open(os.path.join(folder, index_name)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class Renderer:
+    """
+    Renders FigureSpecs in a pool of processes while the analysis carries
+    on, skipping figures whose file is already saved from the same spec.
+
+    Use as a context manager, leaving it waits for every figure:
+
+        with Renderer() as renderer:
+            renderer.submit(spec)
+    """
+
+    def __init__(self, workers=None, skip_unchanged=True):
+        """
+        Args:
+            workers: int, number of processes, 0 to draw in this process
+            skip_unchanged: bool, don't redraw figures with the same hash
+        """
+        self.workers = workers
+        self.skip_unchanged = skip_unchanged
+        self.pool = None
+        self.pending = []
+        self.skipped = []
+        self._indexes = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.wait()
+
+    def submit(self, spec):
+        """
+        Start rendering spec, unless the saved figure is already up to
+        date.
+
+        Returns:
+            True if the figure will be drawn, False if it was skipped.
+        """
+        digest = spec.content_hash()
+        folder = os.path.dirname(os.path.abspath(spec.path))
+        name = os.path.basename(spec.path)
+        if folder not in self._indexes:
+            self._indexes[folder] = _read_index(folder)
+        if (self.skip_unchanged and os.path.exists(spec.path)
+                and self._indexes[folder].get(name) == digest):
+            self.skipped.append(spec.path)
+            return False
+        if self.workers == 0:
+            future = None
+            spec.save()
+        else:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(self.workers)
+            future = self.pool.submit(_render, spec)
+        self.pending.append((spec.path, folder, name, digest, future))
+        return True
+
+    def wait(self):
+        """
+        Wait for every submitted figure, and record their hashes.
+
+        Returns:
+            List of paths of the figures drawn.
+        """
+        done = []
+        error = None
+        indexes = {}
+        for path, folder, name, digest, future in self.pending:
+            if future is not None and future.exception() is not None:
+                # Keep the figures that did work, then raise
+                error = error or future.exception()
+                continue
+            indexes.setdefault(folder, {})[name] = digest
+            done.append(path)
+        self.pending = []
+        for folder, hashes in indexes.items():
+            index = _read_index(folder)
+            index.update(hashes)
+            self._indexes[folder] = index
+            try:
+                with open(os.path.join(folder, index_name), 'w') as f:
+                    json.dump(index, f, indent=1, sort_keys=True)
+            except OSError:
+                # Can't write the index, figures are just redrawn next time
+                pass
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        if error is not None:
+            raise error
+        return done
+
+
+def render(specs, workers=None, skip_unchanged=True):
+    """
+    Render every spec in a pool of processes.
+
+    Returns:
+        List of paths of the figures drawn, those skipped aren't included.
+    """
+    with Renderer(workers, skip_unchanged) as renderer:
+        for spec in specs:
+            renderer.submit(spec)
+        return renderer.wait()
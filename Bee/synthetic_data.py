@@ -0,0 +1,182 @@
+import os
+
+import numpy as np
+from scipy.special import voigt_profile
+
+# Header of a SpectraSuite file, the number of pixels is filled in
+spectrasuite_header = '''SpectraSuite Data File
+++++++++++++++++++++++++++++++++++++
+Date: Mon Nov 28 12:21:00 GMT 2022
+User: synthetic
+Dark Spectrum Present: No
+Reference Spectrum Present: No
+Number of Sampled Component Spectra: 1
+Spectrometers: HR4C
+Integration Time (usec): 100000
+Spectra Averaged: 1
+Boxcar Smoothing: 0
+Correct for Electrical Dark: No
+Strobe/Lamp Enabled: No
+Correct for Detector Non-linearity: No
+Correct for Stray Light: No
+Number of Pixels in Processed Spectrum: {num_pixels}
+>>>>>Begin Processed Spectral Data<<<<<
+'''
+spectrasuite_footer = '>>>>>End Processed Spectral Data<<<<<\n'
+
+
+def spectrasuite_spectrum(path, num_peaks=40, num_pixels=3648, seed=None):
+    """
+    Save a SpectraSuite spectrum of Voigt peaks on a flat background of
+    ~1000 counts, the peaks all above fit_peaks.py's threshold of 1090.
+
+    Args:
+        path: str, where to save it
+        num_peaks: int, number of peaks, spread over the whole detector
+        num_pixels: int, number of pixels
+        seed: int, for the same spectrum every time
+    Returns:
+        Array of the true center of each peak in pixels.
+    """
+    rng = np.random.default_rng(seed)
+    pix = np.arange(num_pixels)
+    # keep peaks apart so each has its own window
+    centers = np.sort(rng.choice(
+        np.arange(50, num_pixels - 50, 20), num_peaks, replace=False
+    ) + rng.uniform(-3, 3, num_peaks))
+    intensity = 1000 + rng.normal(0, 3, num_pixels)
+    for center in centers:
+        intensity += (rng.uniform(2500, 15000)
+                      * voigt_profile(pix - center, 1.5, 1.5))
+    wavelength = np.linspace(200, 1100, num_pixels)
+    with open(path, 'w') as f:
+        f.write(spectrasuite_header.format(num_pixels=num_pixels))
+        np.savetxt(f, np.column_stack((wavelength, intensity)),
+                   fmt='%.2f', delimiter='\t')
+        f.write(spectrasuite_footer)
+    return centers
+
+
+def raman_map(path, num_rows, refs=(1, 2, 3), voltages=(10, 15, 20),
+              material=None, seed=None):
+    """
+    Save a 16 column Raman temperature map in the uncertainties format
+    r_position_vs_temp.py reads, reference number in column 0, voltage in
+    1, shift in 6 and width in 13, the rest noise.
+
+    Rows come in runs of one voltage and position, as they're measured,
+    hotter nearer the TLM and at higher voltages.
+
+    Args:
+        path: str, where to save it
+        num_rows: int, roughly the number of rows
+        refs: reference numbers of the positions, see distance_table
+        voltages: voltages of each run
+        material: materials.Material the shifts and widths are made with,
+            SiC from Week_9's materials.json by default
+        seed: int
+    """
+    from materials import MaterialRegistry, room_temp
+    if material is None:
+        material = MaterialRegistry.load()['SiC']
+    rng = np.random.default_rng(seed)
+    per_run = max(1, num_rows // (len(refs) * len(voltages)))
+    ref = np.repeat(np.tile(np.asarray(refs, dtype=float), len(voltages)),
+                    per_run)
+    voltage = np.repeat(np.asarray(voltages, dtype=float),
+                        len(refs) * per_run)
+    num = len(ref)
+    nominal = rng.normal(1, 0.1, (num, 16))
+    std = np.abs(rng.normal(0.01, 0.002, (num, 16)))
+    nominal[:, 0], std[:, 0] = ref, 0
+    nominal[:, 1], std[:, 1] = voltage, 0
+    T = 300 + 2 * voltage + 10 / ref
+    # measured shifts are offset from cui, shift_to_temp corrects by
+    # room_temp_shift_correction
+    nominal[:, 6] = (material.cui(T) - material.cui(room_temp)
+                     + material.nominal['room_temp_shift_correction']
+                     + rng.normal(0, 0.05, num))
+    std[:, 6] = 0.05
+    nominal[:, 13] = material.width(T) + rng.normal(0, 0.02, num)
+    std[:, 13] = 0.03
+    # nominal+/-std in every column
+    fields = np.empty((num, 32))
+    fields[:, 0::2], fields[:, 1::2] = nominal, std
+    np.savetxt(path, fields, fmt=' '.join(['%.6f+/-%.6f'] * 16))
+
+
+def distance_table(path, refs=(1, 2, 3), seed=None):
+    """
+    Save positions of the reference points like
+    SiC_distance_measurements.csv, reference number, two unused columns,
+    then x and y in um.
+    """
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform(20, 350, (len(refs), 2))
+    with open(path, 'w') as f:
+        for ref, (x, y) in zip(refs, xy):
+            f.write(f'{ref},a,b,{x:.1f},{y:.1f}\n')
+
+
+def drop_trajectory(path, num_frames=25, seed=None):
+    """
+    Save the Lmin and Lmax of a drop in each frame, a parabola with some
+    scatter, like the parabola_fit.py inputs.
+
+    Returns:
+        The true maximum height.
+    """
+    rng = np.random.default_rng(seed)
+    frame = np.arange(num_frames)
+    top = rng.uniform(60, 75)
+    turn = rng.uniform(0.4, 0.6) * num_frames
+    height = top - rng.uniform(0.02, 0.05) * (frame - turn)**2
+    spread = np.abs(rng.normal(0.5, 0.2, num_frames))
+    centre = height + rng.normal(0, 0.2, num_frames)
+    np.savetxt(path, np.column_stack((centre - spread, centre + spread)),
+               fmt='%.2f', header='Lmin Lmax')
+    return top
+
+
+def power_log(path, num_readings, setpoints=(5, 10, 15, 20, 25, 30, 35, 40,
+                                             60, 80, 100), seed=None):
+    """
+    Save a power meter log of percent and mW, the setpoints visited in a
+    random order with a run of readings at each, like
+    laser_power_empirical.txt.
+    """
+    rng = np.random.default_rng(seed)
+    per_run = 5
+    runs = max(1, num_readings // per_run)
+    percent = np.repeat(rng.choice(setpoints, runs), per_run).astype(float)
+    mW = 0.35 * percent + 0.3 + rng.normal(0, 0.3, len(percent))
+    np.savetxt(path, np.column_stack((percent, mW)), fmt='%g %.3f',
+               header='percent empirical')
+
+
+def make_all(folder, scale=1, seed=0):
+    """
+    Save a set of every kind of input to folder, sized by scale.
+
+    Returns:
+        Dict of the kind of input to a list of paths.
+    """
+    os.makedirs(folder, exist_ok=True)
+    paths = {'spectra': [], 'raman': [], 'drops': [], 'power': []}
+    for i in range(max(1, int(8 * scale))):
+        path = os.path.join(folder, f'spectrum_{i}.txt')
+        spectrasuite_spectrum(path, seed=seed + i)
+        paths['spectra'].append(path)
+    path = os.path.join(folder, 'raman_map.txt')
+    raman_map(path, int(100_000 * scale), seed=seed)
+    distance_table(os.path.join(folder, 'SiC_distance_measurements.csv'),
+                   seed=seed)
+    paths['raman'].append(path)
+    for i in range(max(1, int(200 * scale))):
+        path = os.path.join(folder, f'drop_{i}.txt')
+        drop_trajectory(path, seed=seed + i)
+        paths['drops'].append(path)
+    path = os.path.join(folder, 'power_log.txt')
+    power_log(path, int(1_000_000 * scale), seed=seed)
+    paths['power'].append(path)
+    return paths
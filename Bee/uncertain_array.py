@@ -0,0 +1,263 @@
+import itertools
+
+import numpy as np
+
+# Each independent source of uncertainty gets a new id
+_source_ids = itertools.count()
+
+
+def _value(x):
+    return x.value if isinstance(x, UArray) else np.asarray(x, dtype=float)
+
+
+def _derivs(x):
+    return x.derivs if isinstance(x, UArray) else {}
+
+
+class UArray:
+    """
+    Array of values with standard uncertainties, for linear error propagation
+    over whole columns of data rather than arrays of ufloat objects.
+
+    It holds a float array of values and, for each independent source of
+    uncertainty, a float array of the derivative of the values with respect
+    to that source, which is scaled to unit variance. A value and std dev
+    array is one source with k=1, and correlated inputs (e.g. fitted
+    parameters with their covariance) are one source with k components,
+    so using the same UArray more than once keeps its correlations.
+
+    Operations are elementwise (arithmetic, exp, log, sqrt...) and
+    broadcast like numpy, reductions over elements aren't supported.
+    """
+
+    def __init__(self, value, std=None):
+        """
+        Args:
+            value: array of values
+            std: array of std devs, independent of each other and
+                everything else
+        """
+        self.value = np.asarray(value, dtype=float)
+        self.derivs = {}
+        if std is not None:
+            std = np.asarray(std, dtype=float)
+            self.derivs[next(_source_ids)] = std[..., None]
+
+    @classmethod
+    def _new(cls, value, derivs):
+        new = cls.__new__(cls)
+        new.value = value
+        new.derivs = derivs
+        return new
+
+    @classmethod
+    def correlated(cls, values, covariance):
+        """
+        Correlated values, e.g. fitted parameters.
+
+        Args:
+            values: array (..., k), the last axis is the correlated values
+            covariance: array (..., k, k), their covariance
+        Returns:
+            List of k UArrays, one for each value.
+        """
+        values = np.asarray(values, dtype=float)
+        covariance = np.asarray(covariance, dtype=float)
+        # x = values + L z, with L L^T = covariance and z unit normals
+        try:
+            L = np.linalg.cholesky(covariance)
+        except np.linalg.LinAlgError:
+            # Singular (e.g. a fixed parameter), use the eigenvectors instead
+            w, v = np.linalg.eigh(covariance)
+            L = v * np.sqrt(np.clip(w, 0, None))[..., None, :]
+        source = next(_source_ids)
+        return [
+            cls._new(values[..., j], {source: L[..., j, :]})
+            for j in range(values.shape[-1])
+        ]
+
+    @classmethod
+    def from_ufloats(cls, values):
+        """
+        UArray from a ufloat or array of them. Correlations between them are
+        only kept for a single ufloat, so convert constants once and reuse
+        the UArray.
+        """
+        from uncertainties import unumpy as unp
+        if hasattr(values, 'derivatives'):
+            # A single ufloat, keep each of its variables as a source
+            components = values.error_components()
+            derivs = {}
+            for var, component in components.items():
+                derivs[var] = np.array([component])
+            return cls._new(np.array(values.nominal_value), derivs)
+        return cls(unp.nominal_values(values), unp.std_devs(values))
+
+    def to_ufloats(self):
+        """
+        Array of ufloats with the same values and std devs, correlations
+        between elements are dropped.
+        """
+        from uncertainties import unumpy as unp
+        return unp.uarray(self.value, self.std)
+
+    @property
+    def nominal(self):
+        return self.value
+
+    @property
+    def variance(self):
+        variance = np.zeros(self.shape)
+        for d in self.derivs.values():
+            variance = variance + np.sum(d**2, axis=-1)
+        return variance
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+    def covariance(self, other):
+        """Elementwise covariance with another UArray"""
+        total = np.zeros(np.broadcast_shapes(self.shape, other.shape))
+        for source, d in self.derivs.items():
+            if source in other.derivs:
+                total = total + np.sum(d * other.derivs[source], axis=-1)
+        return total
+
+    @property
+    def shape(self):
+        return self.value.shape
+
+    @property
+    def ndim(self):
+        return self.value.ndim
+
+    def __len__(self):
+        return len(self.value)
+
+    def __repr__(self):
+        return f'UArray({self.value!r}, std={self.std!r})'
+
+    def __getitem__(self, index):
+        shape = self.shape
+        derivs = {}
+        for source, d in self.derivs.items():
+            d = np.broadcast_to(d, shape + d.shape[-1:])
+            derivs[source] = d[index]
+        return self._new(self.value[index], derivs)
+
+    def _apply(self, value, slope):
+        """Result of a function of self with derivative slope"""
+        slope = np.asarray(slope)[..., None]
+        derivs = {s: slope * d for s, d in self.derivs.items()}
+        return self._new(value, derivs)
+
+    @staticmethod
+    def _combine(value, x, dx, y, dy):
+        """Result of a function of x and y with partial derivatives dx, dy"""
+        derivs = {}
+        for source, d in _derivs(x).items():
+            derivs[source] = np.asarray(dx)[..., None] * d
+        for source, d in _derivs(y).items():
+            term = np.asarray(dy)[..., None] * d
+            derivs[source] = derivs[source] + term if source in derivs else term
+        return UArray._new(np.asarray(value, dtype=float), derivs)
+
+    def __add__(self, other):
+        return self._combine(self.value + _value(other), self, 1, other, 1)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return self._combine(self.value - _value(other), self, 1, other, -1)
+
+    def __rsub__(self, other):
+        return self._combine(_value(other) - self.value, other, 1, self, -1)
+
+    def __mul__(self, other):
+        x, y = self.value, _value(other)
+        return self._combine(x * y, self, y, other, x)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        x, y = self.value, _value(other)
+        return self._combine(x / y, self, 1 / y, other, -x / y**2)
+
+    def __rtruediv__(self, other):
+        x, y = _value(other), self.value
+        return self._combine(x / y, other, 1 / y, self, -x / y**2)
+
+    def __pow__(self, other):
+        x, y = self.value, _value(other)
+        value = x**y
+        dy = value * np.log(x) if isinstance(other, UArray) else 0
+        return self._combine(value, self, y * x**(y - 1), other, dy)
+
+    def __rpow__(self, other):
+        x, y = _value(other), self.value
+        value = x**y
+        return self._combine(value, other, y * x**(y - 1), self,
+                             value * np.log(x))
+
+    def __neg__(self):
+        return self._apply(-self.value, -1)
+
+    def __pos__(self):
+        return self
+
+    def __abs__(self):
+        return self._apply(np.abs(self.value), np.sign(self.value))
+
+    def exp(self):
+        value = np.exp(self.value)
+        return self._apply(value, value)
+
+    def expm1(self):
+        return self._apply(np.expm1(self.value), np.exp(self.value))
+
+    def log(self):
+        return self._apply(np.log(self.value), 1 / self.value)
+
+    def log1p(self):
+        return self._apply(np.log1p(self.value), 1 / (1 + self.value))
+
+    def sqrt(self):
+        value = np.sqrt(self.value)
+        return self._apply(value, 0.5 / value)
+
+    _ufuncs = {
+        np.add: '__add__', np.subtract: '__sub__', np.multiply: '__mul__',
+        np.true_divide: '__truediv__', np.power: '__pow__',
+        np.negative: '__neg__', np.absolute: '__abs__',
+        np.exp: 'exp', np.expm1: 'expm1', np.log: 'log', np.log1p: 'log1p',
+        np.sqrt: 'sqrt',
+    }
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        # So np.exp(u), np.sqrt(u) etc. work as they do on plain arrays
+        name = self._ufuncs.get(ufunc)
+        if method != '__call__' or name is None or kwargs:
+            return NotImplemented
+        if len(inputs) == 1:
+            return getattr(inputs[0], name)()
+        x, y = inputs
+        if isinstance(x, UArray):
+            return getattr(x, name)(y)
+        return getattr(y, '__r' + name[2:])(x)
+
+
+def exp(x):
+    return x.exp()
+
+
+def expm1(x):
+    return x.expm1()
+
+
+def log(x):
+    return x.log()
+
+
+def sqrt(x):
+    return x.sqrt()
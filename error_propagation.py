@@ -0,0 +1,103 @@
+import functools
+
+import numpy as np
+import sympy
+
+
+@functools.lru_cache(maxsize=256)
+def _compile(expr, symbols, error_symbols):
+    """
+    Value and gradient of expr as numpy functions of symbols.
+
+    Differentiating and lambdifying is the slow part, so it's done once for
+    each expression and kept.
+    """
+    value_func = sympy.lambdify(symbols, expr, 'numpy')
+    gradient = [sympy.diff(expr, s) for s in error_symbols]
+    gradient_func = sympy.lambdify(symbols, gradient, 'numpy', cse=True)
+    return value_func, gradient_func
+
+
+def _lookup(mapping, symbol):
+    """Entry of a dict keyed by either sympy symbols or their names"""
+    if symbol in mapping:
+        return mapping[symbol]
+    return mapping[str(symbol)]
+
+
+def _has(mapping, symbol):
+    return symbol in mapping or str(symbol) in mapping
+
+
+def gradient(expr, values, variables=None):
+    """
+    Partial derivatives of expr with respect to each of variables.
+
+    Args:
+        expr: sympy expression
+        values: dict of symbol (or its name): value or array of values
+        variables: list of symbols to differentiate by, defaults to the free
+            symbols of expr in order of name
+    Returns:
+        Array (..., len(variables)) of partial derivatives.
+    """
+    symbols = tuple(sorted(expr.free_symbols, key=str))
+    if variables is None:
+        variables = symbols
+    variables = tuple(sympy.sympify(v) for v in variables)
+    args = [np.asarray(_lookup(values, s), dtype=float) for s in symbols]
+    _, gradient_func = _compile(expr, symbols, variables)
+    shape = np.broadcast_shapes(*(a.shape for a in args))
+    # Constant derivatives come back as plain numbers
+    return np.stack(
+        [np.broadcast_to(g, shape) for g in gradient_func(*args)], axis=-1
+    )
+
+
+def propagate(expr, values, errors=None, covariance=None, variables=None):
+    """
+    Value of expr and its standard error from linear error propagation,
+
+        sigma_f^2 = sum_ij df/dx_i df/dx_j cov(x_i, x_j),
+
+    evaluated for whole arrays of measurements at once.
+
+    Args:
+        expr: sympy expression
+        values: dict of symbol (or its name): value or array of values
+        errors: dict of symbol (or its name): std dev or array of them,
+            symbols left out are taken as exact
+        covariance: array (..., k, k), covariance of variables, used
+            instead of errors for correlated variables
+        variables: list of the k symbols covariance is for, defaults to the
+            free symbols of expr in order of name
+    Returns:
+        Arrays of the value of expr and its standard error.
+    """
+    symbols = tuple(sorted(expr.free_symbols, key=str))
+    missing = [str(s) for s in symbols if not _has(values, s)]
+    if missing:
+        raise ValueError(f'no values given for {", ".join(missing)}')
+    if covariance is None:
+        errors = errors or {}
+        variables = tuple(s for s in symbols if _has(errors, s))
+    elif variables is None:
+        variables = symbols
+    variables = tuple(sympy.sympify(v) for v in variables)
+    args = [np.asarray(_lookup(values, s), dtype=float) for s in symbols]
+    value_func, gradient_func = _compile(expr, symbols, variables)
+    value = value_func(*args)
+    shape = np.broadcast_shapes(np.shape(value), *(a.shape for a in args))
+    value = np.broadcast_to(value, shape).astype(float)
+    if not variables:
+        return value, np.zeros(shape)
+    grads = gradient_func(*args)
+    if covariance is None:
+        # Independent variables, add the contributions in quadrature
+        variance = np.zeros(shape)
+        for g, s in zip(grads, variables):
+            variance = variance + (g * np.asarray(_lookup(errors, s)))**2
+    else:
+        grads = np.stack([np.broadcast_to(g, shape) for g in grads], axis=-1)
+        variance = np.einsum('...i,...ij,...j->...', grads, covariance, grads)
+    return value, np.sqrt(variance)
@@ -0,0 +1,127 @@
+import functools
+import math
+
+import numpy as np
+from scipy.special import gammaln
+
+# Coefficients of 1/N, 1/N^3, 1/N^5... in the Stirling series,
+# B_2k / (2k (2k-1)) with B_2k the Bernoulli numbers
+series_coefs = (
+    1/12, -1/360, 1/1260, -1/1680, 1/1188, -691/360360, 1/156,
+)
+# Below this the series isn't used, log(N!) is small enough to subtract
+# N log(N) - N from it without losing accuracy
+series_min_n = 10
+
+
+def log_n_pow_n_times_e_pow_minus_n(n):
+    """Logarithm of N^N * e^(-N), for arrays of N"""
+    n = np.asarray(n, dtype=float)
+    return n * np.log(n) - n
+
+
+def log_factorial(n):
+    """Logarithm of N! for arrays of N, from the log gamma function"""
+    return gammaln(np.asarray(n, dtype=float) + 1)
+
+
+def stirling_series(n, terms=6):
+    """
+    log(N!) - (N log(N) - N) from the asymptotic Stirling series
+
+        0.5 log(2 pi N) + 1/(12 N) - 1/(360 N^3) + 1/(1260 N^5) - ...
+
+    worked out directly, rather than as the difference of two numbers
+    that grow like N log(N), so it's accurate however big N is.
+
+    The terms alternate in sign and the error is smaller than the first
+    term left out, for every N > 0.
+
+    Args:
+        n: array of N > 0
+        terms: int, number of 1/N^k terms, up to len(series_coefs) - 1
+    Returns:
+        Arrays of the difference and a bound on its error.
+    """
+    n = np.asarray(n, dtype=float)
+    # 1/N squared rather than 1/N^2, which overflows for N > 1e154
+    power = 1 / n
+    inv_n2 = power**2
+    total = np.zeros_like(n)
+    for coef in series_coefs[:terms]:
+        total += coef * power
+        power = power * inv_n2
+    bound = abs(series_coefs[terms]) * power
+    return 0.5 * np.log(2 * np.pi * n) + total, bound
+
+
+def log_difference(n, terms=6):
+    """
+    log(N!) - (N log(N) - N) for arrays of N >= 1, exact from log gamma
+    for small N and from the Stirling series for the rest.
+    """
+    n = np.asarray(n, dtype=float)
+    small = n < series_min_n
+    series, bound = stirling_series(np.where(small, series_min_n, n), terms)
+    n_small = np.where(small, n, 1)
+    exact = log_factorial(n_small) - log_n_pow_n_times_e_pow_minus_n(n_small)
+    return np.where(small, exact, series)
+
+
+def comparison_details_log(n, threshold=0.01):
+    """
+    Compare log(N!) with log(N^N * e^(-N)) for arrays of N.
+
+    Returns:
+        Arrays of whether they're within threshold * N of each other, and
+        the difference.
+    """
+    n = np.asarray(n, dtype=float)
+    difference = np.abs(log_difference(n))
+    return difference <= threshold * n, difference
+
+
+def log_sweep(max_n=1e300, per_decade=20):
+    """
+    N spaced evenly in log from 1 to max_n, whole numbers while they're
+    small enough to be exactly represented.
+    """
+    n = np.logspace(0, np.log10(max_n), int(np.log10(max_n) * per_decade) + 1)
+    whole = n < 2**53
+    n[whole] = np.round(n[whole])
+    return np.unique(n)
+
+
+@functools.lru_cache(maxsize=None)
+def _summation_kernel():
+    """numba's parallel sum of log(i), or None if numba isn't installed"""
+    try:
+        import numba
+    except ImportError:
+        return None
+
+    @numba.njit(parallel=True)
+    def kernel(n):
+        total = 0.0
+        for i in numba.prange(1, n + 1):
+            total += math.log(i)
+        return total
+    return kernel
+
+
+def log_factorial_sum(n):
+    """
+    log(N!) by adding up log(i), for checking the others at small N. Uses
+    numba over every core if it's installed, otherwise numpy a block at a
+    time.
+    """
+    n = int(n)
+    kernel = _summation_kernel()
+    if kernel is not None:
+        return kernel(n)
+    total = 0.0
+    block = 1 << 20
+    for start in range(1, n + 1, block):
+        stop = min(start + block, n + 1)
+        total += np.sum(np.log(np.arange(start, stop, dtype=float)))
+    return total
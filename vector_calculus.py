@@ -0,0 +1,265 @@
+import functools
+import math
+
+import numpy as np
+import sympy
+
+x, y, z = sympy.symbols('x y z')
+
+
+@functools.lru_cache(maxsize=64)
+def _compile(components, symbols):
+    """
+    Each component, the divergence and each component of the curl of a
+    vector field as numpy functions of symbols.
+
+    The derivatives are worked out and lambdified once for each field and
+    kept.
+    """
+    a, b, c = symbols
+    Fx, Fy, Fz = components
+    divergence = sympy.diff(Fx, a) + sympy.diff(Fy, b) + sympy.diff(Fz, c)
+    curl = (
+        sympy.diff(Fz, b) - sympy.diff(Fy, c),
+        sympy.diff(Fx, c) - sympy.diff(Fz, a),
+        sympy.diff(Fy, a) - sympy.diff(Fx, b),
+    )
+    component_funcs = [sympy.lambdify(symbols, f, 'numpy') for f in components]
+    divergence_func = sympy.lambdify(symbols, divergence, 'numpy')
+    curl_funcs = [sympy.lambdify(symbols, f, 'numpy') for f in curl]
+    return component_funcs, divergence, divergence_func, curl, curl_funcs
+
+
+def grid(axes, dtype=np.float32):
+    """
+    Coordinates of a 3D grid that broadcast against each other, like
+    np.meshgrid(*axes, indexing='ij', sparse=True), so no full size copy
+    of each coordinate is made.
+    """
+    return tuple(
+        np.asarray(a, dtype=dtype).reshape([-1 if i == j else 1
+                                            for j in range(3)])
+        for i, a in enumerate(axes)
+    )
+
+
+def _slabs(shape, axis, max_points):
+    """Index of each slab of the grid along axis with about max_points in it"""
+    plane = math.prod(shape) // shape[axis]
+    size = max(1, max_points // plane)
+    for start in range(0, shape[axis], size):
+        index = [slice(None)] * len(shape)
+        index[axis] = slice(start, start + size)
+        yield tuple(index)
+
+
+def _evaluate(func, coords, index, dtype):
+    """func on the part of the grid at index, at full size and dtype"""
+    args = [c[tuple(s if c.shape[i] > 1 else slice(None)
+                    for i, s in enumerate(index))] for c in coords]
+    shape = np.broadcast_shapes(*(a.shape for a in args))
+    # constants and components that don't depend on every coordinate come
+    # back smaller than the slab
+    return np.broadcast_to(np.asarray(func(*args), dtype=dtype), shape)
+
+
+def derivative(f, h, axis, out, sign=1):
+    """
+    Add sign * df/dx along axis to out, from second order differences like
+    np.gradient(f, h, axis=axis, edge_order=2): central in the middle and
+    one sided at the two ends.
+
+    Args:
+        f: array, at least 3 points along axis
+        h: float, spacing of the points along axis
+        axis: int
+        out: array of f's shape, added to in place
+        sign: 1 or -1
+    """
+    def along(start, stop):
+        index = [slice(None)] * f.ndim
+        index[axis] = slice(start, stop)
+        return tuple(index)
+
+    scale = np.asarray(sign / (2 * h), dtype=out.dtype)
+    middle = np.subtract(f[along(2, None)], f[along(None, -2)])
+    middle *= scale
+    out[along(1, -1)] += middle
+    out[along(None, 1)] += scale * (-3*f[along(None, 1)] + 4*f[along(1, 2)]
+                                    - f[along(2, 3)])
+    out[along(-1, None)] += scale * (3*f[along(-1, None)] - 4*f[along(-2, -1)]
+                                     + f[along(-3, -2)])
+
+
+def lod_slices(shape, max_points):
+    """
+    Slices taking every k-th point along each axis of a grid, with k the
+    smallest that leaves at most max_points, for plotting a level of
+    detail that doesn't depend on the grid's resolution.
+    """
+    step = 1
+    while math.prod(-(-n // step) for n in shape) > max_points:
+        step += 1
+    return tuple(slice(None, None, step) for _ in shape)
+
+
+class VectorField:
+    """
+    3D vector field with a sympy expression for each component.
+
+    Divergence and curl are found either exactly, differentiating the
+    expressions once, or numerically from the components on a grid. The
+    numerical ones never hold more than one full size array, their
+    output: the grid is gone through a slab at a time, each component
+    worked out on the slab and differentiated straight into the output.
+
+        G = VectorField((4*x**3 + y, x + 2*y**2, 3*z**2))
+        axes = [np.linspace(-2, 2, 256)] * 3
+        div = G.divergence(axes)
+    """
+
+    def __init__(self, components, symbols=(x, y, z)):
+        """
+        Args:
+            components: three sympy expressions
+            symbols: the three sympy symbols they're functions of
+        """
+        self.components = tuple(sympy.sympify(f) for f in components)
+        self.symbols = tuple(symbols)
+        (self._component_funcs, self.exact_divergence, self._divergence_func,
+         self.exact_curl, self._curl_funcs) = _compile(self.components,
+                                                       self.symbols)
+
+    def __call__(self, x, y, z):
+        """Each component at arrays of x, y and z"""
+        shape = np.broadcast_shapes(np.shape(x), np.shape(y), np.shape(z))
+        return tuple(np.broadcast_to(f(x, y, z), shape)
+                     for f in self._component_funcs)
+
+    def divergence(self, axes, out=None, exact=False, dtype=np.float32,
+                   slab_points=1 << 20):
+        """
+        Divergence on a grid.
+
+        Args:
+            axes: three equally spaced 1D arrays, at least 3 points each
+            out: array of the grid's shape to put it in, or None for a new
+                one
+            exact: bool, evaluate the exact divergence rather than
+                differentiate numerically
+            dtype: of the output and the working arrays
+            slab_points: int, roughly the size of the working arrays
+        Returns:
+            Array (len(axes[0]), len(axes[1]), len(axes[2])), indexed as
+            np.meshgrid(*axes, indexing='ij').
+        """
+        coords = grid(axes, dtype)
+        shape = tuple(len(a) for a in axes)
+        if out is None:
+            out = np.empty(shape, dtype=dtype)
+        if exact:
+            for index in _slabs(shape, 0, slab_points):
+                out[index] = _evaluate(self._divergence_func, coords, index,
+                                       dtype)
+            return out
+        out[...] = 0
+        for i, func in enumerate(self._component_funcs):
+            # slabs along another axis, so each has every point along i
+            h = float(axes[i][1] - axes[i][0])
+            for index in _slabs(shape, (i + 1) % 3, slab_points):
+                derivative(_evaluate(func, coords, index, dtype), h, i,
+                           out[index])
+        return out
+
+    def curl(self, axes, out=None, exact=False, dtype=np.float32,
+             slab_points=1 << 20):
+        """
+        Curl on a grid, see divergence.
+
+        Returns:
+            Array (3, len(axes[0]), len(axes[1]), len(axes[2])).
+        """
+        coords = grid(axes, dtype)
+        shape = tuple(len(a) for a in axes)
+        if out is None:
+            out = np.empty((3,) + shape, dtype=dtype)
+        if exact:
+            for i, func in enumerate(self._curl_funcs):
+                for index in _slabs(shape, 0, slab_points):
+                    out[i][index] = _evaluate(func, coords, index, dtype)
+            return out
+        out[...] = 0
+        for i in range(3):
+            # curl_i = dF_b/da - dF_a/db, neither along i, so slabs along i
+            a, b = (i + 1) % 3, (i + 2) % 3
+            ha = float(axes[a][1] - axes[a][0])
+            hb = float(axes[b][1] - axes[b][0])
+            for index in _slabs(shape, i, slab_points):
+                derivative(_evaluate(self._component_funcs[b], coords, index,
+                                     dtype), ha, a, out[i][index])
+                derivative(_evaluate(self._component_funcs[a], coords, index,
+                                     dtype), hb, b, out[i][index], sign=-1)
+        return out
+
+    def quiver(self, ax, axes, values=None, max_arrows=1000, length=0.2,
+               cmap='viridis'):
+        """
+        Arrows of unit length along the field on a 3D axis, at no more than
+        max_arrows points of the grid whatever its resolution.
+
+        Args:
+            ax: matplotlib 3D axis
+            axes: three 1D arrays, coordinates along each axis of the grid
+            values: array of the grid's shape to colour the arrows by, e.g.
+                its divergence
+            max_arrows: int
+            length: float, length of the arrows
+            cmap: matplotlib colormap or its name
+        Returns:
+            The quiver and, if values are given, a ScalarMappable for a
+            colorbar.
+        """
+        import matplotlib.pyplot as plt
+        slices = lod_slices(tuple(len(a) for a in axes), max_arrows)
+        X, Y, Z = np.meshgrid(*(np.asarray(a)[s] for a, s in zip(axes, slices)),
+                              indexing='ij')
+        U, V, W = (np.array(F, dtype=float) for F in self(X, Y, Z))
+        magnitude = np.sqrt(U**2 + V**2 + W**2)
+        magnitude[magnitude == 0] = 1
+        quiver = ax.quiver(X, Y, Z, U/magnitude, V/magnitude, W/magnitude,
+                           length=length)
+        if values is None:
+            return quiver, None
+        values = np.asarray(values)[slices].ravel()
+        mappable = plt.cm.ScalarMappable(
+            plt.Normalize(values.min(), values.max()), cmap
+        )
+        colors = mappable.to_rgba(values)
+        # each arrow is a shaft then the two lines of its head
+        quiver.set_color(np.concatenate((colors, np.repeat(colors, 2, axis=0))))
+        return quiver, mappable
+
+
+def check(points=256, extent=2):
+    """
+    Compare the numerical divergence and curl of the PASS Week 6 field G
+    with the exact ones on a points^3 grid.
+
+    Returns:
+        Largest errors of the divergence and curl, relative to the largest
+        exact values.
+    """
+    G = VectorField((4*x**3 + y + sympy.exp(y)*sympy.cos(z),
+                     x + 2*y**2,
+                     3*z**2 - sympy.exp(y)*sympy.sin(z)))
+    axes = [np.linspace(-extent, extent, points)] * 3
+    numerical = G.divergence(axes)
+    exact = G.divergence(axes, exact=True)
+    numerical -= exact
+    div_error = np.abs(numerical).max() / np.abs(exact).max()
+    del numerical, exact
+    numerical = G.curl(axes)
+    exact = G.curl(axes, exact=True)
+    numerical -= exact
+    curl_error = np.abs(numerical).max() / np.abs(exact).max()
+    return div_error, curl_error
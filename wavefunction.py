@@ -0,0 +1,248 @@
+#!/usr/bin/python
+import argparse
+import functools
+import time
+
+import numpy as np
+from scipy import fft
+
+
+def gaussian(x, x0=0, sigma=1, p0=0, hbar=1):
+    """
+    Normalised Gaussian wave packet in position space, centred on x0 with
+    mean momentum p0, |psi|^2 has std dev sigma.
+    """
+    x = np.asarray(x, dtype=float)
+    return ((2*np.pi*sigma**2)**-0.25
+            * np.exp(-(x - x0)**2/(4*sigma**2) + 1j*p0*x/hbar))
+
+
+def gaussian_momentum(p, x0=0, sigma=1, p0=0, hbar=1):
+    """Fourier transform of gaussian, the same packet in momentum space"""
+    p = np.asarray(p, dtype=float)
+    return ((2*sigma**2/(np.pi*hbar**2))**0.25
+            * np.exp(-sigma**2*(p - p0)**2/hbar**2 - 1j*(p - p0)*x0/hbar))
+
+
+@functools.lru_cache(maxsize=32)
+def _momentum_grid(n, dx, x0, hbar):
+    """
+    Sorted momentum grid of an FFT of n points dx apart starting at x0, and
+    the phases that make the FFT the normalised continuous transform.
+
+    Multiplying the input by exp(2 pi i (n//2) j/n) shifts the output so
+    its momenta come out sorted without a copy, and multiplying the output
+    by exp(-i p x0/hbar) dx/sqrt(2 pi hbar) accounts for the grid not
+    starting at 0 and the spacing of the points.
+    """
+    j = np.arange(n)
+    p = 2*np.pi*hbar*(j - n//2)/(n*dx)
+    shift = np.exp(2j*np.pi*(n//2)*j/n)
+    phase = np.exp(-1j*p*x0/hbar)*dx/np.sqrt(2*np.pi*hbar)
+    for a in (p, shift, phase):
+        a.flags.writeable = False
+    return p, shift, phase
+
+
+@functools.lru_cache(maxsize=32)
+def _kinetic_phase(n, dx, hbar, mass, dt):
+    """exp(-i p^2 dt/(2 m hbar)) in the order an unshifted FFT gives p"""
+    p = 2*np.pi*hbar*fft.fftfreq(n, dx)
+    phase = np.exp(-1j*p**2*dt/(2*mass*hbar))
+    phase.flags.writeable = False
+    return phase
+
+
+class WaveGrid:
+    """
+    Position grid of a 1D wave function and the momentum grid of its
+    Fourier transform
+
+        phi(p) = 1/sqrt(2 pi hbar) integral psi(x) exp(-i p x/hbar) dx
+
+    done with an FFT. Every function works along the last axis, so many
+    states can be stacked into a 2D array and transformed or evolved at
+    once.
+
+    The momenta and phases are worked out once for each grid and kept, and
+    scipy.fft keeps the plan of each size, so making a WaveGrid again for
+    the same points costs nothing.
+
+        wave = WaveGrid(np.linspace(-10, 10, 1 << 14, endpoint=False))
+        phi = wave.to_momentum(gaussian(wave.x, sigma=0.5))
+    """
+
+    def __init__(self, x, hbar=1, workers=None):
+        """
+        Args:
+            x: equally spaced 1D array of positions, the domain is taken as
+                periodic with period len(x)*dx
+            hbar: float
+            workers: int, threads used by each FFT, defaults to one
+        """
+        self.x = np.asarray(x, dtype=float)
+        self.n = len(self.x)
+        self.dx = float(self.x[1] - self.x[0])
+        self.hbar = hbar
+        self.workers = workers
+        self.p, self._shift, self._phase = _momentum_grid(
+            self.n, self.dx, float(self.x[0]), hbar
+        )
+        self.dp = 2*np.pi*hbar/(self.n*self.dx)
+
+    def to_momentum(self, psi):
+        """
+        Momentum space wave function phi(p) at self.p.
+
+        Args:
+            psi: array (..., len(x)), wave functions at self.x
+        """
+        phi = fft.fft(psi*self._shift, axis=-1, overwrite_x=True,
+                      workers=self.workers)
+        phi *= self._phase
+        return phi
+
+    def to_position(self, phi):
+        """Position space wave function psi(x) at self.x, see to_momentum"""
+        psi = fft.ifft(phi/self._phase, axis=-1, overwrite_x=True,
+                       workers=self.workers)
+        psi *= self._shift.conj()
+        return psi
+
+    def norm(self, psi, momentum=False):
+        """Integral of |psi|^2, in momentum space if momentum is True"""
+        step = self.dp if momentum else self.dx
+        return np.sum(np.abs(psi)**2, axis=-1)*step
+
+    def normalise(self, psi):
+        """psi scaled so its integral of |psi|^2 is 1"""
+        return psi/np.sqrt(self.norm(psi))[..., None]
+
+    def expectation(self, psi, momentum=False):
+        """Mean position, or mean momentum if momentum is True"""
+        if momentum:
+            density = np.abs(self.to_momentum(psi))**2
+            return np.sum(density*self.p, axis=-1)/np.sum(density, axis=-1)
+        density = np.abs(psi)**2
+        return np.sum(density*self.x, axis=-1)/np.sum(density, axis=-1)
+
+    def evolve(self, psi, dt, num=1, potential=None, mass=1):
+        """
+        Evolve under H = p^2/(2 m) + V(x) for num steps of dt, with the
+        second order split operator method
+
+            psi <- exp(-i V dt/2hbar) F^-1 exp(-i p^2 dt/2m hbar) F exp(-i V dt/2hbar) psi
+
+        The half steps of V between two steps are done as one, and nothing
+        needs shifting or scaling between steps, so each step is two FFTs
+        and two multiplications.
+
+        Args:
+            psi: array (..., len(x)), wave functions at self.x
+            dt: float, time step
+            num: int, number of steps
+            potential: array of V at self.x, None for a free particle
+            mass: float
+        Returns:
+            Array of the wave functions after the steps.
+        """
+        kinetic = _kinetic_phase(self.n, self.dx, self.hbar, mass, dt)
+        psi = np.array(psi, dtype=complex)
+        if num == 0:
+            return psi
+        if potential is not None:
+            half = np.exp(-0.5j*np.asarray(potential)*dt/self.hbar)
+            full = half**2
+            psi *= half
+        for i in range(num):
+            psi = fft.fft(psi, axis=-1, overwrite_x=True, workers=self.workers)
+            psi *= kinetic
+            psi = fft.ifft(psi, axis=-1, overwrite_x=True,
+                           workers=self.workers)
+            if potential is not None:
+                psi *= full if i < num - 1 else half
+        return psi
+
+
+def check(points=1 << 14, extent=10):
+    """
+    Check the transforms and evolution against the Gaussian and cosine of
+    the PASS Week 9 examples.
+
+    Returns:
+        Dict of the name of each check and its largest error.
+    """
+    wave = WaveGrid(np.linspace(-extent, extent, points, endpoint=False))
+    x, p = wave.x, wave.p
+    errors = {}
+    # narrow Gaussian, nearly a delta function, off centre and moving
+    packets = dict(x0=1.5, sigma=0.01, p0=3)
+    psi = gaussian(x, **packets)
+    phi = wave.to_momentum(psi)
+    exact = gaussian_momentum(p, **packets)
+    errors['gaussian transform'] = np.abs(phi - exact).max()/np.abs(exact).max()
+    errors['round trip'] = np.abs(wave.to_position(phi) - psi).max()
+    errors['norm'] = abs(wave.norm(phi, momentum=True) - 1)
+    # cos(px/hbar) is half in each of the states of momentum +-p
+    momentum_p = 2*np.pi*5/(2*extent)
+    phi = wave.to_momentum(wave.normalise(np.cos(momentum_p*x)))
+    density = np.abs(phi)**2*wave.dp
+    errors['cosine transform'] = max(
+        abs(density[np.argmin(np.abs(p - side*momentum_p))] - 0.5)
+        for side in (-1, 1)
+    )
+    # a free Gaussian moves at p0/m and its width grows as
+    # sigma sqrt(1 + (hbar t/(2 m sigma^2))^2), for a batch of packets
+    sigmas = np.array([0.5, 0.7])
+    psi = gaussian(x, x0=-1, sigma=sigmas[:, None], p0=1)
+    t = 1
+    evolved = wave.evolve(psi, t/1000, 1000)
+    widths = sigmas*np.sqrt(1 + (t/(2*sigmas**2))**2)
+    exact = np.abs(gaussian(x, x0=-1 + t, sigma=widths[:, None]))**2
+    errors['free evolution'] = (np.abs(np.abs(evolved)**2 - exact).max()
+                                / exact.max())
+    # in V = x^2/2 a Gaussian of sigma^2 = 1/2 keeps its shape and swings
+    # to the other side in half a period, t = pi
+    psi = gaussian(x, x0=2, sigma=np.sqrt(0.5))
+    evolved = wave.evolve(psi, np.pi/1000, 1000, potential=0.5*x**2)
+    exact = np.abs(gaussian(x, x0=-2, sigma=np.sqrt(0.5)))**2
+    errors['harmonic evolution'] = (np.abs(np.abs(evolved)**2 - exact).max()
+                                    / exact.max())
+    return errors
+
+
+def benchmark(points=10_000, steps=2000, batch=1):
+    """
+    Time split operator steps in a harmonic potential.
+
+    Returns:
+        Steps per second.
+    """
+    wave = WaveGrid(np.linspace(-20, 20, points, endpoint=False))
+    psi = np.tile(gaussian(wave.x, x0=2), (batch, 1))
+    potential = 0.5*wave.x**2
+    wave.evolve(psi, 1e-3, 1, potential)
+    start = time.perf_counter()
+    wave.evolve(psi, 1e-3, steps, potential)
+    return steps / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Check the wave function transforms and evolution '
+                    'against exact results, and time the evolution'
+    )
+    parser.add_argument('--points', type=int, default=10_000)
+    parser.add_argument('--steps', type=int, default=2000)
+    parser.add_argument('--batch', type=int, default=1,
+                        help='number of states evolved at once')
+    args = parser.parse_args()
+
+    for name, error in check().items():
+        print(f'{name}: largest error {error:.1e}')
+    rate = benchmark(args.points, args.steps, args.batch)
+    print(f'{args.points} points x {args.batch}: {rate:.0f} steps/s')
+
+
+if __name__ == '__main__':
+    main()